@@ -0,0 +1,220 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import Results, environment_meta, setup_environment, summarize
+
+"""
+async_vs_sync.py compares data layer's sync API called by threads with
+async API (data/aio.py) called by asyncio tasks under the same concurrent load.
+It also measures 'naive' asyncio, which calls sync API in the event loop,
+and event loop's lag: how late a 1 ms timer fires while clients run.
+Usage: python benchmarks/async_vs_sync.py [--clients N] [--operations N] [--output results.json]
+"""
+
+# Share of operations: Users.get, Events upcoming page, Tickets.book
+MIX = (("user", 0.7), ("events", 0.25), ("book", 0.05))
+
+# Interval of event loop's heartbeat
+HEARTBEAT = 0.001
+
+
+def _plan(rand, operations, telegram_ids, event_ids):
+    """
+    :return: List of operations (kind, argument), the same for all modes.
+    """
+
+    kinds = [kind for kind, _ in MIX]
+    weights = [weight for _, weight in MIX]
+
+    plan = []
+    for kind in rand.choices(kinds, weights, k=operations):
+        if kind == "user":
+            plan.append((kind, rand.choice(telegram_ids)))
+        elif kind == "events":
+            plan.append((kind, None))
+        else:
+            plan.append((kind, rand.choice(event_ids)))
+    return plan
+
+
+def _reset_caches():
+    from data import users as users_module
+    from data.events import Events
+
+    users_module._users_cache.clear()
+    Events.invalidate_cache()
+
+
+def _result(plan, latencies, duration, lags=None):
+    result = {
+        "operations": len(plan),
+        "operations_per_second": len(plan) / duration,
+    }
+    for kind, _ in MIX:
+        times = [latency for (operation, _), latency in zip(plan, latencies) if operation == kind]
+        if len(times) > 0:
+            stats = summarize(times)
+            result[kind] = {key: stats[key] for key in ("runs", "median_ms", "p95_ms", "max_ms")}
+
+    if lags is not None and len(lags) > 0:
+        stats = summarize(lags)
+        result["loop_lag"] = {key: stats[key] for key in ("median_ms", "p95_ms", "max_ms")}
+
+    return result
+
+
+def run_sync(plan, clients):
+    from data.events import Events
+    from data.tickets import Tickets
+    from data.users import Users
+
+    def run(index):
+        kind, argument = plan[index]
+        started = time.perf_counter()
+        if kind == "user":
+            Users.get(argument)
+        elif kind == "events":
+            Events.get_events_page(True)
+        else:
+            Tickets.book("benchmark", argument, 1)
+        return time.perf_counter() - started
+
+    _reset_caches()
+    with ThreadPoolExecutor(clients) as executor:
+        started = time.perf_counter()
+        latencies = list(executor.map(run, range(len(plan))))
+        duration = time.perf_counter() - started
+
+    return _result(plan, latencies, duration)
+
+
+async def _heartbeat(lags, stopped):
+    loop = asyncio.get_running_loop()
+    while not stopped.is_set():
+        started = loop.time()
+        await asyncio.sleep(HEARTBEAT)
+        lags.append(max(loop.time() - started - HEARTBEAT, 0.0))
+
+
+async def _run_async(plan, clients, blocking):
+    from data.events import Events
+    from data.tickets import Tickets
+    from data.users import Users
+
+    latencies = [0.0] * len(plan)
+    indexes = iter(range(len(plan)))
+
+    async def client():
+        for index in indexes:
+            kind, argument = plan[index]
+            started = time.perf_counter()
+            if blocking:
+                # Sync API in the event loop, as handlers would do without data/aio.py
+                if kind == "user":
+                    Users.get(argument)
+                elif kind == "events":
+                    Events.get_events_page(True)
+                else:
+                    Tickets.book("benchmark", argument, 1)
+                # Gives other tasks a chance to run between operations
+                await asyncio.sleep(0)
+            else:
+                if kind == "user":
+                    await Users.aget(argument)
+                elif kind == "events":
+                    await Events.alist_upcoming()
+                else:
+                    await Tickets.abook("benchmark", argument, 1)
+            latencies[index] = time.perf_counter() - started
+
+    lags = []
+    stopped = asyncio.Event()
+    heartbeat = asyncio.ensure_future(_heartbeat(lags, stopped))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    duration = time.perf_counter() - started
+
+    stopped.set()
+    await heartbeat
+
+    return _result(plan, latencies, duration, lags)
+
+
+def run_async(plan, clients, readers, blocking):
+    from data import aio
+
+    _reset_caches()
+    aio.executor.start(readers)
+    try:
+        return asyncio.run(_run_async(plan, clients, blocking))
+    finally:
+        aio.executor.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync vs async data layer benchmark.")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--tickets", type=int, default=100000)
+    parser.add_argument("--clients", type=int, default=32, help="concurrent threads or tasks")
+    parser.add_argument("--operations", type=int, default=5000, help="operations of every mode")
+    parser.add_argument("--readers", type=int, default=4, help="reader threads of async API")
+    parser.add_argument("--db", help="path to DataBase, generated if it does not exist")
+    parser.add_argument("--output", help="path to JSON file with results")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    db_path = args.db
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="events_bot_benchmark_"), "benchmark.db")
+
+    setup_environment(db_path)
+    rand = random.Random(args.seed)
+    results = Results()
+
+    if not os.path.exists(db_path):
+        import dataset
+
+        print(f"Generating DataBase {db_path}...", flush=True)
+        dataset.generate(db_path, args.users, args.events, args.tickets, args.seed)
+
+    import data
+    from data.connection import pool
+
+    data.init_db(db_path)
+
+    with pool.connection() as connection:
+        telegram_ids = [row[0] for row in connection.execute("SELECT telegramId FROM users")]
+        # Unlimited events, so every booking writes a ticket
+        event_ids = [
+            row[0] for row in connection.execute(
+                "SELECT id FROM events WHERE maxMembers = 0 AND datetime > :now", {"now": time.time()}
+            )
+        ]
+
+    plan = _plan(rand, args.operations, telegram_ids, event_ids)
+
+    results.add(f"sync API, {args.clients} threads", run_sync(plan, args.clients))
+    results.add(
+        f"sync API in event loop, {args.clients} tasks", run_async(plan, args.clients, args.readers, True)
+    )
+    results.add(
+        f"async API, {args.clients} tasks, {args.readers} readers", run_async(plan, args.clients, args.readers, False)
+    )
+
+    results.dump(args.output, environment_meta(
+        users=args.users, events=args.events, tickets=args.tickets,
+        clients=args.clients, operations=args.operations, readers=args.readers
+    ))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
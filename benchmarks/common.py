@@ -0,0 +1,100 @@
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+
+"""
+common.py contains helpers shared by benchmarks.
+Benchmarks import bot's modules the same way main.py does,
+so environment must be set up before the first import from events_bot.
+"""
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EVENTS_BOT_DIR = os.path.join(ROOT_DIR, "events_bot")
+
+
+def setup_environment(db_path):
+    os.environ["EVENTS_BOT_DB"] = db_path
+    os.environ.setdefault("EVENTS_BOT_TOKEN", "0:benchmark")
+
+    if EVENTS_BOT_DIR not in sys.path:
+        sys.path.insert(0, EVENTS_BOT_DIR)
+
+
+def summarize(times):
+    """
+    :param times: List of durations in seconds.
+    :return: Dict with statistics in milliseconds.
+    """
+
+    times = sorted(times)
+    return {
+        "runs": len(times),
+        "mean_ms": statistics.mean(times) * 1000,
+        "median_ms": statistics.median(times) * 1000,
+        "p95_ms": times[min(len(times) - 1, int(len(times) * 0.95))] * 1000,
+        "min_ms": times[0] * 1000,
+        "max_ms": times[-1] * 1000,
+    }
+
+
+class Results:
+
+    def __init__(self):
+        self.results = {}
+
+    def add(self, name, result):
+        self.results[name] = result
+        print(f"{name}: {json.dumps(result)}", flush=True)
+
+    def measure(self, name, func, repeat, setup=None):
+        """
+        Calls func repeat times and stores its timings.
+        :param setup: Not timed function called before every run,
+            its result is passed to func as positional arguments.
+        """
+
+        times = []
+        for _ in range(repeat):
+            args = () if setup is None else setup()
+            started = time.perf_counter()
+            func(*args)
+            times.append(time.perf_counter() - started)
+
+        self.add(name, summarize(times))
+
+    def dump(self, path, meta):
+        output = {
+            "meta": meta,
+            "results": self.results,
+        }
+
+        if path is None:
+            return
+
+        with open(path, "w") as file:
+            json.dump(output, file, indent=2)
+        print(f"Results saved to {path}")
+
+
+def environment_meta(**kwargs):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = ""
+
+    meta = {
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    meta.update(kwargs)
+    return meta
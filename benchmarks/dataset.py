@@ -0,0 +1,77 @@
+import random
+import sqlite3
+import time
+import uuid
+
+"""
+dataset.py generates synthetic DataBase for benchmarks.
+"""
+
+
+def generate(path, users_count, events_count, tickets_count, seed=0):
+    """
+    Creates DataBase with data.init_db and fills it with random data.
+    User with telegram id 1 is admin, every 10th event has no members limit.
+    """
+
+    import data
+    import data.users as users
+    import data.events as events
+    import data.tickets as tickets
+    from data.basic import DB_ID
+
+    data.init_db(path)
+
+    rand = random.Random(seed)
+    now = time.time()
+
+    user_ids = [str(uuid.UUID(int=rand.getrandbits(128), version=4)) for _ in range(users_count)]
+    event_ids = [str(uuid.UUID(int=rand.getrandbits(128), version=4)) for _ in range(events_count)]
+
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.execute("BEGIN")
+
+    connection.executemany(
+        f"INSERT INTO {users.DB_TABLE} "
+        f"({DB_ID}, {users.DB_TELEGRAM_ID}, {users.DB_PERMISSIONS_LEVEL}, {users.DB_ACTION}, {users.DB_ACTION_DATA}) "
+        f"VALUES (?, ?, ?, '', '')",
+        (
+            (user_id, number + 1, users.PermissionsLevels.ADMIN if number == 0 else users.PermissionsLevels.USER)
+            for number, user_id in enumerate(user_ids)
+        )
+    )
+
+    connection.executemany(
+        f"INSERT INTO {events.DB_TABLE} "
+        f"({DB_ID}, {events.DB_NAME}, {events.DB_DATETIME}, {events.DB_LOCATION}, "
+        f"{events.DB_MAX_MEMBERS}, {events.DB_DESCRIPTION}) "
+        f"VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (
+                event_id,
+                f"Мероприятие {number}",
+                int(now + rand.uniform(-180, 180) * 24 * 60 * 60),
+                f"Площадка {number % 20}",
+                0 if number % 10 == 0 else rand.randint(100, 2000),
+                "Описание мероприятия " * 10,
+            )
+            for number, event_id in enumerate(event_ids)
+        )
+    )
+
+    connection.executemany(
+        f"INSERT INTO {tickets.DB_TABLE} ({DB_ID}, {tickets.DB_USER}, {tickets.DB_EVENT}, {tickets.DB_MEMBERS}) "
+        f"VALUES (?, ?, ?, ?)",
+        (
+            (
+                str(uuid.UUID(int=rand.getrandbits(128), version=4)),
+                rand.choice(user_ids),
+                rand.choice(event_ids),
+                rand.randint(1, 3),
+            )
+            for _ in range(tickets_count)
+        )
+    )
+
+    connection.execute("COMMIT")
+    connection.close()
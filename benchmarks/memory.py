@@ -0,0 +1,138 @@
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from common import Results, environment_meta, setup_environment
+
+"""
+memory.py measures memory used by data objects and cached list rows.
+Every model is compared with dict-backed object holding the same values,
+which is how models were stored before they got __slots__.
+Usage: python benchmarks/memory.py [--count N] [--output results.json]
+"""
+
+
+class _DictBacked:
+    pass
+
+
+def _slots(obj):
+    for cls in type(obj).__mro__:
+        yield from getattr(cls, "__slots__", ())
+
+
+def _slotted(obj):
+    """
+    Copy of data object sharing its attributes' values.
+    """
+
+    copy = type(obj).__new__(type(obj))
+    for name in _slots(obj):
+        setattr(copy, name, getattr(obj, name))
+    return copy
+
+
+def _dict_backed(obj):
+    """
+    Copy of data object with its attributes in instance __dict__.
+    """
+
+    copy = _DictBacked()
+    for name in _slots(obj):
+        setattr(copy, name, getattr(obj, name))
+    copy._dirty = set()
+    return copy
+
+
+def _measure(make, sources):
+    """
+    :return: Bytes allocated per object by make(source).
+    """
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [make(source) for source in sources]
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    del objects
+    return allocated / len(sources)
+
+
+def benchmark_models(results):
+    from data.connection import pool
+    from data.events import Event
+    from data.tickets import Ticket
+    from data.users import User
+
+    for name, model, table in (("User", User, "users"), ("Event", Event, "events"), ("Ticket", Ticket, "tickets")):
+        with pool.connection() as connection:
+            rows = connection.execute(f"SELECT * FROM {table}").fetchall()
+
+        # Copies share values, so only objects themselves are measured
+        objects = [model(row) for row in rows]
+        slotted = _measure(_slotted, objects)
+        dict_backed = _measure(_dict_backed, objects)
+
+        results.add(f"{name} bytes per object", {
+            "objects": len(objects),
+            "slots": slotted,
+            "dict": dict_backed,
+            "reduction": 1 - slotted / dict_backed,
+        })
+
+
+def benchmark_rows(results):
+    from data.connection import namedtuple_row
+    from data.events import Events
+
+    rows = Events._load_events_print_info()
+    dicts = [row._asdict() for row in rows]
+
+    namedtuples = _measure(lambda row: namedtuple_row(_Description(row), tuple(row)), rows)
+    dict_rows = _measure(dict, dicts)
+
+    results.add("Events list bytes per row", {
+        "rows": len(rows),
+        "namedtuple": namedtuples,
+        "dict": dict_rows,
+        "reduction": 1 - namedtuples / dict_rows,
+    })
+
+
+class _Description:
+
+    def __init__(self, row):
+        """
+        Imitates cursor for row factory.
+        """
+        self.description = tuple((field,) for field in row._fields)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Events bot memory benchmark.")
+    parser.add_argument("--count", type=int, default=50000, help="count of users, events and tickets")
+    parser.add_argument("--output", help="path to JSON file with results")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="events_bot_memory_"), "memory.db")
+    setup_environment(db_path)
+
+    import dataset
+    dataset.generate(db_path, args.count, args.count, args.count, args.seed)
+
+    results = Results()
+    benchmark_models(results)
+    benchmark_rows(results)
+
+    results.dump(args.output, environment_meta(count=args.count))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from common import Results, environment_meta, setup_environment
+
+"""
+run.py measures data layer calls and bot's handlers on synthetic DataBase.
+Works offline: Telegram API calls are answered by telegram.OfflineTelegram.
+Usage: python benchmarks/run.py [--users N] [--events N] [--tickets N] [--output results.json]
+"""
+
+
+def benchmark_data_layer(results, repeat, rand):
+    from data import users as users_module
+    from data.connection import pool
+    from data.events import Events
+    from data.tickets import Tickets
+    from data.users import Users
+
+    with pool.connection() as connection:
+        telegram_ids = [row[0] for row in connection.execute("SELECT telegramId FROM users")]
+        user_ids = [row[0] for row in connection.execute("SELECT id FROM users")]
+        event_ids = [row[0] for row in connection.execute("SELECT id FROM events")]
+
+    def clear_users_cache():
+        users_module._users_cache.clear()
+        return rand.choice(telegram_ids),
+
+    results.measure("Users.get (uncached)", Users.get, repeat, clear_users_cache)
+    results.measure("Users.get (cached)", Users.get, repeat, lambda: (rand.choice(telegram_ids[:100]),))
+
+    def invalidate_events():
+        Events.invalidate_cache()
+        return True,
+
+    results.measure("Events.get_events_print_info(True) (uncached)", Events.get_events_print_info, repeat,
+                    invalidate_events)
+    results.measure("Events.get_events_print_info(True) (cached)", Events.get_events_print_info, repeat,
+                    lambda: (True,))
+    results.measure("Events.get_events_print_info(False) (cached)", Events.get_events_print_info, repeat,
+                    lambda: (False,))
+
+    results.measure("Tickets.get_user_tickets_for_print", Tickets.get_user_tickets_for_print, repeat,
+                    lambda: (rand.choice(user_ids),))
+
+    results.measure("Event.available_places", lambda event: event.available_places, repeat,
+                    lambda: (Events.get(rand.choice(event_ids)),))
+
+
+def benchmark_booking_burst(results, threads_count, bookings_per_thread):
+    from datetime import datetime, timedelta
+    from data.events import Event, Events
+    from data.tickets import Tickets, BookingStatus
+
+    places = threads_count * bookings_per_thread // 2
+
+    event = Event()
+    event.name = "Booking burst"
+    event.datetime = datetime.now() + timedelta(days=1)
+    event.max_members = places
+    event.write()
+
+    statuses = []
+    lock = threading.Lock()
+
+    def book():
+        for _ in range(bookings_per_thread):
+            status = Tickets.book("benchmark", event.id, 1).status
+            with lock:
+                statuses.append(status)
+
+    threads = [threading.Thread(target=book) for _ in range(threads_count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    booked = statuses.count(BookingStatus.BOOKED)
+    results.add("Tickets.book burst", {
+        "threads": threads_count,
+        "bookings": len(statuses),
+        "places": places,
+        "booked": booked,
+        "oversold": max(booked - places, 0),
+        "consistent": len(Events.check_booked_members()) == 0,
+        "bookings_per_second": len(statuses) / duration,
+    })
+
+
+def benchmark_handlers(results, repeat, rand):
+    import callbacks
+    import main
+    import telegram
+    from data.connection import pool
+    from data.events import Events
+    from data.tickets import Tickets
+    from data.users import Users, ActionTypes
+
+    offline = telegram.OfflineTelegram()
+    offline.install()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with pool.connection() as connection:
+        telegram_ids = [row[0] for row in connection.execute("SELECT telegramId FROM users")]
+        unlimited_event_ids = [
+            row[0] for row in connection.execute(
+                "SELECT id FROM events WHERE maxMembers = 0 AND datetime > :now", {"now": time.time()}
+            )
+        ]
+
+    def process(update):
+        main.bot.process_update(update)
+
+    def command(text):
+        return lambda: (telegram.message_update(rand.choice(telegram_ids), text),)
+
+    results.measure("handler /start", process, repeat, command("/start"))
+    results.measure("handler /events", process, repeat, command("/events"))
+    results.measure("handler /tickets", process, repeat, command("/tickets"))
+    results.measure("handler /allevents", process, repeat, lambda: (telegram.message_update(1, "/allevents"),))
+
+    def select_event():
+        telegram_id = rand.choice(telegram_ids)
+        process(telegram.message_update(telegram_id, "/events"))
+        event = rand.choice(Events.get_events_print_info(True))
+        data = callbacks.encode(callbacks.Callback(callbacks.CallbackActions.SELECT_EVENT, event.id))
+        return telegram.callback_update(telegram_id, data),
+
+    results.measure("handler select event", process, repeat, select_event)
+
+    def enter_members():
+        user = Users.get(rand.choice(telegram_ids))
+        user.action = ActionTypes.ENTER_TICKET_MEMBERS
+        user.action_data = rand.choice(unlimited_event_ids)
+        user.write()
+        return telegram.message_update(user.telegram_id, "1"),
+
+    results.measure("handler book ticket", process, repeat, enter_members)
+
+    user = Users.get(rand.choice(telegram_ids))
+    tickets = [Tickets.get(ticket.id) for ticket in Tickets.get_user_tickets_for_print(user.id)]
+    if len(tickets) > 0:
+        results.measure("send_qrcode (cached)", main.send_qrcode, repeat,
+                        lambda: (user.telegram_id, user, tickets[0]))
+
+    with pool.connection() as connection:
+        ticket_ids = [row[0] for row in connection.execute(
+            "SELECT id FROM tickets ORDER BY random() LIMIT :limit", {"limit": repeat}
+        )]
+
+    results.measure("send_qrcode (first view)", main.send_qrcode, len(ticket_ids),
+                    lambda: (user.telegram_id, user, Tickets.get(ticket_ids.pop())))
+
+    results.add("telegram calls", dict(offline.calls))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Events bot benchmarks.")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--tickets", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=200, help="runs of every measured call")
+    parser.add_argument("--db", help="path to DataBase, generated if it does not exist")
+    parser.add_argument("--output", help="path to JSON file with results")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    db_path = args.db
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="events_bot_benchmark_"), "benchmark.db")
+
+    setup_environment(db_path)
+    rand = random.Random(args.seed)
+    results = Results()
+
+    if not os.path.exists(db_path):
+        import dataset
+
+        print(f"Generating DataBase {db_path}...", flush=True)
+        started = time.perf_counter()
+        dataset.generate(db_path, args.users, args.events, args.tickets, args.seed)
+        results.add("generate DataBase", {"seconds": time.perf_counter() - started})
+
+    import data
+    data.init_db(db_path)
+
+    benchmark_data_layer(results, args.repeat, rand)
+    benchmark_booking_burst(results, 16, 50)
+    benchmark_handlers(results, args.repeat, rand)
+
+    results.dump(args.output, environment_meta(
+        users=args.users, events=args.events, tickets=args.tickets, repeat=args.repeat
+    ))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
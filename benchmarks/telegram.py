@@ -0,0 +1,85 @@
+import itertools
+from collections import Counter
+
+import telebot
+
+"""
+telegram.py lets benchmarks call bot's handlers without Telegram.
+OfflineTelegram replaces the function every TeleBot API method sends
+requests with and answers them locally.
+"""
+
+_MESSAGE_METHODS = {"sendMessage", "sendPhoto", "sendDocument", "editMessageText"}
+
+
+class OfflineTelegram:
+
+    def __init__(self):
+        self.calls = Counter()
+        self._ids = itertools.count(1)
+
+    def install(self):
+        telebot.apihelper._make_request = self
+
+    def __call__(self, token, method_name, method='get', params=None, files=None):
+        self.calls[method_name] += 1
+
+        if method_name not in _MESSAGE_METHODS:
+            return True
+
+        chat_id = int((params or {}).get("chat_id", 1))
+        message_id = next(self._ids)
+        result = {
+            "message_id": message_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "text": (params or {}).get("text", ""),
+        }
+        if method_name == "sendPhoto":
+            result["photo"] = [{
+                "file_id": f"photo-{message_id}", "file_unique_id": f"photo-{message_id}", "width": 1, "height": 1,
+            }]
+        if method_name == "sendDocument":
+            result["document"] = {"file_id": f"document-{message_id}", "file_unique_id": f"document-{message_id}"}
+        return result
+
+
+_update_ids = itertools.count(1)
+
+
+def _user(telegram_id):
+    return {"id": telegram_id, "is_bot": False, "first_name": "Benchmark"}
+
+
+def message_update(telegram_id, text):
+    update_id = next(_update_ids)
+    return telebot.types.Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": telegram_id, "type": "private"},
+            "from": _user(telegram_id),
+            "text": text,
+        },
+    })
+
+
+def callback_update(telegram_id, data):
+    update_id = next(_update_ids)
+    return telebot.types.Update.de_json({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(telegram_id),
+            "chat_instance": "benchmark",
+            "data": data,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": telegram_id, "type": "private"},
+                "from": _user(telegram_id),
+                "text": "",
+            },
+        },
+    })
@@ -0,0 +1,124 @@
+import logging
+import threading
+from concurrent.futures import wait
+
+import messages
+from data.broadcasts import Broadcast, Broadcasts
+from data.users import Users
+from outbox import Lanes
+
+"""
+broadcast.py sends admins' messages to all users through outbox's bulk lane.
+Progress is saved after every batch of users, so broadcast interrupted
+by bot's restart continues from the last saved batch.
+"""
+
+# Count of users whose messages are queued before progress is saved
+BATCH_SIZE = 100
+
+
+class Broadcaster:
+
+    def __init__(self, outbox, batch_size=BATCH_SIZE):
+        self._outbox = outbox
+        self._batch_size = batch_size
+
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        """
+        Starts thread which sends not finished broadcasts one by one.
+        """
+
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="Broadcaster", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Saves progress of current batch and stops thread.
+        """
+
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def add(self, text, author):
+        """
+        Saves new broadcast, it is sent after previously added ones.
+        :param author: Telegram id of admin who receives report when broadcast is finished.
+        :return: Broadcast.
+        """
+
+        broadcast = Broadcast()
+        broadcast.text = text
+        broadcast.author = author
+        broadcast.write()
+
+        with self._condition:
+            self._condition.notify()
+
+        return broadcast
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+
+            try:
+                broadcasts = Broadcasts.get_unfinished()
+            except Exception as err:
+                logging.error(f"Failed to load broadcasts: {err}")
+                broadcasts = []
+
+            if len(broadcasts) == 0:
+                with self._condition:
+                    if not self._stopped:
+                        self._condition.wait()
+                continue
+
+            for broadcast in broadcasts:
+                try:
+                    self._send(broadcast)
+                except Exception as err:
+                    logging.error(f"Broadcast {broadcast.id} failed: {err}")
+                    with self._condition:
+                        # Retried later, progress of sent batches is saved
+                        self._condition.wait(60)
+
+    def _send(self, broadcast):
+        logging.info(f"Sending broadcast {broadcast.id} after user '{broadcast.cursor}'...")
+
+        while not self._stopped:
+            recipients = Users.get_recipients(broadcast.cursor, self._batch_size)
+
+            if len(recipients) == 0:
+                broadcast.finished = True
+                broadcast.write()
+                logging.info(f"Broadcast {broadcast.id} is finished: sent {broadcast.sent}, failed {broadcast.failed}.")
+
+                self._outbox.submit(
+                    broadcast.author, "send_message", broadcast.author, messages.broadcast_finished(broadcast)
+                )
+                return
+
+            futures = [
+                self._outbox.submit(
+                    recipient.telegram_id, "send_message", recipient.telegram_id, broadcast.text, lane=Lanes.BULK
+                )
+                for recipient in recipients
+            ]
+            wait(futures)
+
+            failed = sum(1 for future in futures if future.exception() is not None)
+            broadcast.sent += len(futures) - failed
+            broadcast.failed += failed
+            broadcast.cursor = recipients[-1].id
+            broadcast.write()
@@ -0,0 +1,139 @@
+import base64
+import hashlib
+import hmac
+import struct
+import uuid
+
+import envars
+
+"""
+callbacks.py encodes inline keyboard buttons' callback data.
+Callback data describes itself: it contains format version, action
+and object's id packed into bytes and encoded with urlsafe base64,
+so handling a button does not need user's saved action.
+If EVENTS_BOT_CALLBACK_SECRET is set, data is followed by truncated HMAC tag.
+Encoded data always fits into Telegram's 64 bytes limit.
+"""
+
+VERSION = 1
+TAG_SIZE = 6
+
+_HEADER = struct.Struct(">BB")
+_PAGE = struct.Struct(">Bd16s")
+
+_AVAILABLE_ONLY = 1
+_BACKWARD = 2
+_INCLUDE_ARCHIVE = 4
+
+
+class CallbackActions:
+    """
+    Enumeration of buttons' actions.
+    """
+
+    # Show event's information, id - event
+    SELECT_EVENT = 1
+    # Sign up for event, id - event
+    SIGNUP = 2
+    # Edit event, id - event
+    EDIT = 3
+    # Show ticket's QR-code, id - ticket
+    SELECT_TICKET = 4
+    # Show other page of events list, id - event next to page
+    EVENTS_PAGE = 5
+    # Send ZIP with QR-codes of all event's tickets, id - event
+    QR_PACK = 6
+
+
+class Callback:
+
+    def __init__(self, action, id, available_only=False, backward=False, cursor_datetime=0.0, include_archive=False):
+        """
+        Decoded callback data.
+        :param action: CallbackActions value.
+        :param id: Id of object the action is applied to.
+        :param available_only: EVENTS_PAGE only, list of available events.
+        :param backward: EVENTS_PAGE only, page ends before cursor.
+        :param cursor_datetime: EVENTS_PAGE only, datetime of event next to page.
+        :param include_archive: EVENTS_PAGE only, list includes archived events.
+        """
+
+        self.action = action
+        self.id = id
+        self.available_only = available_only
+        self.backward = backward
+        self.cursor_datetime = cursor_datetime
+        self.include_archive = include_archive
+
+    @property
+    def cursor(self):
+        return self.cursor_datetime, self.id
+
+
+def _tag(body):
+    if envars.callback_secret == "":
+        return b""
+    return hmac.new(envars.callback_secret.encode(), body, hashlib.sha256).digest()[:TAG_SIZE]
+
+
+def encode(callback):
+    """
+    :return: Callback data string.
+    """
+
+    body = _HEADER.pack(VERSION, callback.action)
+    object_id = uuid.UUID(callback.id).bytes
+
+    if callback.action == CallbackActions.EVENTS_PAGE:
+        flags = 0
+        if callback.available_only:
+            flags |= _AVAILABLE_ONLY
+        if callback.backward:
+            flags |= _BACKWARD
+        if callback.include_archive:
+            flags |= _INCLUDE_ARCHIVE
+        body += _PAGE.pack(flags, callback.cursor_datetime, object_id)
+    else:
+        body += object_id
+
+    return base64.urlsafe_b64encode(body + _tag(body)).decode()
+
+
+def decode(data):
+    """
+    :return: Callback.
+    :raises ValueError: If data is malformed, has unknown version or wrong tag.
+    """
+
+    try:
+        raw = base64.urlsafe_b64decode(data.encode())
+    except Exception as err:
+        raise ValueError(f"Callback data is not base64: {err}")
+
+    tag_size = len(_tag(b""))
+    body, tag = raw[:len(raw) - tag_size], raw[len(raw) - tag_size:]
+    if len(body) < _HEADER.size or not hmac.compare_digest(tag, _tag(body)):
+        raise ValueError("Callback data is not signed.")
+
+    version, action = _HEADER.unpack_from(body)
+    if version != VERSION:
+        raise ValueError(f"Unsupported callback data version {version}.")
+
+    payload = body[_HEADER.size:]
+
+    if action == CallbackActions.EVENTS_PAGE:
+        if len(payload) != _PAGE.size:
+            raise ValueError("Incorrect events page callback data.")
+        flags, cursor_datetime, object_id = _PAGE.unpack(payload)
+        return Callback(
+            action,
+            str(uuid.UUID(bytes=object_id)),
+            available_only=bool(flags & _AVAILABLE_ONLY),
+            backward=bool(flags & _BACKWARD),
+            cursor_datetime=cursor_datetime,
+            include_archive=bool(flags & _INCLUDE_ARCHIVE)
+        )
+
+    if len(payload) != 16:
+        raise ValueError("Incorrect callback data.")
+    return Callback(action, str(uuid.UUID(bytes=payload)))
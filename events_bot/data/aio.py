@@ -0,0 +1,106 @@
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+aio.py runs data layer's synchronous calls for asyncio code.
+Reads are run by a pool of reader threads in parallel (WAL allows it),
+writes are run one by one by a single writer thread, so async handlers
+do not compete with each other for SQLite's write lock, and the event loop
+is never blocked by DataBase.
+Every thread has its own pool's connection. Sync and async APIs can be
+used together, async methods of Users, Events and Tickets use this module.
+"""
+
+# Count of threads running reads
+READERS = 4
+
+
+class DataBaseExecutor:
+
+    def __init__(self, readers=READERS):
+        self._readers_count = readers
+        self._lock = threading.Lock()
+        self._readers = None
+        self._writer = None
+
+        self._reads = 0
+        self._writes = 0
+
+    def start(self, readers=None):
+        """
+        Starts threads, it is also started by the first call.
+        """
+
+        with self._lock:
+            if self._writer is not None:
+                return
+
+            if readers is not None:
+                self._readers_count = readers
+            self._readers = ThreadPoolExecutor(self._readers_count, thread_name_prefix="DataBaseReader")
+            self._writer = ThreadPoolExecutor(1, thread_name_prefix="DataBaseWriter")
+
+    def stop(self):
+        """
+        Waits for submitted calls and stops threads.
+        """
+
+        with self._lock:
+            readers, writer = self._readers, self._writer
+            self._readers = self._writer = None
+
+        if writer is not None:
+            writer.shutdown(wait=True)
+            readers.shutdown(wait=True)
+            logging.debug(f"DataBase executor stopped: {self.stats()}")
+
+    def _executor(self, write):
+        if self._writer is None:
+            self.start()
+
+        with self._lock:
+            if write:
+                self._writes += 1
+                return self._writer
+            self._reads += 1
+            return self._readers
+
+    async def read(self, func, *args, **kwargs):
+        """
+        Runs func(*args, **kwargs) in reader thread.
+        """
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor(False), functools.partial(func, *args, **kwargs)
+        )
+
+    async def write(self, func, *args, **kwargs):
+        """
+        Runs func(*args, **kwargs) in writer thread after previously submitted writes.
+        """
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor(True), functools.partial(func, *args, **kwargs)
+        )
+
+    def stats(self):
+        with self._lock:
+            return {
+                "readers": self._readers_count,
+                "reads": self._reads,
+                "writes": self._writes,
+            }
+
+
+executor = DataBaseExecutor()
+
+
+async def read(func, *args, **kwargs):
+    return await executor.read(func, *args, **kwargs)
+
+
+async def write(func, *args, **kwargs):
+    return await executor.write(func, *args, **kwargs)
@@ -0,0 +1,260 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from data.basic import DB_ID
+from data.connection import pool
+import data.events as events
+import data.tickets as tickets
+
+"""
+archive.py moves past events and their tickets to archive DataBase,
+so bot's tables contain only the active season.
+Archive is a separate SQLite file attached to every connection of the pool,
+it has the same 'events' and 'tickets' tables as the main DataBase.
+"""
+
+SCHEMA = "archive"
+
+# Count of events moved in one transaction
+BATCH_SIZE = 100
+# Max count of free pages returned to file system by one incremental vacuum
+VACUUM_PAGES = 10000
+# Seconds between runs of Archiver
+ARCHIVE_INTERVAL = 24 * 60 * 60
+
+_EVENTS_COLUMNS = (
+    DB_ID, events.DB_NAME, events.DB_DATETIME, events.DB_LOCATION, events.DB_MAX_MEMBERS,
+    events.DB_DESCRIPTION, events.DB_BOOKED_MEMBERS, events.DB_REMINDED,
+)
+_TICKETS_COLUMNS = (DB_ID, tickets.DB_USER, tickets.DB_EVENT, tickets.DB_MEMBERS, tickets.DB_CHECKED_IN)
+
+_path = None
+
+
+def _attach(connection):
+    connection.execute(f"ATTACH DATABASE :path AS {SCHEMA}", {"path": _path})
+    connection.execute(f"PRAGMA {SCHEMA}.synchronous = NORMAL")
+
+
+def _create_tables(connection):
+    # Must be set before the first table is created
+    connection.execute(f"PRAGMA {SCHEMA}.auto_vacuum = INCREMENTAL")
+    connection.execute(f"PRAGMA {SCHEMA}.journal_mode = WAL")
+
+    connection.execute(
+        f"CREATE TABLE IF NOT EXISTS {SCHEMA}.{events.DB_TABLE} ("
+        f"{DB_ID} TEXT NOT NULL,"
+        f"{events.DB_NAME} TEXT NOT NULL,"
+        f"{events.DB_DATETIME} INTEGER NOT NULL,"
+        f"{events.DB_LOCATION} TEXT NOT NULL,"
+        f"{events.DB_MAX_MEMBERS} INTEGER NOT NULL,"
+        f"{events.DB_DESCRIPTION} TEXT NOT NULL,"
+        f"{events.DB_BOOKED_MEMBERS} INTEGER NOT NULL,"
+        f"{events.DB_REMINDED} INTEGER NOT NULL,"
+        f"PRIMARY KEY({DB_ID})"
+        f") WITHOUT ROWID"
+    )
+    connection.execute(
+        f"CREATE TABLE IF NOT EXISTS {SCHEMA}.{tickets.DB_TABLE} ("
+        f"{DB_ID} TEXT NOT NULL,"
+        f"{tickets.DB_USER} TEXT NOT NULL,"
+        f"{tickets.DB_EVENT} TEXT NOT NULL,"
+        f"{tickets.DB_MEMBERS} INTEGER NOT NULL,"
+        f"{tickets.DB_CHECKED_IN} REAL,"
+        f"PRIMARY KEY({DB_ID})"
+        f") WITHOUT ROWID"
+    )
+    connection.execute(
+        f"CREATE INDEX IF NOT EXISTS {SCHEMA}.{events.DB_TABLE}_{events.DB_DATETIME} "
+        f"ON {events.DB_TABLE} ({events.DB_DATETIME})"
+    )
+    connection.execute(
+        f"CREATE INDEX IF NOT EXISTS {SCHEMA}.{tickets.DB_TABLE}_{tickets.DB_EVENT} "
+        f"ON {tickets.DB_TABLE} ({tickets.DB_EVENT})"
+    )
+
+
+def enable(path):
+    """
+    Creates archive DataBase if it does not exist and attaches it to pool's connections.
+    Should be called before pool's connections are opened.
+    """
+
+    global _path
+
+    if _path is not None:
+        return
+    _path = path
+
+    connection = sqlite3.connect(":memory:", isolation_level=None)
+    try:
+        _attach(connection)
+        _create_tables(connection)
+    finally:
+        connection.close()
+
+    pool.on_connect(_attach)
+
+
+def is_enabled():
+    return _path is not None
+
+
+def _move_batch(horizon, batch_size):
+    """
+    Moves the oldest events which finished before horizon in one transaction.
+    :return: Tuple (count of moved events, count of moved tickets).
+    """
+
+    events_columns = ", ".join(_EVENTS_COLUMNS)
+    tickets_columns = ", ".join(_TICKETS_COLUMNS)
+
+    with pool.transaction(immediate=True) as connection:
+        connection.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS archived_events ({DB_ID} TEXT PRIMARY KEY)"
+        )
+        connection.execute("DELETE FROM temp.archived_events")
+        connection.execute(
+            f"INSERT INTO temp.archived_events "
+            f"SELECT {DB_ID} FROM main.{events.DB_TABLE} WHERE {events.DB_DATETIME} < :horizon "
+            f"ORDER BY {events.DB_DATETIME} LIMIT :limit",
+            {"horizon": int(horizon.timestamp()), "limit": batch_size}
+        )
+
+        # Archive and main files are committed separately, so events copied
+        # before crash are replaced by the next run instead of failing it
+        connection.execute(
+            f"INSERT OR REPLACE INTO {SCHEMA}.{tickets.DB_TABLE} ({tickets_columns}) "
+            f"SELECT {tickets_columns} FROM main.{tickets.DB_TABLE} "
+            f"WHERE {tickets.DB_EVENT} IN (SELECT {DB_ID} FROM temp.archived_events)"
+        )
+        connection.execute(
+            f"INSERT OR REPLACE INTO {SCHEMA}.{events.DB_TABLE} ({events_columns}) "
+            f"SELECT {events_columns} FROM main.{events.DB_TABLE} "
+            f"WHERE {DB_ID} IN (SELECT {DB_ID} FROM temp.archived_events)"
+        )
+
+        cursor = connection.execute(
+            f"DELETE FROM main.{tickets.DB_TABLE} "
+            f"WHERE {tickets.DB_EVENT} IN (SELECT {DB_ID} FROM temp.archived_events)"
+        )
+        moved_tickets = cursor.rowcount
+        cursor = connection.execute(
+            f"DELETE FROM main.{events.DB_TABLE} "
+            f"WHERE {DB_ID} IN (SELECT {DB_ID} FROM temp.archived_events)"
+        )
+        moved_events = cursor.rowcount
+
+    return moved_events, moved_tickets
+
+
+def archive(horizon, batch_size=BATCH_SIZE):
+    """
+    Moves events which started before horizon and their tickets to archive.
+    Every batch of events is moved in its own short transaction,
+    so bot's writes are not blocked until all events are moved.
+    :param horizon: Datetime, events before it are archived.
+    :return: Tuple (count of moved events, count of moved tickets).
+    """
+
+    if _path is None:
+        raise RuntimeError("Archive DataBase is not enabled.")
+
+    total_events = 0
+    total_tickets = 0
+    while True:
+        moved_events, moved_tickets = _move_batch(horizon, batch_size)
+        if moved_events == 0:
+            break
+
+        total_events += moved_events
+        total_tickets += moved_tickets
+        logging.debug(f"Archived {total_events} events and {total_tickets} tickets...")
+
+    if total_events > 0:
+        events.Events.invalidate_cache()
+
+    return total_events, total_tickets
+
+
+def vacuum():
+    """
+    Returns free pages of main DataBase to file system.
+    DataBase gets auto_vacuum = INCREMENTAL from migrations, so pages are freed incrementally.
+    :return: Count of freed pages.
+    """
+
+    with pool.connection() as connection:
+        auto_vacuum = connection.execute("PRAGMA main.auto_vacuum").fetchone()[0]
+        free_pages = connection.execute("PRAGMA main.freelist_count").fetchone()[0]
+
+        # 2 - INCREMENTAL
+        if auto_vacuum != 2:
+            logging.warning("DataBase has no incremental auto vacuum, it is enabled by migrations on start.")
+            return 0
+
+        # Every step frees one page, but execute() stops after the first step of statement without columns
+        connection.executescript(f"PRAGMA main.incremental_vacuum({VACUUM_PAGES});")
+        return free_pages - connection.execute("PRAGMA main.freelist_count").fetchone()[0]
+
+
+def stats():
+    """
+    Counts of events and tickets in main and archive DataBases.
+    """
+
+    result = {}
+    with pool.connection() as connection:
+        for schema in ("main", SCHEMA):
+            for table in (events.DB_TABLE, tickets.DB_TABLE):
+                result[f"{schema}_{table}"] = connection.execute(
+                    f"SELECT count(*) FROM {schema}.{table}"
+                ).fetchone()[0]
+
+    return result
+
+
+class Archiver:
+
+    def __init__(self, horizon_days, interval=ARCHIVE_INTERVAL):
+        """
+        Archives events older than horizon_days on start and every interval seconds.
+        """
+
+        self._horizon_days = horizon_days
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="Archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_once(self):
+        horizon = datetime.now() - timedelta(days=self._horizon_days)
+        moved_events, moved_tickets = archive(horizon)
+        if moved_events > 0:
+            freed_pages = vacuum()
+            logging.info(
+                f"Archived {moved_events} events and {moved_tickets} tickets "
+                f"before {horizon:%Y-%m-%d}, freed {freed_pages} pages."
+            )
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as err:
+                logging.error(f"Failed to archive events: {err}")
+
+            if self._stopped.wait(self._interval):
+                return
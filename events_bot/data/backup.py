@@ -0,0 +1,367 @@
+import gzip
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+"""
+backup.py copies the running bot's DataBase with SQLite online backup API.
+Pages are copied in small steps from a read snapshot of WAL DataBase,
+so bot's writers are not blocked and concurrent writes do not restart the copy.
+Snapshots are optionally compressed with gzip or zstd, the oldest ones are removed.
+Archive DataBase is a separate file, scheduler copies it after the main one.
+"""
+
+# Pages copied by one backup step, 256 pages of 4 KiB - 1 MiB
+PAGES_PER_STEP = 256
+# Seconds between backup steps, so copying does not take all disk's bandwidth
+STEP_PAUSE = 0.001
+# Size of chunks read by compression
+CHUNK_SIZE = 1024 * 1024
+# Level 1 is ~3 times faster than default 6, and its file is only ~6% bigger
+GZIP_LEVEL = 1
+
+MB = 1024 * 1024
+
+# Compression's name: file's suffix
+COMPRESSIONS = {
+    "none": "",
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+# Microseconds are optional, snapshots written by previous versions have only seconds
+_SNAPSHOT_NAME = re.compile(r"-\d{8}-\d{6}(-\d{6})?\.db(\.gz|\.zst)?$")
+
+
+class BackupResult:
+
+    __slots__ = ("path", "size", "file_size", "backup_seconds", "compress_seconds")
+
+    def __init__(self, path, size, file_size, backup_seconds, compress_seconds):
+        """
+        :param path: Path to snapshot's file.
+        :param size: Size of copied DataBase in bytes.
+        :param file_size: Size of snapshot's file in bytes.
+        :param backup_seconds: Time of copying pages.
+        :param compress_seconds: Time of compression.
+        """
+
+        self.path = path
+        self.size = size
+        self.file_size = file_size
+        self.backup_seconds = backup_seconds
+        self.compress_seconds = compress_seconds
+
+    @property
+    def throughput(self):
+        """
+        Speed of copying pages in MB/s.
+        """
+        return self.size / MB / max(self.backup_seconds, 1e-9)
+
+    def __str__(self):
+        return f"'{self.path}': {self.size / MB:.1f} MB copied in {self.backup_seconds:.2f} s " \
+               f"({self.throughput:.1f} MB/s), file {self.file_size / MB:.1f} MB, " \
+               f"compressed in {self.compress_seconds:.2f} s"
+
+
+class VerifyResult:
+
+    __slots__ = ("ok", "messages", "schema_version")
+
+    def __init__(self, ok, messages, schema_version):
+        """
+        :param ok: Whether snapshot passed integrity check.
+        :param messages: List of integrity check's messages.
+        :param schema_version: Snapshot's user_version.
+        """
+
+        self.ok = ok
+        self.messages = messages
+        self.schema_version = schema_version
+
+
+def _check_compression(compression):
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression '{compression}', supported: {', '.join(COMPRESSIONS)}.")
+    if compression == "zstd" and zstandard is None:
+        raise ValueError("zstd compression needs 'zstandard' package.")
+
+
+def _compression_of(path):
+    for compression, suffix in COMPRESSIONS.items():
+        if suffix != "" and path.endswith(suffix):
+            return compression
+    return "none"
+
+
+def _compress(source, destination, compression):
+    with open(source, "rb") as input_file, open(destination, "wb") as output_file:
+        if compression == "gzip":
+            with gzip.GzipFile(fileobj=output_file, mode="wb", compresslevel=GZIP_LEVEL) as writer:
+                shutil.copyfileobj(input_file, writer, CHUNK_SIZE)
+        elif compression == "zstd":
+            with zstandard.ZstdCompressor().stream_writer(output_file, closefd=False) as writer:
+                shutil.copyfileobj(input_file, writer, CHUNK_SIZE)
+        else:
+            shutil.copyfileobj(input_file, output_file, CHUNK_SIZE)
+
+        output_file.flush()
+        os.fsync(output_file.fileno())
+
+
+def _decompress(source, destination):
+    compression = _compression_of(source)
+    if compression == "zstd" and zstandard is None:
+        raise ValueError("zstd compression needs 'zstandard' package.")
+
+    with open(source, "rb") as input_file, open(destination, "wb") as output_file:
+        if compression == "gzip":
+            with gzip.GzipFile(fileobj=input_file, mode="rb") as reader:
+                shutil.copyfileobj(reader, output_file, CHUNK_SIZE)
+        elif compression == "zstd":
+            with zstandard.ZstdDecompressor().stream_reader(input_file) as reader:
+                shutil.copyfileobj(reader, output_file, CHUNK_SIZE)
+        else:
+            shutil.copyfileobj(input_file, output_file, CHUNK_SIZE)
+
+
+def copy(source_path, destination_path, pages=PAGES_PER_STEP, pause=STEP_PAUSE):
+    """
+    Copies DataBase page by page with online backup API.
+    WAL DataBase is copied from one read snapshot: writers are not blocked,
+    and pages they write during the copy do not restart it.
+    :return: Size of copied DataBase in bytes.
+    """
+
+    source = sqlite3.connect(source_path, isolation_level=None)
+    destination = sqlite3.connect(destination_path, isolation_level=None)
+    try:
+        source.execute("PRAGMA busy_timeout = 5000")
+
+        wal = source.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        if wal:
+            # Read transaction is started by the first statement
+            source.execute("BEGIN")
+            source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+
+        size = source.execute("PRAGMA page_count").fetchone()[0] * source.execute("PRAGMA page_size").fetchone()[0]
+
+        def progress(status, remaining, total):
+            if pause > 0 and remaining > 0:
+                time.sleep(pause)
+
+        try:
+            source.backup(destination, pages=pages, progress=progress)
+        finally:
+            if wal:
+                source.execute("COMMIT")
+    finally:
+        destination.close()
+        source.close()
+
+    return size
+
+
+def snapshot(source_path, directory, compression="gzip", pages=PAGES_PER_STEP, pause=STEP_PAUSE):
+    """
+    Writes snapshot named '<DataBase name>-<date>-<time>-<microseconds>.db[.gz|.zst]' to directory,
+    so snapshots written in the same second do not replace each other.
+    File appears only when it is complete.
+    :return: BackupResult.
+    """
+
+    _check_compression(compression)
+    os.makedirs(directory, exist_ok=True)
+
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    path = os.path.join(directory, f"{name}-{datetime.now():%Y%m%d-%H%M%S-%f}.db{COMPRESSIONS[compression]}")
+
+    copied = f"{path}.copy"
+    started = time.perf_counter()
+    try:
+        size = copy(source_path, copied, pages, pause)
+        backup_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        if compression == "none":
+            os.replace(copied, path)
+        else:
+            _compress(copied, f"{path}.tmp", compression)
+            os.replace(f"{path}.tmp", path)
+        compress_seconds = time.perf_counter() - started
+    finally:
+        for temporary in (copied, f"{path}.tmp"):
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    return BackupResult(path, size, os.path.getsize(path), backup_seconds, compress_seconds)
+
+
+def list_snapshots(directory, source_path):
+    """
+    :return: Paths of DataBase's snapshots in directory, the oldest first.
+    """
+
+    if not os.path.isdir(directory):
+        return []
+
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    return [
+        os.path.join(directory, file_name)
+        for file_name in sorted(os.listdir(directory))
+        if file_name.startswith(name) and _SNAPSHOT_NAME.fullmatch(file_name[len(name):])
+    ]
+
+
+def rotate(directory, source_path, keep):
+    """
+    Removes the oldest snapshots, so only keep newest ones stay.
+    :param keep: Count of kept snapshots, 0 or less - all snapshots are kept.
+    :return: List of removed paths.
+    """
+
+    if keep <= 0:
+        return []
+
+    snapshots = list_snapshots(directory, source_path)
+    removed = snapshots[:max(len(snapshots) - keep, 0)]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def verify(path):
+    """
+    Checks snapshot with PRAGMA integrity_check, compressed snapshot is unpacked to temporary file.
+    :return: VerifyResult.
+    """
+
+    with tempfile.TemporaryDirectory(prefix="backup_verify_") as directory:
+        database = path
+        if _compression_of(path) != "none":
+            database = os.path.join(directory, "snapshot.db")
+            _decompress(path, database)
+
+        connection = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+        try:
+            messages = [row[0] for row in connection.execute("PRAGMA integrity_check")]
+            schema_version = connection.execute("PRAGMA user_version").fetchone()[0]
+        except sqlite3.DatabaseError as err:
+            return VerifyResult(False, [str(err)], 0)
+        finally:
+            connection.close()
+
+    return VerifyResult(messages == ["ok"], messages, schema_version)
+
+
+def restore(path, destination_path):
+    """
+    Replaces DataBase with snapshot after verifying it.
+    Pages are written by backup API, so DataBase's WAL file stays consistent.
+    Bot must be stopped while DataBase is restored.
+    :return: VerifyResult, DataBase is not changed if snapshot is broken.
+    """
+
+    result = verify(path)
+    if not result.ok:
+        return result
+
+    with tempfile.TemporaryDirectory(prefix="backup_restore_") as directory:
+        database = path
+        if _compression_of(path) != "none":
+            database = os.path.join(directory, "snapshot.db")
+            _decompress(path, database)
+
+        copy(database, destination_path, pages=-1, pause=0)
+
+    return result
+
+
+class BackupScheduler:
+
+    def __init__(self, source_paths, directory, interval, keep, compression="gzip"):
+        """
+        Writes snapshots every interval seconds and keeps only keep newest ones of every DataBase.
+        :param source_paths: Paths of DataBases, snapshots are written in this order.
+        :param keep: Count of kept snapshots of every DataBase, 0 - all snapshots are kept.
+        """
+
+        _check_compression(compression)
+
+        self._source_paths = list(source_paths)
+        self._directory = directory
+        self._interval = interval
+        self._keep = keep
+        self._compression = compression
+
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self._snapshots = 0
+        self._failed = 0
+        self._last = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="BackupScheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_once(self):
+        """
+        :return: List of BackupResult, one for every DataBase.
+        """
+
+        # Archive is copied after the main DataBase, so an event moved between the copies
+        # is in both of them, and the next archive run replaces its archived copy
+        results = []
+        for source_path in self._source_paths:
+            result = snapshot(source_path, self._directory, self._compression)
+            results.append(result)
+            logging.info(f"Backup {result}.")
+
+            for path in rotate(self._directory, source_path, self._keep):
+                logging.debug(f"Removed old backup '{path}'.")
+
+        self._last = results
+        self._snapshots += 1
+        return results
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self.run_once()
+            except Exception as err:
+                self._failed += 1
+                logging.error(f"Failed to backup DataBase: {err}")
+
+    def stats(self):
+        result = {
+            "snapshots": self._snapshots,
+            "failed": self._failed,
+        }
+        if self._last is not None:
+            size = sum(last.size for last in self._last)
+            seconds = sum(last.backup_seconds for last in self._last)
+            result["last_size_bytes"] = size
+            result["last_file_size_bytes"] = sum(last.file_size for last in self._last)
+            result["last_seconds"] = seconds
+            result["last_throughput_mb_s"] = size / MB / max(seconds, 1e-9)
+        return result
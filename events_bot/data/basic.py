@@ -1,33 +1,79 @@
-import sqlite3
 import uuid
+from functools import lru_cache
 
-import envars
+from data.connection import pool
 
 DB_ID = "id"
 
 
+@lru_cache(maxsize=None)
+def _insert_sql(table, columns):
+    """
+    :param columns: Tuple of columns' names, id is added automatically.
+    """
+
+    sql_columns = ", ".join((DB_ID,) + columns)
+    sql_values = ", ".join(f":{column}" for column in (DB_ID,) + columns)
+    return f"INSERT INTO {table} ({sql_columns}) VALUES ({sql_values})"
+
+
+@lru_cache(maxsize=None)
+def _update_sql(table, columns):
+    """
+    :param columns: Tuple of updated columns' names.
+    """
+
+    sql = ", ".join(f"{column} = :{column}" for column in columns)
+    return f"UPDATE {table} SET {sql} WHERE {DB_ID} = :{DB_ID}"
+
+
+@lru_cache(maxsize=None)
+def _slots(cls):
+    """
+    :return: Tuple of attributes' names declared by class and its bases.
+    """
+
+    return tuple(name for base in cls.__mro__ for name in getattr(base, "__slots__", ()))
+
+
 class DataObject:
 
-    def __init__(self, table, obj):
-        self._connection = sqlite3.connect(envars.db_path)
-        self._connection.row_factory = sqlite3.Row
+    __slots__ = ("_table", "_new", "_dirty", "_id")
+
+    # Properties' names mapped to table's columns they are stored in
+    _columns = {}
 
+    def __init__(self, table, obj):
         self._table = table
-        self._has_changes = False
+        self._new = obj is None
+        # Names of changed properties, frozenset is shared while object has no changes
+        self._dirty = frozenset()
         self._id = ""
 
         if obj is None:
-            self._has_changes = True
             return
 
         self._id = obj[DB_ID]
 
     def _setter(func):
+        """
+        Marks property as changed if setter assigned a different value.
+        Setter must store value in attribute named as property with '_' prefix.
+        """
+
+        attribute = "_" + func.__name__
+
         def wrap(self, value):
+            old_value = getattr(self, attribute)
             func(self, value)
-            self._has_changes = True
+            if getattr(self, attribute) != old_value:
+                self._dirty = self._dirty.union((func.__name__,))
         return wrap
 
+    @property
+    def _has_changes(self):
+        return self._new or len(self._dirty) > 0
+
     @property
     def id(self):
         """
@@ -46,77 +92,115 @@ class DataObject:
             raise ValueError("Can't change id value when it is already filled.")
         self._id = value
 
-    def write(self, *args):
+    def _ensure_id(self):
+        if self._id == "":
+            # Generates random uuid for new object in db
+            self._id = str(uuid.uuid4())
+
+    def _values(self):
+        """
+        :return: Dict of all columns' values except id.
+        """
+        return {}
+
+    def _state(self):
+        """
+        :return: Values of all object's attributes, they are set back by _restore.
+        """
+        return tuple(getattr(self, name) for name in _slots(type(self)))
+
+    def _restore(self, state):
+        for name, value in zip(_slots(type(self)), state):
+            setattr(self, name, value)
+
+    def _committed(self):
+        """
+        Called after postponed write is committed.
+        """
+        pass
+
+    def _statement(self, values=None):
+        """
+        :param values: Columns' values, by default - _values().
+        :return: Tuple (sql, parameters) which writes object's changes
+            or None if nothing should be written.
+        """
 
         if not self._has_changes:
-            # If nothing changed no need to touch database
-            return
+            return None
 
-        cursor = self._connection.cursor()
+        self._ensure_id()
+        if values is None:
+            values = self._values()
 
-        create_new = False
-        if self._id == "":
-            # Generates random uuid for new object in db
-            self._id = str(uuid.uuid4())
-            create_new = True
-
-        obj_dict = {
-            DB_ID: self._id
-        }
-        if len(args) > 0:
-            obj_dict.update(args[0])
-
-        if create_new:
-
-            sql_columns = ""
-            sql_values = ""
-            for key in obj_dict:
-                sql_columns += f", {key}"
-                sql_values += f", :{key}"
-
-            cursor.execute(
-                f"INSERT INTO {self._table} ({DB_ID}{sql_columns}) VALUES (:{DB_ID}{sql_values})",
-                obj_dict
-            )
-
-        else:
-            if len(obj_dict) == 1:
-                return
-
-            sql = ""
-            for key in obj_dict:
-                if key == DB_ID:
-                    continue
-                sql += f"{key} = :{key},"
-            sql = sql.removesuffix(',')
-
-            cursor.execute(
-                f"UPDATE {self._table} SET {sql} "
-                f"WHERE {DB_ID} = :{DB_ID}",
-                obj_dict
-            )
+        if self._new:
+            params = dict(values)
+            params[DB_ID] = self._id
+            return _insert_sql(self._table, tuple(values)), params
 
-        cursor.close()
-        self._connection.commit()
-        self._has_changes = False
+        changed = {self._columns[field] for field in self._dirty if field in self._columns}
+        params = {column: value for column, value in values.items() if column in changed}
+        if len(params) == 0:
+            return None
 
-    def __del__(self):
-        self._connection.close()
+        sql = _update_sql(self._table, tuple(params))
+        params[DB_ID] = self._id
+        return sql, params
 
+    def _written(self):
+        self._dirty = frozenset()
+        self._new = False
 
-def search_by_unique_value(table, value, search=DB_ID):
-    connection = sqlite3.connect(envars.db_path)
-    connection.row_factory = sqlite3.Row
+    def write(self, *args):
+        """
+        Inserts new object or updates changed columns of existing one.
+        :param args: Optional dict of columns' values, by default - _values().
+        """
+
+        statement = self._statement(args[0] if len(args) > 0 else None)
+
+        if statement is not None:
+            with pool.connection() as connection:
+                connection.execute(*statement)
+
+        self._written()
+
+
+def write_many(objects):
+    """
+    Writes changes of many objects in one transaction,
+    objects with the same SQL statement are written with one executemany.
+    Writes are not postponed by session.
+    :return: List of objects which had changes.
+    """
 
-    cursor = connection.cursor()
+    written = []
+    statements = {}
+    for obj in objects:
+        statement = obj._statement()
+        if obj._has_changes:
+            written.append(obj)
+        if statement is not None:
+            statements.setdefault(statement[0], []).append(statement[1])
 
-    result = None
-    for row in cursor.execute(
+    if len(statements) > 0:
+        with pool.transaction() as connection:
+            for sql, params in statements.items():
+                connection.executemany(sql, params)
+
+    for obj in written:
+        obj._written()
+
+    return written
+
+
+def search_by_unique_value(table, value, search=DB_ID):
+    with pool.connection() as connection:
+        cursor = connection.execute(
             f"SELECT * FROM {table} WHERE {search} = :search_value",
             {"search_value": value}
-    ):
-        result = row
-        break
+        )
+        result = cursor.fetchone()
+        cursor.close()
 
-    connection.close()
     return result
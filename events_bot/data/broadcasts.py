@@ -0,0 +1,152 @@
+from datetime import datetime
+
+from data.basic import DataObject, search_by_unique_value
+from data.connection import pool
+
+DB_TABLE = "broadcasts"
+DB_TEXT = "text"
+DB_AUTHOR = "author"
+DB_CREATED = "created"
+DB_CURSOR = "cursor"
+DB_SENT = "sent"
+DB_FAILED = "failed"
+DB_FINISHED = "finished"
+
+
+class Broadcast(DataObject):
+
+    __slots__ = ("_text", "_author", "_created", "_cursor", "_sent", "_failed", "_finished")
+
+    _columns = {
+        "text": DB_TEXT,
+        "author": DB_AUTHOR,
+        "cursor": DB_CURSOR,
+        "sent": DB_SENT,
+        "failed": DB_FAILED,
+        "finished": DB_FINISHED,
+    }
+
+    def __init__(self, row=None):
+        """
+        Manages one 'broadcasts' table object: message sent to all users
+        and progress of sending it.
+        :param row: Dict or Row object where keys is table's columns' names
+        """
+
+        super().__init__(DB_TABLE, row)
+        self._text = ""
+        self._author = 0
+        self._created = datetime.now()
+        self._cursor = ""
+        self._sent = 0
+        self._failed = 0
+        self._finished = False
+
+        if row is None:
+            return
+
+        self._text = row[DB_TEXT]
+        self._author = row[DB_AUTHOR]
+        self._created = datetime.fromtimestamp(row[DB_CREATED])
+        self._cursor = row[DB_CURSOR]
+        self._sent = row[DB_SENT]
+        self._failed = row[DB_FAILED]
+        self._finished = bool(row[DB_FINISHED])
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    @DataObject._setter
+    def text(self, value):
+        self._text = value
+
+    @property
+    def author(self):
+        """
+        Telegram id of admin who started broadcast.
+        """
+        return self._author
+
+    @author.setter
+    @DataObject._setter
+    def author(self, value):
+        self._author = value
+
+    @property
+    def created(self):
+        return self._created
+
+    @property
+    def cursor(self):
+        """
+        Id of the last user message was sent to, users are sent in order of their ids.
+        """
+        return self._cursor
+
+    @cursor.setter
+    @DataObject._setter
+    def cursor(self, value):
+        self._cursor = value
+
+    @property
+    def sent(self):
+        return self._sent
+
+    @sent.setter
+    @DataObject._setter
+    def sent(self, value):
+        self._sent = value
+
+    @property
+    def failed(self):
+        return self._failed
+
+    @failed.setter
+    @DataObject._setter
+    def failed(self, value):
+        self._failed = value
+
+    @property
+    def finished(self):
+        return self._finished
+
+    @finished.setter
+    @DataObject._setter
+    def finished(self, value):
+        self._finished = value
+
+    def _values(self):
+        return {
+            DB_TEXT: self._text,
+            DB_AUTHOR: self._author,
+            DB_CREATED: self._created.timestamp(),
+            DB_CURSOR: self._cursor,
+            DB_SENT: self._sent,
+            DB_FAILED: self._failed,
+            DB_FINISHED: int(self._finished),
+        }
+
+
+class Broadcasts:
+
+    @staticmethod
+    def get(broadcast_id):
+        row = search_by_unique_value(DB_TABLE, broadcast_id)
+        if row is None:
+            return None
+        return Broadcast(row)
+
+    @staticmethod
+    def get_unfinished():
+        """
+        :return: List of not finished broadcasts, the oldest first.
+        """
+
+        with pool.connection() as connection:
+            rows = connection.execute(
+                f"SELECT * FROM {DB_TABLE} WHERE {DB_FINISHED} = 0 ORDER BY {DB_CREATED}"
+            ).fetchall()
+
+        return [Broadcast(row) for row in rows]
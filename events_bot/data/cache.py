@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+
+"""
+cache.py provides in-process caches for data objects and query results.
+"""
+
+_MISSING = object()
+
+
+class LRUCache:
+
+    def __init__(self, max_size, ttl=None):
+        """
+        Thread-safe least recently used cache.
+        :param max_size: Max count of stored values, the oldest are evicted.
+        :param ttl: Seconds after which value expires, None - never expires.
+        """
+
+        self._max_size = max_size
+        self._ttl = ttl
+
+        self._lock = threading.Lock()
+        self._values = OrderedDict()
+        self._generation = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._values.get(key, _MISSING)
+
+            if item is not _MISSING and item[0] is not None and item[0] < time.monotonic():
+                del self._values[key]
+                item = _MISSING
+
+            if item is _MISSING:
+                self._misses += 1
+                return default
+
+            self._values.move_to_end(key)
+            self._hits += 1
+            return item[1]
+
+    def _put(self, key, value):
+        expires = None
+        if self._ttl is not None:
+            expires = time.monotonic() + self._ttl
+
+        self._values[key] = (expires, value)
+        self._values.move_to_end(key)
+
+        while len(self._values) > self._max_size:
+            self._values.popitem(last=False)
+            self._evictions += 1
+
+    def put(self, key, value):
+        with self._lock:
+            self._put(key, value)
+
+    def setdefault(self, key, value):
+        """
+        Stores value if key is not cached yet.
+        :return: Cached value for key.
+        """
+
+        with self._lock:
+            item = self._values.get(key, _MISSING)
+            if item is not _MISSING and (item[0] is None or item[0] >= time.monotonic()):
+                self._values.move_to_end(key)
+                return item[1]
+
+            self._put(key, value)
+            return value
+
+    def get_or_load(self, key, loader):
+        """
+        Returns cached value or stores and returns loader() result.
+        Result is not stored if cache was cleared while loader was running,
+        so it can't bring back data changed by concurrent write.
+        """
+
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        generation = self._generation
+        value = loader()
+
+        with self._lock:
+            if generation == self._generation:
+                self._put(key, value)
+
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._values.pop(key, _MISSING)
+            if item is _MISSING:
+                return default
+            return item[1]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._values),
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
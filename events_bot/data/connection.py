@@ -0,0 +1,220 @@
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+
+import envars
+
+"""
+connection.py provides shared SQLite connections for data objects.
+Every thread gets its own connection, which is opened on first use
+and reused by all following queries of that thread.
+"""
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -16000,
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+}
+
+
+@lru_cache(maxsize=None)
+def _row_type(columns):
+    return namedtuple("Row", columns)
+
+
+def namedtuple_row(cursor, row):
+    """
+    Row factory which returns rows as namedtuples with query's columns' names.
+    Namedtuples are much smaller than dicts made from sqlite3.Row,
+    so it is used for lists which are kept in caches.
+    """
+
+    return _row_type(tuple(column[0] for column in cursor.description))._make(row)
+
+
+class ConnectionPool:
+
+    def __init__(self, path=None, pragmas=None):
+        """
+        Thread-local pool of SQLite connections.
+        :param path: Path to .db file, envars.db_path is used if not specified.
+        :param pragmas: Dict of pragmas applied to every new connection.
+        """
+
+        self._path = path
+        self._pragmas = PRAGMAS if pragmas is None else pragmas
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = set()
+
+        self._on_connect = []
+        self._on_close = []
+        self._on_release = []
+
+        self._opened = 0
+        self._reused = 0
+        self._closed = 0
+
+    @property
+    def path(self):
+        if self._path is None:
+            return envars.db_path
+        return self._path
+
+    def on_connect(self, callback):
+        """
+        Registers callback(connection) called after new connection is opened.
+        """
+        self._on_connect.append(callback)
+        return callback
+
+    def on_close(self, callback):
+        """
+        Registers callback(connection) called before connection is closed.
+        """
+        self._on_close.append(callback)
+        return callback
+
+    def on_release(self, callback):
+        """
+        Registers callback(seconds) called when thread returns connection
+        it has borrowed for the given time, nested borrowings are not reported.
+        """
+        self._on_release.append(callback)
+        return callback
+
+    def _open(self):
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+
+        for name, value in self._pragmas.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+
+        for callback in self._on_connect:
+            callback(connection)
+
+        with self._lock:
+            self._connections.add(connection)
+            self._opened += 1
+
+        return connection
+
+    def _close(self, connection):
+        for callback in self._on_close:
+            callback(connection)
+
+        connection.close()
+
+        with self._lock:
+            self._connections.discard(connection)
+            self._closed += 1
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows current thread's connection, opens it if needed.
+        """
+
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._open()
+            self._local.connection = connection
+        else:
+            with self._lock:
+                self._reused += 1
+
+        depth = getattr(self._local, "depth", 0)
+        if depth > 0 or len(self._on_release) == 0:
+            self._local.depth = depth + 1
+            try:
+                yield connection
+            finally:
+                self._local.depth = depth
+            return
+
+        self._local.depth = 1
+        started = time.perf_counter()
+        try:
+            yield connection
+        finally:
+            self._local.depth = 0
+            elapsed = time.perf_counter() - started
+            for callback in self._on_release:
+                callback(elapsed)
+
+    def in_transaction(self):
+        """
+        Whether current thread's connection has started transaction.
+        """
+
+        connection = getattr(self._local, "connection", None)
+        return connection is not None and connection.in_transaction
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """
+        Runs block in one transaction on current thread's connection.
+        Transaction started inside another one is merged into the outer.
+        :param immediate: Take write lock at start (BEGIN IMMEDIATE).
+        """
+
+        with self.connection() as connection:
+            if connection.in_transaction:
+                yield connection
+                return
+
+            connection.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def close(self):
+        """
+        Closes current thread's connection.
+        """
+
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            return
+
+        self._local.connection = None
+        self._close(connection)
+
+    def close_all(self):
+        """
+        Closes connections of all threads, should be called on shutdown.
+        """
+
+        with self._lock:
+            connections = list(self._connections)
+
+        for connection in connections:
+            self._close(connection)
+
+        self._local = threading.local()
+
+    def stats(self):
+        """
+        Counters of opened, reused and closed connections.
+        """
+
+        with self._lock:
+            return {
+                "opened": self._opened,
+                "reused": self._reused,
+                "closed": self._closed,
+                "active": len(self._connections),
+            }
+
+
+pool = ConnectionPool()
@@ -1,5 +1,13 @@
-from data.basic import DataObject, search_by_unique_value
+from data import aio
+from data.basic import DataObject, search_by_unique_value, write_many
+from data.cache import LRUCache
+from data.connection import pool, namedtuple_row
+from data.session import defer_write, identity
 from datetime import datetime
+from itertools import chain
+import envars
+import logging
+import re
 
 DB_TABLE = 'events'
 DB_NAME = 'name'
@@ -7,10 +15,63 @@ DB_DATETIME = 'datetime'
 DB_LOCATION = 'location'
 DB_MAX_MEMBERS = 'maxMembers'
 DB_DESCRIPTION = 'description'
+DB_BOOKED_MEMBERS = 'bookedMembers'
+DB_REMINDED = 'reminded'
+
+# Full-text index of events' name, location and description
+DB_FTS_TABLE = 'events_fts'
+# Rowids of events' rows in full-text index, so triggers find them without scanning the index
+DB_FTS_ROWIDS_TABLE = 'events_fts_rowids'
+DB_FTS_ROWID = 'ftsRowid'
+
+# Default count of events on one page
+PAGE_SIZE = 10
+
+# Default count of found events and max count of words in search query
+SEARCH_LIMIT = 20
+SEARCH_WORDS = 10
+# bm25 weights of events_fts columns: id, name, location, description
+SEARCH_WEIGHTS = (0.0, 10.0, 3.0, 1.0)
+
+# Events list snapshot and events pages
+_print_info_cache = LRUCache(256, envars.events_cache_ttl)
+
+# Functions called with every written event
+_listeners = []
+
+
+def _search_words(text):
+    """
+    Splits user's text into words, so it can't contain FTS5 query syntax.
+    """
+    return re.findall(r"\w+", text.lower())[:SEARCH_WORDS]
+
+
+def actual_booked_members_sql():
+    """
+    Correlated subquery which sums members of event's tickets.
+    'bookedMembers' column is maintained by triggers and must be equal to it.
+    """
+
+    from data.basic import DB_ID
+    import data.tickets as tickets
+
+    return f"SELECT IFNULL(sum({tickets.DB_MEMBERS}), 0) FROM {tickets.DB_TABLE} " \
+           f"WHERE {tickets.DB_TABLE}.{tickets.DB_EVENT} = {DB_TABLE}.{DB_ID}"
 
 
 class Event(DataObject):
 
+    __slots__ = ("_name", "_datetime", "_location", "_max_members", "_description")
+
+    _columns = {
+        "name": DB_NAME,
+        "datetime": DB_DATETIME,
+        "location": DB_LOCATION,
+        "max_members": DB_MAX_MEMBERS,
+        "description": DB_DESCRIPTION,
+    }
+
     def __init__(self, row=None):
         super().__init__(DB_TABLE, row)
 
@@ -79,87 +140,518 @@ class Event(DataObject):
         if self.id == "":
             return self.max_members
 
-        import data.tickets as tickets
+        from data.basic import DB_ID
 
-        cursor = self._connection.cursor()
-        for row in cursor.execute(
-            f"SELECT IFNULL(sum({tickets.DB_MEMBERS}), 0) AS members FROM {tickets.DB_TABLE} WHERE {tickets.DB_EVENT} = :event",
-            {"event": self.id}
-        ):
-            result = self.max_members - row["members"]
-            if result < 0:
-                return 0
-            return result
-        return self.max_members
+        with pool.connection() as connection:
+            cursor = connection.execute(
+                f"SELECT {DB_BOOKED_MEMBERS} FROM {DB_TABLE} WHERE {DB_ID} = :event",
+                {"event": self.id}
+            )
+            row = cursor.fetchone()
+            cursor.close()
 
-    def write(self):
-        super(Event, self).write({
+        if row is None:
+            return self.max_members
+
+        result = self.max_members - row[DB_BOOKED_MEMBERS]
+        if result < 0:
+            return 0
+        return result
+
+    def _values(self):
+        return {
             DB_NAME: self._name,
             DB_DATETIME: self._datetime.timestamp(),
             DB_LOCATION: self._location,
             DB_MAX_MEMBERS: self._max_members,
             DB_DESCRIPTION: self._description,
-        })
+        }
+
+    def write(self):
+        if defer_write(self) or not self._has_changes:
+            return
+
+        super(Event, self).write()
+        Events.invalidate_cache()
+        Events._notify(self)
+
+    def _committed(self):
+        Events.invalidate_cache()
+        Events._notify(self)
+
+
+class EventsPage:
+
+    def __init__(self, events, has_previous, has_next):
+        """
+        One page of events list, ordered by datetime.
+        :param events: List of rows as in Events.get_events_print_info.
+        """
+
+        self.events = events
+        self.has_previous = has_previous
+        self.has_next = has_next
+
+    @property
+    def first(self):
+        """
+        Cursor of the first event on page.
+        """
+        return self.events[0].datetime, self.events[0].id
+
+    @property
+    def last(self):
+        """
+        Cursor of the last event on page.
+        """
+        return self.events[-1].datetime, self.events[-1].id
 
 
 class Events:
 
     @staticmethod
     def get(event_id):
-        row = search_by_unique_value(DB_TABLE, event_id)
+        def load():
+            row = search_by_unique_value(DB_TABLE, event_id)
+            if row is None:
+                return None
+            return Event(row)
+
+        return identity(DB_TABLE, event_id, load)
+
+    @staticmethod
+    def write_many(events):
+        """
+        Writes changes of many events in one transaction.
+        :return: Count of written events.
+        """
+
+        written = write_many(events)
+        if len(written) > 0:
+            Events.invalidate_cache()
+        return len(written)
+
+    @staticmethod
+    def insert_many(events):
+        """
+        Inserts new events with one executemany in one transaction.
+        Events are consumed lazily, so it can be generator over big file.
+        :param events: Iterable of new Event objects.
+        :return: Count of inserted events.
+        """
+
+        events = iter(events)
+        first = next(events, None)
+        if first is None:
+            return 0
+
+        count = 0
+        # Listeners are notified after commit, events are kept only if there are listeners
+        inserted = []
+
+        def params():
+            nonlocal count
+
+            for event in chain((first,), events):
+                if not event._new:
+                    raise ValueError(f"Event {event.id} already exists.")
+                yield event._statement()[1]
+                event._written()
+                if len(_listeners) > 0:
+                    inserted.append(event)
+                count += 1
+
+        with pool.transaction() as connection:
+            # All new events are inserted with the same statement
+            connection.executemany(first._statement()[0], params())
+
+        Events.invalidate_cache()
+        for event in inserted:
+            Events._notify(event)
+        return count
+
+    @staticmethod
+    def _load_events_print_info():
+        from data.basic import DB_ID
+
+        with pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.row_factory = namedtuple_row
+            cursor.execute(
+                f"SELECT "
+                f"  {DB_ID} AS id, "
+                f"  {DB_NAME} AS name, "
+                f"  {DB_DATETIME} AS datetime, "
+                f"  {DB_MAX_MEMBERS} AS max_members, "
+                f"  {DB_LOCATION} AS location, "
+                f"  max({DB_MAX_MEMBERS} - {DB_BOOKED_MEMBERS}, 0) AS available_places "
+                f"FROM {DB_TABLE} "
+                f"ORDER BY {DB_DATETIME}, {DB_ID};"
+            )
+            result = cursor.fetchall()
+            cursor.close()
+
+        return result
+
+    @staticmethod
+    def get_events_print_info(available_only):
+        """
+        Gets short information about events from in-process snapshot.
+        Snapshot is reloaded after any event or ticket write.
+        :param available_only: Only future events with available places.
+        :return: List of namedtuples with id, name, datetime, max_members,
+            location and available_places.
+        """
+
+        events = _print_info_cache.get_or_load("all", Events._load_events_print_info)
+        if not available_only:
+            return list(events)
+
+        current_time = int(datetime.now().timestamp())
+        return [
+            event for event in events
+            if (event.available_places > 0 or event.max_members == 0) and event.datetime > current_time
+        ]
+
+    @staticmethod
+    def get_archived(event_id):
+        """
+        Gets event moved to archive DataBase, it can't be changed.
+        :return: Event or None.
+        """
+
+        from data import archive
+        from data.basic import DB_ID
+
+        if not archive.is_enabled():
+            return None
+
+        with pool.connection() as connection:
+            cursor = connection.execute(
+                f"SELECT * FROM {archive.SCHEMA}.{DB_TABLE} WHERE {DB_ID} = :id",
+                {"id": event_id}
+            )
+            row = cursor.fetchone()
+            cursor.close()
+
         if row is None:
             return None
         return Event(row)
 
     @staticmethod
-    def get_events_print_info(available_only):
-        import sqlite3
-        import envars
+    def _events_table_sql(include_archive):
+        """
+        :return: Table expression of events, optionally with archived ones.
+        """
+
+        from data import archive
         from data.basic import DB_ID
-        from data.tickets import DB_EVENT, DB_MEMBERS
-        from data import tickets
 
-        connection = sqlite3.connect(envars.db_path)
-        connection.row_factory = sqlite3.Row
+        if not include_archive:
+            return DB_TABLE
 
-        cursor = connection.cursor()
+        columns = ", ".join((DB_ID, DB_NAME, DB_DATETIME, DB_MAX_MEMBERS, DB_LOCATION, DB_BOOKED_MEMBERS))
+        return f"(SELECT {columns} FROM main.{DB_TABLE} " \
+               f"UNION ALL SELECT {columns} FROM {archive.SCHEMA}.{DB_TABLE})"
+
+    @staticmethod
+    def _load_events_page(available_only, cursor, backward, limit, include_archive=False):
+        from data.basic import DB_ID
+
+        conditions = []
+        params = {"limit": limit + 1}
 
-        sql_search = ""
         if available_only:
-            sql_search = \
-                f"WHERE " \
-                f"  (temp_events.available_places > 0 OR {DB_TABLE}.{DB_MAX_MEMBERS} = 0) AND " \
-                f"  {DB_TABLE}.{DB_DATETIME} > :current_time "
-
-        cursor.execute(
-            f"CREATE TEMP TABLE IF NOT EXISTS temp_events AS SELECT "
-            f"  {DB_TABLE}.{DB_ID} as {DB_ID}, "
-            f"  CASE "
-            f"      WHEN {DB_TABLE}.{DB_MAX_MEMBERS} - sum(IFNULL({tickets.DB_TABLE}.{DB_MEMBERS}, 0)) <= 0 "
-            f"          THEN 0 "
-            f"      ELSE {DB_TABLE}.{DB_MAX_MEMBERS} - sum(IFNULL({tickets.DB_TABLE}.{DB_MEMBERS}, 0)) "
-            f"  END as available_places "
-            f"FROM {DB_TABLE} LEFT JOIN {tickets.DB_TABLE} "
-            f"  ON {DB_TABLE}.{DB_ID} = {tickets.DB_TABLE}.{DB_EVENT} "
-            f"GROUP BY {DB_TABLE}.{DB_ID} "
+            conditions.append(
+                f"({DB_MAX_MEMBERS} - {DB_BOOKED_MEMBERS} > 0 OR {DB_MAX_MEMBERS} = 0) AND "
+                f"{DB_DATETIME} > :current_time"
+            )
+            params["current_time"] = int(datetime.now().timestamp())
+
+        if cursor is not None:
+            conditions.append(f"({DB_DATETIME}, {DB_ID}) {'<' if backward else '>'} (:datetime, :id)")
+            params["datetime"], params["id"] = cursor
+
+        sql_search = ""
+        if len(conditions) > 0:
+            sql_search = f"WHERE {' AND '.join(conditions)} "
+
+        order = "DESC" if backward else "ASC"
+
+        with pool.connection() as connection:
+            db_cursor = connection.cursor()
+            db_cursor.row_factory = namedtuple_row
+            db_cursor.execute(
+                f"SELECT "
+                f"  {DB_ID} AS id, "
+                f"  {DB_NAME} AS name, "
+                f"  {DB_DATETIME} AS datetime, "
+                f"  {DB_MAX_MEMBERS} AS max_members, "
+                f"  {DB_LOCATION} AS location, "
+                f"  max({DB_MAX_MEMBERS} - {DB_BOOKED_MEMBERS}, 0) AS available_places "
+                f"FROM {Events._events_table_sql(include_archive)} "
+                f"{sql_search}"
+                f"ORDER BY {DB_DATETIME} {order}, {DB_ID} {order} "
+                f"LIMIT :limit;",
+                params
+            )
+            events = db_cursor.fetchall()
+            db_cursor.close()
+
+        has_more = len(events) > limit
+        events = events[:limit]
+
+        if backward:
+            events.reverse()
+            return EventsPage(events, has_more, True)
+
+        return EventsPage(events, cursor is not None, has_more)
+
+    @staticmethod
+    def get_events_page(available_only, cursor=None, backward=False, limit=PAGE_SIZE, include_archive=False):
+        """
+        Gets page of events list with keyset pagination by (datetime, id).
+        Every page is loaded with one range query over datetime index
+        and cached until the next event or ticket write.
+        :param available_only: Only future events with available places.
+        :param cursor: Tuple (datetime, id) of event next to page, None - the first page.
+        :param backward: Page ends before cursor instead of starting after it.
+        :param limit: Max count of events on page.
+        :param include_archive: List events moved to archive DataBase too.
+        :return: EventsPage.
+        """
+
+        if cursor is not None:
+            cursor = tuple(cursor)
+
+        page = _print_info_cache.get_or_load(
+            ("page", available_only, cursor, backward, limit, include_archive),
+            lambda: Events._load_events_page(available_only, cursor, backward, limit, include_archive)
         )
 
-        result = []
-        for row in cursor.execute(
+        if not available_only:
+            return page
+        return Events._without_started(page)
+
+    @staticmethod
+    def _without_started(page):
+        # Cached page could contain events which already started
+        current_time = int(datetime.now().timestamp())
+        return EventsPage(
+            [event for event in page.events if event.datetime > current_time],
+            page.has_previous,
+            page.has_next
+        )
+
+    @staticmethod
+    async def alist_upcoming(cursor=None, backward=False, limit=PAGE_SIZE):
+        """
+        Page of future events with available places (as in /events) for asyncio code.
+        Cached page is returned without leaving the event loop.
+        :return: EventsPage.
+        """
+
+        if cursor is not None:
+            cursor = tuple(cursor)
+
+        page = _print_info_cache.get(("page", True, cursor, backward, limit, False))
+        if page is not None:
+            return Events._without_started(page)
+
+        return await aio.read(Events.get_events_page, True, cursor, backward, limit)
+
+    @staticmethod
+    def subscribe(callback):
+        """
+        Registers callback(event) called after event is created or changed.
+        """
+        _listeners.append(callback)
+        return callback
+
+    @staticmethod
+    def _notify(event):
+        for callback in _listeners:
+            try:
+                callback(event)
+            except Exception as err:
+                logging.error(f"Events listener failed: {err}")
+
+    @staticmethod
+    def get_not_reminded(after):
+        """
+        Gets events which start after timestamp and are not reminded yet.
+        :return: List of namedtuples with id and datetime.
+        """
+
+        from data.basic import DB_ID
+
+        with pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.row_factory = namedtuple_row
+            cursor.execute(
+                f"SELECT {DB_ID} AS id, {DB_DATETIME} AS datetime FROM {DB_TABLE} "
+                f"WHERE {DB_DATETIME} > :after AND {DB_REMINDED} = 0 "
+                f"ORDER BY {DB_DATETIME}",
+                {"after": after}
+            )
+            result = cursor.fetchall()
+            cursor.close()
+
+        return result
+
+    @staticmethod
+    def mark_reminded(event_id, lead_time):
+        """
+        Marks event as reminded if it starts within lead time and is not reminded yet.
+        Only one caller can mark event, 'reminded' is reset when event's datetime changes.
+        :param lead_time: Seconds before event's start.
+        :return: True if event is marked by this call.
+        """
+
+        from data.basic import DB_ID
+
+        now = datetime.now().timestamp()
+        with pool.transaction() as connection:
+            cursor = connection.execute(
+                f"UPDATE {DB_TABLE} SET {DB_REMINDED} = 1 "
+                f"WHERE {DB_ID} = :event AND {DB_REMINDED} = 0 "
+                f"AND {DB_DATETIME} > :now AND {DB_DATETIME} <= :remind_before",
+                {"event": event_id, "now": now, "remind_before": now + lead_time}
+            )
+            marked = cursor.rowcount == 1
+            cursor.close()
+
+        return marked
+
+    @staticmethod
+    def _fts_available(connection):
+        cursor = connection.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = :name",
+            {"name": DB_FTS_TABLE}
+        )
+        result = cursor.fetchone()[0] > 0
+        cursor.close()
+        return result
+
+    @staticmethod
+    def _load_search(words, limit):
+        from data.basic import DB_ID
+
+        params = {"current_time": int(datetime.now().timestamp()), "limit": limit}
+
+        with pool.connection() as connection:
+            if Events._fts_available(connection):
+                # Every word is quoted prefix, words are joined with implicit AND
+                params["query"] = " ".join(f'"{word}"*' for word in words)
+                sql_from = f"{DB_FTS_TABLE} INNER JOIN {DB_TABLE} ON {DB_TABLE}.{DB_ID} = {DB_FTS_TABLE}.{DB_ID} "
+                sql_search = f"{DB_FTS_TABLE} MATCH :query"
+                sql_order = f"bm25({DB_FTS_TABLE}, {', '.join(map(str, SEARCH_WEIGHTS))})"
+            else:
+                # SQLite's LIKE ignores case of ASCII letters only
+                connection.create_function("unicode_lower", 1, str.lower, deterministic=True)
+                conditions = []
+                for number, word in enumerate(words):
+                    params[f"word{number}"] = f"%{word}%"
+                    conditions.append(
+                        f"(unicode_lower({DB_TABLE}.{DB_NAME}) LIKE :word{number} "
+                        f"OR unicode_lower({DB_TABLE}.{DB_LOCATION}) LIKE :word{number} "
+                        f"OR unicode_lower({DB_TABLE}.{DB_DESCRIPTION}) LIKE :word{number})"
+                    )
+                sql_from = f"{DB_TABLE} "
+                sql_search = " AND ".join(conditions)
+                sql_order = f"{DB_TABLE}.{DB_DATETIME}"
+
+            cursor = connection.cursor()
+            cursor.row_factory = namedtuple_row
+            cursor.execute(
                 f"SELECT "
                 f"  {DB_TABLE}.{DB_ID} AS id, "
                 f"  {DB_TABLE}.{DB_NAME} AS name, "
                 f"  {DB_TABLE}.{DB_DATETIME} AS datetime, "
                 f"  {DB_TABLE}.{DB_MAX_MEMBERS} AS max_members, "
                 f"  {DB_TABLE}.{DB_LOCATION} AS location, "
-                f"  temp_events.available_places AS available_places "
-                f"FROM {DB_TABLE} INNER JOIN temp.temp_events AS temp_events "
-                f"  ON {DB_TABLE}.{DB_ID} = temp_events.{DB_ID} "
-                f"{sql_search}"
-                f";",
-                {"current_time": int(datetime.now().timestamp())}
-        ):
-            result.append(dict(row))
+                f"  max({DB_TABLE}.{DB_MAX_MEMBERS} - {DB_TABLE}.{DB_BOOKED_MEMBERS}, 0) AS available_places "
+                f"FROM {sql_from}"
+                f"WHERE {sql_search} AND {DB_TABLE}.{DB_DATETIME} > :current_time "
+                f"ORDER BY {sql_order} "
+                f"LIMIT :limit",
+                params
+            )
+            result = cursor.fetchall()
+            cursor.close()
+
+        return result
+
+    @staticmethod
+    def search(text, limit=SEARCH_LIMIT):
+        """
+        Searches not started events by words of name, location and description.
+        Results are ranked with bm25 and cached until the next event or ticket write.
+        :param text: User's text, every word must be found as word's prefix.
+        :return: List of namedtuples as in get_events_print_info, the most relevant first.
+        """
+
+        words = _search_words(text)
+        if len(words) == 0:
+            return []
+
+        events = _print_info_cache.get_or_load(
+            ("search", tuple(words), limit),
+            lambda: Events._load_search(words, limit)
+        )
+
+        # Cached results could contain events which already started
+        current_time = int(datetime.now().timestamp())
+        return [event for event in events if event.datetime > current_time]
+
+    @staticmethod
+    def invalidate_cache():
+        _print_info_cache.clear()
+
+    @staticmethod
+    def cache_stats():
+        return _print_info_cache.stats()
+
+    @staticmethod
+    def check_booked_members():
+        """
+        Finds events whose 'bookedMembers' counter does not match their tickets.
+        :return: List of dicts with id, name, booked_members and actual_booked_members.
+        """
+
+        from data.basic import DB_ID
+
+        result = []
+        with pool.connection() as connection:
+            for row in connection.execute(
+                    f"SELECT * FROM ("
+                    f"  SELECT "
+                    f"    {DB_ID} AS id, "
+                    f"    {DB_NAME} AS name, "
+                    f"    {DB_BOOKED_MEMBERS} AS booked_members, "
+                    f"    ({actual_booked_members_sql()}) AS actual_booked_members "
+                    f"  FROM {DB_TABLE}"
+                    f") WHERE booked_members != actual_booked_members;"
+            ):
+                result.append(dict(row))
+
+        return result
+
+    @staticmethod
+    def rebuild_booked_members():
+        """
+        Recalculates 'bookedMembers' counters from tickets.
+        :return: Count of fixed events.
+        """
+
+        with pool.connection() as connection:
+            cursor = connection.execute(
+                f"UPDATE {DB_TABLE} "
+                f"SET {DB_BOOKED_MEMBERS} = ({actual_booked_members_sql()}) "
+                f"WHERE {DB_BOOKED_MEMBERS} != ({actual_booked_members_sql()});"
+            )
+            result = cursor.rowcount
+            cursor.close()
 
-        connection.close()
+        Events.invalidate_cache()
         return result
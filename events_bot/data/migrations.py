@@ -0,0 +1,310 @@
+import logging
+import sqlite3
+
+from data.basic import DB_ID
+import data.users as users
+import data.events as events
+import data.tickets as tickets
+import data.qrcodes as qrcodes
+import data.broadcasts as broadcasts
+
+"""
+migrations.py keeps DataBase schema up to date.
+Schema version is stored in 'PRAGMA user_version',
+migration MIGRATIONS[n] moves schema from version n to version n + 1.
+"""
+
+
+def _create_tables(connection):
+    # Databases created before migrations already have these tables
+    connection.execute(
+        f"CREATE TABLE IF NOT EXISTS {users.DB_TABLE} ("
+        f"{DB_ID} TEXT NOT NULL UNIQUE,"
+        f"{users.DB_TELEGRAM_ID} INTEGER NOT NULL UNIQUE,"
+        f"{users.DB_PERMISSIONS_LEVEL} INTEGER NOT NULL,"
+        f"{users.DB_ACTION} TEXT NOT NULL,"
+        f"{users.DB_ACTION_DATA} TEXT NOT NULL,"
+        f"PRIMARY KEY({DB_ID})"
+        f") WITHOUT ROWID"
+    )
+    connection.execute(
+        f"CREATE TABLE IF NOT EXISTS {events.DB_TABLE} ("
+        f"{DB_ID} TEXT NOT NULL UNIQUE,"
+        f"{events.DB_NAME} TEXT NOT NULL,"
+        f"{events.DB_DATETIME} INTEGER NOT NULL,"
+        f"{events.DB_LOCATION} TEXT NOT NULL,"
+        f"{events.DB_MAX_MEMBERS} INTEGER NOT NULL,"
+        f"{events.DB_DESCRIPTION} TEXT NOT NULL,"
+        f"PRIMARY KEY({DB_ID})"
+        f") WITHOUT ROWID"
+    )
+    connection.execute(
+        f"CREATE TABLE IF NOT EXISTS {tickets.DB_TABLE} ("
+        f"{DB_ID} TEXT NOT NULL UNIQUE,"
+        f"{tickets.DB_USER} TEXT NOT NULL,"
+        f"{tickets.DB_EVENT} TEXT NOT NULL,"
+        f"{tickets.DB_MEMBERS} INTEGER NOT NULL,"
+        f"PRIMARY KEY({DB_ID})"
+        f") WITHOUT ROWID"
+    )
+
+
+def _create_indexes(connection):
+    connection.execute(
+        f"CREATE INDEX IF NOT EXISTS {tickets.DB_TABLE}_{tickets.DB_EVENT}_{tickets.DB_MEMBERS} "
+        f"ON {tickets.DB_TABLE} ({tickets.DB_EVENT}, {tickets.DB_MEMBERS})"
+    )
+    connection.execute(
+        f"CREATE INDEX IF NOT EXISTS {tickets.DB_TABLE}_{tickets.DB_USER} "
+        f"ON {tickets.DB_TABLE} ({tickets.DB_USER}, {tickets.DB_EVENT}, {tickets.DB_MEMBERS})"
+    )
+    connection.execute(
+        f"CREATE INDEX IF NOT EXISTS {events.DB_TABLE}_{events.DB_DATETIME} "
+        f"ON {events.DB_TABLE} ({events.DB_DATETIME})"
+    )
+
+
+def _add_booked_members(connection):
+    connection.execute(
+        f"ALTER TABLE {events.DB_TABLE} "
+        f"ADD COLUMN {events.DB_BOOKED_MEMBERS} INTEGER NOT NULL DEFAULT 0"
+    )
+    connection.execute(
+        f"UPDATE {events.DB_TABLE} "
+        f"SET {events.DB_BOOKED_MEMBERS} = ({events.actual_booked_members_sql()})"
+    )
+
+    # Triggers keep the counter in the same transaction as the ticket change
+    connection.execute(
+        f"CREATE TRIGGER {tickets.DB_TABLE}_insert_{events.DB_BOOKED_MEMBERS} "
+        f"AFTER INSERT ON {tickets.DB_TABLE} BEGIN "
+        f"  UPDATE {events.DB_TABLE} "
+        f"  SET {events.DB_BOOKED_MEMBERS} = {events.DB_BOOKED_MEMBERS} + NEW.{tickets.DB_MEMBERS} "
+        f"  WHERE {DB_ID} = NEW.{tickets.DB_EVENT}; "
+        f"END"
+    )
+    connection.execute(
+        f"CREATE TRIGGER {tickets.DB_TABLE}_delete_{events.DB_BOOKED_MEMBERS} "
+        f"AFTER DELETE ON {tickets.DB_TABLE} BEGIN "
+        f"  UPDATE {events.DB_TABLE} "
+        f"  SET {events.DB_BOOKED_MEMBERS} = {events.DB_BOOKED_MEMBERS} - OLD.{tickets.DB_MEMBERS} "
+        f"  WHERE {DB_ID} = OLD.{tickets.DB_EVENT}; "
+        f"END"
+    )
+    connection.execute(
+        f"CREATE TRIGGER {tickets.DB_TABLE}_update_{events.DB_BOOKED_MEMBERS} "
+        f"AFTER UPDATE OF {tickets.DB_EVENT}, {tickets.DB_MEMBERS} ON {tickets.DB_TABLE} BEGIN "
+        f"  UPDATE {events.DB_TABLE} "
+        f"  SET {events.DB_BOOKED_MEMBERS} = {events.DB_BOOKED_MEMBERS} - OLD.{tickets.DB_MEMBERS} "
+        f"  WHERE {DB_ID} = OLD.{tickets.DB_EVENT}; "
+        f"  UPDATE {events.DB_TABLE} "
+        f"  SET {events.DB_BOOKED_MEMBERS} = {events.DB_BOOKED_MEMBERS} + NEW.{tickets.DB_MEMBERS} "
+        f"  WHERE {DB_ID} = NEW.{tickets.DB_EVENT}; "
+        f"END"
+    )
+
+
+def _create_qrcodes(connection):
+    connection.execute(
+        f"CREATE TABLE {qrcodes.DB_TABLE} ("
+        f"{qrcodes.DB_HASH} TEXT NOT NULL,"
+        f"{qrcodes.DB_PNG} BLOB NOT NULL,"
+        f"{qrcodes.DB_FILE_ID} TEXT NOT NULL DEFAULT '',"
+        f"PRIMARY KEY({qrcodes.DB_HASH})"
+        f") WITHOUT ROWID"
+    )
+
+
+def _add_reminded(connection):
+    connection.execute(
+        f"ALTER TABLE {events.DB_TABLE} "
+        f"ADD COLUMN {events.DB_REMINDED} INTEGER NOT NULL DEFAULT 0"
+    )
+
+    # Moved event must be reminded again
+    connection.execute(
+        f"CREATE TRIGGER {events.DB_TABLE}_update_{events.DB_REMINDED} "
+        f"AFTER UPDATE OF {events.DB_DATETIME} ON {events.DB_TABLE} "
+        f"WHEN NEW.{events.DB_DATETIME} != OLD.{events.DB_DATETIME} BEGIN "
+        f"  UPDATE {events.DB_TABLE} SET {events.DB_REMINDED} = 0 WHERE {DB_ID} = NEW.{DB_ID}; "
+        f"END"
+    )
+
+
+def _create_broadcasts(connection):
+    connection.execute(
+        f"CREATE TABLE {broadcasts.DB_TABLE} ("
+        f"{DB_ID} TEXT NOT NULL,"
+        f"{broadcasts.DB_TEXT} TEXT NOT NULL,"
+        f"{broadcasts.DB_AUTHOR} INTEGER NOT NULL,"
+        f"{broadcasts.DB_CREATED} REAL NOT NULL,"
+        f"{broadcasts.DB_CURSOR} TEXT NOT NULL,"
+        f"{broadcasts.DB_SENT} INTEGER NOT NULL,"
+        f"{broadcasts.DB_FAILED} INTEGER NOT NULL,"
+        f"{broadcasts.DB_FINISHED} INTEGER NOT NULL,"
+        f"PRIMARY KEY({DB_ID})"
+        f") WITHOUT ROWID"
+    )
+
+
+def _create_events_fts(connection):
+    try:
+        connection.execute(
+            f"CREATE VIRTUAL TABLE {events.DB_FTS_TABLE} USING fts5("
+            f"{DB_ID} UNINDEXED, {events.DB_NAME}, {events.DB_LOCATION}, {events.DB_DESCRIPTION}, "
+            f"tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+            f")"
+        )
+    except sqlite3.OperationalError as err:
+        logging.warning(f"Full-text search is not available, events are searched without index: {err}")
+        return
+
+    connection.execute(
+        f"INSERT INTO {events.DB_FTS_TABLE} ({DB_ID}, {events.DB_NAME}, {events.DB_LOCATION}, {events.DB_DESCRIPTION}) "
+        f"SELECT {DB_ID}, {events.DB_NAME}, {events.DB_LOCATION}, {events.DB_DESCRIPTION} FROM {events.DB_TABLE}"
+    )
+
+    # Index is changed in the same transaction as the event
+    connection.execute(
+        f"CREATE TRIGGER {events.DB_TABLE}_insert_fts "
+        f"AFTER INSERT ON {events.DB_TABLE} BEGIN "
+        f"  INSERT INTO {events.DB_FTS_TABLE} ({DB_ID}, {events.DB_NAME}, {events.DB_LOCATION}, {events.DB_DESCRIPTION}) "
+        f"  VALUES (NEW.{DB_ID}, NEW.{events.DB_NAME}, NEW.{events.DB_LOCATION}, NEW.{events.DB_DESCRIPTION}); "
+        f"END"
+    )
+    connection.execute(
+        f"CREATE TRIGGER {events.DB_TABLE}_delete_fts "
+        f"AFTER DELETE ON {events.DB_TABLE} BEGIN "
+        f"  DELETE FROM {events.DB_FTS_TABLE} WHERE {DB_ID} = OLD.{DB_ID}; "
+        f"END"
+    )
+    # Only text columns, so frequent bookedMembers updates do not touch index
+    connection.execute(
+        f"CREATE TRIGGER {events.DB_TABLE}_update_fts "
+        f"AFTER UPDATE OF {events.DB_NAME}, {events.DB_LOCATION}, {events.DB_DESCRIPTION} ON {events.DB_TABLE} BEGIN "
+        f"  UPDATE {events.DB_FTS_TABLE} SET "
+        f"    {events.DB_NAME} = NEW.{events.DB_NAME}, "
+        f"    {events.DB_LOCATION} = NEW.{events.DB_LOCATION}, "
+        f"    {events.DB_DESCRIPTION} = NEW.{events.DB_DESCRIPTION} "
+        f"  WHERE {DB_ID} = OLD.{DB_ID}; "
+        f"END"
+    )
+
+
+def _add_checked_in(connection):
+    connection.execute(
+        f"ALTER TABLE {tickets.DB_TABLE} "
+        f"ADD COLUMN {tickets.DB_CHECKED_IN} REAL"
+    )
+
+
+def _add_events_fts_rowids(connection):
+    cursor = connection.execute(
+        "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = :name",
+        {"name": events.DB_FTS_TABLE}
+    )
+    if cursor.fetchone()[0] == 0:
+        return
+
+    connection.execute(
+        f"CREATE TABLE {events.DB_FTS_ROWIDS_TABLE} ("
+        f"{DB_ID} TEXT NOT NULL,"
+        f"{events.DB_FTS_ROWID} INTEGER NOT NULL,"
+        f"PRIMARY KEY({DB_ID})"
+        f") WITHOUT ROWID"
+    )
+    connection.execute(
+        f"INSERT INTO {events.DB_FTS_ROWIDS_TABLE} ({DB_ID}, {events.DB_FTS_ROWID}) "
+        f"SELECT {DB_ID}, rowid FROM {events.DB_FTS_TABLE}"
+    )
+
+    # Index's id column is not indexed, so deleting by it scanned the whole index for every event
+    connection.execute(f"DROP TRIGGER {events.DB_TABLE}_insert_fts")
+    connection.execute(f"DROP TRIGGER {events.DB_TABLE}_delete_fts")
+    connection.execute(f"DROP TRIGGER {events.DB_TABLE}_update_fts")
+
+    connection.execute(
+        f"CREATE TRIGGER {events.DB_TABLE}_insert_fts "
+        f"AFTER INSERT ON {events.DB_TABLE} BEGIN "
+        f"  INSERT INTO {events.DB_FTS_TABLE} ({DB_ID}, {events.DB_NAME}, {events.DB_LOCATION}, {events.DB_DESCRIPTION}) "
+        f"  VALUES (NEW.{DB_ID}, NEW.{events.DB_NAME}, NEW.{events.DB_LOCATION}, NEW.{events.DB_DESCRIPTION}); "
+        f"  INSERT INTO {events.DB_FTS_ROWIDS_TABLE} ({DB_ID}, {events.DB_FTS_ROWID}) "
+        f"  VALUES (NEW.{DB_ID}, last_insert_rowid()); "
+        f"END"
+    )
+    connection.execute(
+        f"CREATE TRIGGER {events.DB_TABLE}_delete_fts "
+        f"AFTER DELETE ON {events.DB_TABLE} BEGIN "
+        f"  DELETE FROM {events.DB_FTS_TABLE} WHERE rowid = ("
+        f"    SELECT {events.DB_FTS_ROWID} FROM {events.DB_FTS_ROWIDS_TABLE} WHERE {DB_ID} = OLD.{DB_ID}"
+        f"  ); "
+        f"  DELETE FROM {events.DB_FTS_ROWIDS_TABLE} WHERE {DB_ID} = OLD.{DB_ID}; "
+        f"END"
+    )
+    connection.execute(
+        f"CREATE TRIGGER {events.DB_TABLE}_update_fts "
+        f"AFTER UPDATE OF {events.DB_NAME}, {events.DB_LOCATION}, {events.DB_DESCRIPTION} ON {events.DB_TABLE} BEGIN "
+        f"  UPDATE {events.DB_FTS_TABLE} SET "
+        f"    {events.DB_NAME} = NEW.{events.DB_NAME}, "
+        f"    {events.DB_LOCATION} = NEW.{events.DB_LOCATION}, "
+        f"    {events.DB_DESCRIPTION} = NEW.{events.DB_DESCRIPTION} "
+        f"  WHERE rowid = ("
+        f"    SELECT {events.DB_FTS_ROWID} FROM {events.DB_FTS_ROWIDS_TABLE} WHERE {DB_ID} = OLD.{DB_ID}"
+        f"  ); "
+        f"END"
+    )
+
+
+MIGRATIONS = [
+    _create_tables,
+    _create_indexes,
+    _add_booked_members,
+    _create_qrcodes,
+    _add_reminded,
+    _create_broadcasts,
+    _create_events_fts,
+    _add_checked_in,
+    _add_events_fts_rowids,
+]
+
+
+def get_version(connection):
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(connection):
+    """
+    Applies all missing migrations, each one in its own transaction.
+    :param connection: Connection opened with isolation_level=None.
+    :return: Schema version after migration.
+    """
+
+    version = get_version(connection)
+    if version > len(MIGRATIONS):
+        raise RuntimeError(
+            f"DataBase schema version {version} is newer than supported {len(MIGRATIONS)}."
+        )
+
+    # Free pages of archived rows are returned incrementally, setting takes effect
+    # in new DataBase at once, existing one is rebuilt by VACUUM after migrations
+    connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    for migration in MIGRATIONS[version:]:
+        logging.info(f"Migrating DataBase schema from version {version} ({migration.__name__})...")
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            migration(connection)
+            version += 1
+            connection.execute(f"PRAGMA user_version = {version}")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    # 2 - INCREMENTAL, VACUUM can't run in transaction, so it is not a migration
+    if connection.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        logging.info("Rebuilding DataBase to enable incremental vacuum, it is done once...")
+        connection.execute("VACUUM")
+
+    return version
@@ -0,0 +1,48 @@
+from data.connection import pool
+
+DB_TABLE = "qrcodes"
+DB_HASH = "hash"
+DB_PNG = "png"
+DB_FILE_ID = "fileId"
+
+
+class QRCodes:
+    """
+    Rendered QR-code images by hash of their payload.
+    'fileId' is Telegram's id of already uploaded image, empty if not uploaded yet.
+    """
+
+    @staticmethod
+    def get(payload_hash):
+        """
+        :return: Tuple (png, file_id) or None if image is not rendered yet.
+        """
+
+        with pool.connection() as connection:
+            cursor = connection.execute(
+                f"SELECT {DB_PNG}, {DB_FILE_ID} FROM {DB_TABLE} WHERE {DB_HASH} = :hash",
+                {"hash": payload_hash}
+            )
+            row = cursor.fetchone()
+            cursor.close()
+
+        if row is None:
+            return None
+
+        return row[DB_PNG], row[DB_FILE_ID]
+
+    @staticmethod
+    def save_png(payload_hash, png):
+        with pool.connection() as connection:
+            connection.execute(
+                f"INSERT OR IGNORE INTO {DB_TABLE} ({DB_HASH}, {DB_PNG}) VALUES (:hash, :png)",
+                {"hash": payload_hash, "png": png}
+            )
+
+    @staticmethod
+    def save_file_id(payload_hash, file_id):
+        with pool.connection() as connection:
+            connection.execute(
+                f"UPDATE {DB_TABLE} SET {DB_FILE_ID} = :file_id WHERE {DB_HASH} = :hash",
+                {"hash": payload_hash, "file_id": file_id}
+            )
@@ -0,0 +1,161 @@
+import threading
+
+from data.connection import pool
+
+"""
+session.py provides unit of work scoped to one handled update.
+Inside a session Users.get, Events.get and Tickets.get return the same
+instance for the same row, and data objects' writes are postponed
+until the session ends, when all of them are written in one transaction.
+"""
+
+_local = threading.local()
+
+
+class Session:
+
+    def __init__(self):
+        self._objects = {}
+        self._dirty = []
+        # States of loaded objects before handler changed them, by id()
+        self._states = {}
+
+    @staticmethod
+    def current():
+        """
+        Session of current thread or None.
+        """
+        return getattr(_local, "session", None)
+
+    def __enter__(self):
+        if Session.current() is not None:
+            raise RuntimeError("Session is already started in this thread.")
+        _local.session = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.session = None
+
+        if exc_type is None:
+            self.flush()
+        else:
+            # Like a failed transaction, changes of failed handler are discarded
+            self.discard()
+
+    def identity(self, table, key, load):
+        """
+        Returns already loaded object or loads it with load().
+        """
+
+        obj = self._objects.get((table, key))
+        if obj is None:
+            obj = load()
+            if obj is not None:
+                self._objects[(table, key)] = obj
+                self._objects[(table, obj.id)] = obj
+                self._states.setdefault(id(obj), (obj, obj._state()))
+
+        return obj
+
+    def add_dirty(self, obj):
+        if not any(dirty is obj for dirty in self._dirty):
+            self._dirty.append(obj)
+
+        self._objects[(obj._table, obj.id)] = obj
+
+    def flush(self):
+        """
+        Writes postponed changes in one transaction.
+        """
+
+        dirty, self._dirty = self._dirty, []
+        if len(dirty) == 0:
+            return
+
+        callbacks = []
+        _local.commit_callbacks = callbacks
+        try:
+            with pool.transaction():
+                for obj in dirty:
+                    obj.write()
+        except Exception:
+            self.discard()
+            raise
+        finally:
+            _local.commit_callbacks = None
+
+        # Written values are the new state to go back to
+        self._states = {key: (obj, obj._state()) for key, (obj, _) in self._states.items()}
+
+        for callback in callbacks:
+            callback()
+
+        for obj in dirty:
+            obj._committed()
+
+    def discard(self):
+        """
+        Drops postponed changes. Loaded objects get back values they had
+        when they were loaded, cached instances shared with other sessions
+        (Users) must not keep changes which were never written.
+        """
+
+        self._dirty = []
+        states, self._states = self._states, {}
+        self._objects = {}
+        for obj, state in states.values():
+            obj._restore(state)
+
+
+def identity(table, key, load):
+    """
+    Session.identity of current session, just load() outside of session.
+    """
+
+    session = Session.current()
+    if session is None:
+        return load()
+    return session.identity(table, key, load)
+
+
+def defer_write(obj):
+    """
+    Postpones object's write until the end of current session.
+    Writes are not postponed outside of session and inside explicit transaction.
+    :return: True if write is postponed.
+    """
+
+    session = Session.current()
+    if session is None or pool.in_transaction():
+        return False
+
+    if not obj._has_changes:
+        return True
+
+    obj._ensure_id()
+    session.add_dirty(obj)
+    return True
+
+
+def on_commit(callback):
+    """
+    Calls callback after transaction which writes current session's changes is committed,
+    callbacks of failed transaction are not called. Outside of it callback is called at once.
+    """
+
+    callbacks = getattr(_local, "commit_callbacks", None)
+    if callbacks is None:
+        callback()
+    else:
+        callbacks.append(callback)
+
+
+def in_session(func):
+    """
+    Decorator which runs function in new session.
+    """
+
+    def wrap(*args, **kwargs):
+        with Session():
+            return func(*args, **kwargs)
+    return wrap
@@ -1,5 +1,8 @@
 from datetime import datetime, timedelta
-from data.basic import DataObject, search_by_unique_value
+from data import aio
+from data.basic import DataObject, search_by_unique_value, write_many
+from data.connection import pool, namedtuple_row
+from data.session import defer_write, identity
 from data.events import Events, Event
 from data.users import User, Users
 
@@ -7,10 +10,63 @@ DB_TABLE = "tickets"
 DB_USER = "user"
 DB_EVENT = "event"
 DB_MEMBERS = "members"
+DB_CHECKED_IN = "checkedIn"
+
+# Count of rows fetched at once by Tickets.export
+EXPORT_BATCH_SIZE = 1000
+
+
+class BookingStatus:
+    """
+    Enumeration of Tickets.book results.
+    BOOKED - ticket is created.
+    NOT_ENOUGH_PLACES - event has fewer available places than requested.
+    EVENT_NOT_FOUND - event does not exist (e.g. it was deleted).
+    """
+
+    BOOKED = "BOOKED"
+    NOT_ENOUGH_PLACES = "NOT_ENOUGH_PLACES"
+    EVENT_NOT_FOUND = "EVENT_NOT_FOUND"
+
+
+class BookingResult:
+
+    def __init__(self, status, ticket=None, available_places=0):
+        """
+        Result of Tickets.book.
+        :param status: BookingStatus value.
+        :param ticket: Created Ticket if status is BOOKED.
+        :param available_places: Places left on event after booking attempt.
+        """
+
+        self.status = status
+        self.ticket = ticket
+        self.available_places = available_places
+
+
+class CheckInStatus:
+    """
+    Enumeration of Tickets.check_in results.
+    CHECKED_IN - ticket is marked as used now.
+    ALREADY_CHECKED_IN - ticket was used before.
+    TICKET_NOT_FOUND - ticket does not exist (e.g. it was deleted).
+    """
+
+    CHECKED_IN = "CHECKED_IN"
+    ALREADY_CHECKED_IN = "ALREADY_CHECKED_IN"
+    TICKET_NOT_FOUND = "TICKET_NOT_FOUND"
 
 
 class Ticket(DataObject):
 
+    __slots__ = ("_user", "_event", "_members", "_checked_in")
+
+    _columns = {
+        "user": DB_USER,
+        "event": DB_EVENT,
+        "members": DB_MEMBERS,
+    }
+
     def __init__(self, row=None):
         """
         Manages one 'tickets' table object.
@@ -23,6 +79,7 @@ class Ticket(DataObject):
         self._user = ""
         self._event = ""
         self._members = 0
+        self._checked_in = None
 
         if row is None:
             # Creating new user
@@ -31,6 +88,8 @@ class Ticket(DataObject):
         self._user = row[DB_USER]
         self._event = row[DB_EVENT]
         self._members = row[DB_MEMBERS]
+        if row[DB_CHECKED_IN] is not None:
+            self._checked_in = datetime.fromtimestamp(row[DB_CHECKED_IN])
 
     # Public properties
 
@@ -85,18 +144,36 @@ class Ticket(DataObject):
 
         self._members = value
 
-    # Instance methods
+    @property
+    def checked_in(self):
+        """
+        Datetime when ticket was used at the entrance or None.
+        It is changed only by Tickets.check_in, so ticket's writes do not overwrite it.
+        """
+        return self._checked_in
 
-    def write(self):
+    # Instance methods
 
+    def _values(self):
         if self._user is None or self._event is None:
             raise ValueError('User and event must be filled before writing to DataBase.')
 
-        super(Ticket, self).write({
+        return {
             DB_USER: self._user,
             DB_EVENT: self._event,
-            DB_MEMBERS: self.members
-        })
+            DB_MEMBERS: self._members
+        }
+
+    def write(self):
+
+        if defer_write(self) or not self._has_changes:
+            return
+
+        super(Ticket, self).write()
+        Events.invalidate_cache()
+
+    def _committed(self):
+        Events.invalidate_cache()
 
 
 class Tickets:
@@ -104,30 +181,211 @@ class Tickets:
     @staticmethod
     def get(ticket_id):
 
-        if isinstance(ticket_id, str):
-            row = search_by_unique_value(DB_TABLE, ticket_id)
-        else:
+        if not isinstance(ticket_id, str):
             raise TypeError("ticket_id must be string.")
 
-        if row is None:
-            return None
+        def load():
+            row = search_by_unique_value(DB_TABLE, ticket_id)
+            if row is None:
+                return None
+            return Ticket(row)
 
-        return Ticket(row)
+        return identity(DB_TABLE, ticket_id, load)
 
     @staticmethod
-    def get_user_tickets_for_print(user_id):
-        import sqlite3
-        import envars
+    def write_many(tickets):
+        """
+        Writes changes of many tickets in one transaction.
+        :return: Count of written tickets.
+        """
+
+        written = write_many(tickets)
+        if len(written) > 0:
+            Events.invalidate_cache()
+        return len(written)
+
+    @staticmethod
+    def get_event_tickets(event_id):
+        """
+        Gets all tickets for event.
+        """
+
+        result = []
+        with pool.connection() as connection:
+            for row in connection.execute(
+                    f"SELECT * FROM {DB_TABLE} WHERE {DB_EVENT} = :event",
+                    {"event": event_id}
+            ):
+                result.append(Ticket(row))
+
+        return result
+
+    @staticmethod
+    def book(user_id, event_id, members):
+        """
+        Checks available places and creates ticket in one write transaction,
+        so concurrent bookings can not oversell event.
+        :param user_id: User's internal db id or telegram user id.
+        :param event_id: Event's id.
+        :param members: Count of places to book.
+        :return: BookingResult.
+        """
+
         from data import events
         from data.basic import DB_ID
 
-        connection = sqlite3.connect(envars.db_path)
-        connection.row_factory = sqlite3.Row
+        ticket = Ticket()
+        ticket.user = user_id
+        ticket.event = event_id
+        ticket.members = members
 
-        cursor = connection.cursor()
+        with pool.transaction(immediate=True) as connection:
+            cursor = connection.execute(
+                f"SELECT {events.DB_MAX_MEMBERS}, {events.DB_BOOKED_MEMBERS} "
+                f"FROM {events.DB_TABLE} WHERE {DB_ID} = :event",
+                {"event": event_id}
+            )
+            row = cursor.fetchone()
+            cursor.close()
 
-        result = []
-        for row in cursor.execute(
+            if row is None:
+                return BookingResult(BookingStatus.EVENT_NOT_FOUND)
+
+            max_members = row[events.DB_MAX_MEMBERS]
+            available_places = max(max_members - row[events.DB_BOOKED_MEMBERS], 0)
+
+            if max_members != 0 and available_places < members:
+                return BookingResult(BookingStatus.NOT_ENOUGH_PLACES, available_places=available_places)
+
+            ticket.write()
+
+        # Snapshot could be reloaded between ticket write and commit
+        Events.invalidate_cache()
+
+        if max_members != 0:
+            available_places -= members
+
+        return BookingResult(BookingStatus.BOOKED, ticket, available_places)
+
+    @staticmethod
+    async def abook(user_id, event_id, members):
+        """
+        Tickets.book for asyncio code, runs in DataBase's writer thread.
+        :return: BookingResult.
+        """
+        return await aio.write(Tickets.book, user_id, event_id, members)
+
+    @staticmethod
+    def check_in(ticket_id, checked_in=None):
+        """
+        Marks ticket as used, ticket can be used only once.
+        :param checked_in: Datetime of check-in, by default - now.
+        :return: CheckInStatus.
+        """
+        return Tickets.check_in_many([(ticket_id, checked_in)])[ticket_id]
+
+    @staticmethod
+    def check_in_many(check_ins):
+        """
+        Marks many tickets as used in one transaction.
+        Every ticket is marked by conditional update, so concurrent check-ins
+        of one ticket (e.g. by scanners on different entrances) succeed only once.
+        :param check_ins: Iterable of tuples (ticket's id, datetime of check-in or None - now).
+        :return: Dict {ticket's id: CheckInStatus}.
+        """
+
+        from data.basic import DB_ID
+
+        result = {}
+        with pool.transaction(immediate=True) as connection:
+            for ticket_id, checked_in in check_ins:
+                if checked_in is None:
+                    checked_in = datetime.now()
+
+                cursor = connection.execute(
+                    f"UPDATE {DB_TABLE} SET {DB_CHECKED_IN} = :checked_in "
+                    f"WHERE {DB_ID} = :id AND {DB_CHECKED_IN} IS NULL",
+                    {"id": ticket_id, "checked_in": checked_in.timestamp()}
+                )
+                if cursor.rowcount > 0:
+                    result[ticket_id] = CheckInStatus.CHECKED_IN
+                    continue
+
+                cursor = connection.execute(
+                    f"SELECT count(*) FROM {DB_TABLE} WHERE {DB_ID} = :id",
+                    {"id": ticket_id}
+                )
+                exists = cursor.fetchone()[0] > 0
+                cursor.close()
+                result[ticket_id] = CheckInStatus.ALREADY_CHECKED_IN if exists else CheckInStatus.TICKET_NOT_FOUND
+
+        return result
+
+    @staticmethod
+    def get_event_check_in_list(event_id):
+        """
+        Gets data scanner needs to check event's tickets without DataBase.
+        :return: List of namedtuples with id, members and checked_in (timestamp or None).
+        """
+
+        from data.basic import DB_ID
+
+        with pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.row_factory = namedtuple_row
+            cursor.execute(
+                f"SELECT {DB_ID} AS id, {DB_MEMBERS} AS members, {DB_CHECKED_IN} AS checked_in "
+                f"FROM {DB_TABLE} WHERE {DB_EVENT} = :event",
+                {"event": event_id}
+            )
+            result = cursor.fetchall()
+            cursor.close()
+
+        return result
+
+    @staticmethod
+    def get_event_holders(event_id):
+        """
+        Gets not banned users who have tickets for event.
+        :return: List of namedtuples with telegram_id and members - sum of user's tickets.
+        """
+
+        from data import users
+        from data.basic import DB_ID
+
+        with pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.row_factory = namedtuple_row
+            cursor.execute(
+                f"SELECT "
+                f"  {users.DB_TABLE}.{users.DB_TELEGRAM_ID} AS telegram_id, "
+                f"  sum({DB_TABLE}.{DB_MEMBERS}) AS members "
+                f"FROM {DB_TABLE} AS {DB_TABLE} INNER JOIN {users.DB_TABLE} AS {users.DB_TABLE} "
+                f"  ON {users.DB_TABLE}.{DB_ID} = {DB_TABLE}.{DB_USER} "
+                f"WHERE {DB_TABLE}.{DB_EVENT} = :event "
+                f"  AND {users.DB_TABLE}.{users.DB_PERMISSIONS_LEVEL} > {users.PermissionsLevels.BANNED} "
+                f"GROUP BY {DB_TABLE}.{DB_USER}",
+                {"event": event_id}
+            )
+            result = cursor.fetchall()
+            cursor.close()
+
+        return result
+
+    @staticmethod
+    def get_user_tickets_for_print(user_id):
+        """
+        :return: List of namedtuples with id, members, name and datetime
+            of user's tickets for not finished events.
+        """
+
+        from data import events
+        from data.basic import DB_ID
+
+        with pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.row_factory = namedtuple_row
+            cursor.execute(
                 f"SELECT "
                 f"  {DB_TABLE}.{DB_ID} AS id, "
                 f"  {DB_TABLE}.{DB_MEMBERS} AS members, "
@@ -137,8 +395,61 @@ class Tickets:
                 f"  ON {DB_TABLE}.{DB_EVENT} = {events.DB_TABLE}.{DB_ID} "
                 f"WHERE {DB_TABLE}.{DB_USER} = :user_id AND {events.DB_TABLE}.{events.DB_DATETIME} >= :datetime",
                 {"user_id": user_id, "datetime": (datetime.now() - timedelta(1)).timestamp()}
-        ):
-            result.append(dict(row))
+            )
+            result = cursor.fetchall()
+            cursor.close()
 
-        connection.close()
         return result
+
+    @staticmethod
+    def export(event_id=None, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Generator of tickets joined with their events and users,
+        ordered by event's datetime.
+        Rows are fetched in batches, so memory usage does not depend on tickets count.
+        :param event_id: Export only this event's tickets, None - all tickets.
+        :return: Generator of namedtuples with id, members, event, name, datetime,
+            location, user and telegram_id (None if user does not exist).
+        """
+
+        from data import events
+        from data import users
+        from data.basic import DB_ID
+
+        sql_search = ""
+        params = {}
+        if event_id is not None:
+            sql_search = f"WHERE {events.DB_TABLE}.{DB_ID} = :event "
+            params["event"] = event_id
+
+        with pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.row_factory = namedtuple_row
+            # CROSS JOIN keeps events as outer loop, so rows come in events_datetime
+            # index order without sorting all tickets in temporary B-tree
+            cursor.execute(
+                f"SELECT "
+                f"  {DB_TABLE}.{DB_ID} AS id, "
+                f"  {DB_TABLE}.{DB_MEMBERS} AS members, "
+                f"  {events.DB_TABLE}.{DB_ID} AS event, "
+                f"  {events.DB_TABLE}.{events.DB_NAME} AS name, "
+                f"  {events.DB_TABLE}.{events.DB_DATETIME} AS datetime, "
+                f"  {events.DB_TABLE}.{events.DB_LOCATION} AS location, "
+                f"  {DB_TABLE}.{DB_USER} AS user, "
+                f"  {users.DB_TABLE}.{users.DB_TELEGRAM_ID} AS telegram_id "
+                f"FROM {events.DB_TABLE} AS {events.DB_TABLE} "
+                f"  CROSS JOIN {DB_TABLE} AS {DB_TABLE} ON {DB_TABLE}.{DB_EVENT} = {events.DB_TABLE}.{DB_ID} "
+                f"  LEFT JOIN {users.DB_TABLE} AS {users.DB_TABLE} ON {users.DB_TABLE}.{DB_ID} = {DB_TABLE}.{DB_USER} "
+                f"{sql_search}"
+                f"ORDER BY {events.DB_TABLE}.{events.DB_DATETIME}, {events.DB_TABLE}.{DB_ID}",
+                params
+            )
+
+            try:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if len(rows) == 0:
+                        break
+                    yield from rows
+            finally:
+                cursor.close()
@@ -1,4 +1,12 @@
-from data.basic import DataObject, search_by_unique_value
+import logging
+import threading
+
+from data import aio
+from data.basic import DataObject, search_by_unique_value, write_many, DB_ID
+from data.cache import LRUCache
+from data.connection import pool, namedtuple_row
+from data.session import defer_write, identity, on_commit
+import envars
 
 DB_TABLE = "users"
 DB_TELEGRAM_ID = "telegramId"
@@ -6,6 +14,15 @@ DB_PERMISSIONS_LEVEL = "permissionsLevel"
 DB_ACTION = "action"
 DB_ACTION_DATA = "actionData"
 
+# Users by telegram id
+_users_cache = LRUCache(envars.users_cache_size, envars.users_cache_ttl)
+
+# Telegram id: (User, its action values to write), values are copied when user is queued,
+# so writer does not read attributes which another thread is changing
+_pending = {}
+_pending_lock = threading.Lock()
+_writer_stop = threading.Event()
+
 
 class PermissionsLevels:
     """
@@ -29,6 +46,7 @@ class ActionTypes:
     IDLE = ""
 
     # User should click on inline keyboard
+    # (not set anymore as buttons' callback data describes itself)
     SELECT_EVENT = "SELECT_EVENT"
     SELECT_TICKET = "SELECT_TICKET"
     SELECT_ACTION_ON_EVENT = "SELECT_ACTION_ON_EVENT"
@@ -42,6 +60,18 @@ class ActionTypes:
 
 class User(DataObject):
 
+    __slots__ = ("_telegram_id", "_permissions_level", "_action", "_action_data")
+
+    _columns = {
+        "telegram_id": DB_TELEGRAM_ID,
+        "permissions_level": DB_PERMISSIONS_LEVEL,
+        "action": DB_ACTION,
+        "action_data": DB_ACTION_DATA,
+    }
+
+    # Properties which are written immediately, others are queued
+    _durable = {"telegram_id", "permissions_level"}
+
     def __init__(self, row=None):
         """
         Manages one 'users' table object.
@@ -120,17 +150,54 @@ class User(DataObject):
 
     # Instance methods
 
-    def write(self):
-        """
-        Creates or updates user in database
-        """
-
-        super(User, self).write({
+    def _values(self):
+        return {
             DB_TELEGRAM_ID: self._telegram_id,
             DB_PERMISSIONS_LEVEL: self._permissions_level,
             DB_ACTION: self._action,
             DB_ACTION_DATA: self._action_data
-        })
+        }
+
+    def _take_pending(self):
+        """
+        Removes user from write queue, queued changes are marked
+        to be written with the next write.
+        """
+
+        with _pending_lock:
+            if _pending.get(self._telegram_id, (None,))[0] is self:
+                del _pending[self._telegram_id]
+                self._dirty = self._dirty.union(("action", "action_data"))
+
+    def _queue(self):
+        """
+        Adds user to write queue with copy of current action values.
+        """
+
+        with _pending_lock:
+            _pending[self._telegram_id] = (self, {
+                "id": self._id, "action": self._action, "action_data": self._action_data
+            })
+
+    def write(self):
+        """
+        Creates or updates user in database.
+        Changes of action and action data only are queued
+        and written in batches by Users.flush.
+        """
+
+        if defer_write(self) or not self._has_changes:
+            return
+
+        if not self._new and self._dirty.isdisjoint(User._durable):
+            self._dirty = frozenset()
+            # Changes of session are queued only after its transaction is committed
+            on_commit(self._queue)
+            return
+
+        self._take_pending()
+        super(User, self).write()
+        _users_cache.put(self._telegram_id, self)
 
 
 class Users:
@@ -139,18 +206,158 @@ class Users:
     def get(user_id):
         """
         Gets User instance by its internal or telegram id.
+        Users are cached by telegram id, so the same instance is returned
+        until it is evicted.
         :param user_id: User's internal db id or telegram user id.
         :return: If User exist returns its instance else returns None.
         """
 
-        if isinstance(user_id, str):
-            row = search_by_unique_value(DB_TABLE, user_id)
-        elif isinstance(user_id, int):
+        return identity(DB_TABLE, user_id, lambda: Users._get(user_id))
+
+    @staticmethod
+    async def aget(user_id):
+        """
+        Users.get for asyncio code, cached user is returned without leaving the event loop.
+        """
+
+        if isinstance(user_id, int):
+            user = _users_cache.get(user_id)
+            if user is not None:
+                return user
+
+        return await aio.read(Users.get, user_id)
+
+    @staticmethod
+    def _get(user_id):
+        if isinstance(user_id, int):
+            user = _users_cache.get(user_id)
+            if user is not None:
+                return user
+
+            with _pending_lock:
+                user = _pending.get(user_id, (None,))[0]
+            if user is not None:
+                return _users_cache.setdefault(user_id, user)
+
             row = search_by_unique_value(DB_TABLE, user_id, DB_TELEGRAM_ID)
+
+        elif isinstance(user_id, str):
+            row = search_by_unique_value(DB_TABLE, user_id)
+
         else:
             raise TypeError("user_id must be string or integer.")
 
         if row is None:
             return None
 
-        return User(row)
+        telegram_id = row[DB_TELEGRAM_ID]
+        with _pending_lock:
+            user = _pending.get(telegram_id, (None,))[0]
+        if user is None:
+            user = User(row)
+
+        return _users_cache.setdefault(telegram_id, user)
+
+    @staticmethod
+    def write_many(users):
+        """
+        Writes changes of many users, including queued ones, in one transaction.
+        :return: Count of written users.
+        """
+
+        users = list(users)
+        for user in users:
+            user._take_pending()
+
+        written = write_many(users)
+        for user in written:
+            _users_cache.put(user.telegram_id, user)
+        return len(written)
+
+    @staticmethod
+    def get_recipients(after, limit):
+        """
+        Gets page of not banned users ordered by id for broadcasting.
+        :param after: Id of the last user of previous page, "" - the first page.
+        :return: List of namedtuples with id and telegram_id.
+        """
+
+        with pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.row_factory = namedtuple_row
+            cursor.execute(
+                f"SELECT {DB_ID} AS id, {DB_TELEGRAM_ID} AS telegram_id FROM {DB_TABLE} "
+                f"WHERE {DB_ID} > :after AND {DB_PERMISSIONS_LEVEL} > {PermissionsLevels.BANNED} "
+                f"ORDER BY {DB_ID} LIMIT :limit",
+                {"after": after, "limit": limit}
+            )
+            result = cursor.fetchall()
+            cursor.close()
+
+        return result
+
+    @staticmethod
+    def flush():
+        """
+        Writes queued action changes of all users in one transaction.
+        :return: Count of written users.
+        """
+
+        with _pending_lock:
+            pending = dict(_pending)
+            _pending.clear()
+
+        if len(pending) == 0:
+            return 0
+
+        try:
+            with pool.transaction() as connection:
+                connection.executemany(
+                    f"UPDATE {DB_TABLE} SET {DB_ACTION} = :action, {DB_ACTION_DATA} = :action_data "
+                    f"WHERE {DB_ID} = :id",
+                    [values for _, values in pending.values()]
+                )
+        except Exception:
+            with _pending_lock:
+                for telegram_id, entry in pending.items():
+                    _pending.setdefault(telegram_id, entry)
+            raise
+
+        return len(pending)
+
+    @staticmethod
+    def start_writer(interval=None):
+        """
+        Starts daemon thread which calls Users.flush every interval seconds.
+        """
+
+        if interval is None:
+            interval = envars.users_flush_interval
+
+        def run():
+            while not _writer_stop.wait(interval):
+                try:
+                    Users.flush()
+                except Exception as err:
+                    logging.error(f"Failed to write users' actions: {err}")
+
+        _writer_stop.clear()
+        thread = threading.Thread(target=run, name="UsersWriter", daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def stop_writer():
+        """
+        Stops writer thread and writes all queued changes.
+        """
+
+        _writer_stop.set()
+        Users.flush()
+
+    @staticmethod
+    def cache_stats():
+        result = _users_cache.stats()
+        with _pending_lock:
+            result["pending"] = len(_pending)
+        return result
@@ -0,0 +1,153 @@
+import logging
+import queue
+import threading
+
+import telebot
+
+"""
+dispatcher.py processes Telegram updates on a pool of worker threads.
+Updates from the same user always go to the same worker,
+so user's actions are handled in the order they were sent.
+"""
+
+_STOP = object()
+
+_USER_UPDATE_FIELDS = (
+    "message",
+    "edited_message",
+    "callback_query",
+    "inline_query",
+    "chosen_inline_result",
+    "shipping_query",
+    "pre_checkout_query",
+)
+
+
+def update_key(update):
+    """
+    Key that defines update's processing order: sender's telegram id
+    or update id for updates without sender.
+    """
+
+    for field in _USER_UPDATE_FIELDS:
+        obj = getattr(update, field, None)
+        if obj is not None and getattr(obj, "from_user", None) is not None:
+            return obj.from_user.id
+
+    return update.update_id
+
+
+class UpdateDispatcher:
+
+    def __init__(self, process, workers, queue_size):
+        """
+        :param process: Function called with every update.
+        :param workers: Count of worker threads.
+        :param queue_size: Max count of waiting updates per worker,
+            when queue is full submit blocks or raises queue.Full.
+        """
+
+        self._process = process
+        self._queues = [queue.Queue(queue_size) for _ in range(workers)]
+        self._threads = []
+
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._processed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._max_depth = 0
+
+    def start(self):
+        for number, updates in enumerate(self._queues):
+            thread = threading.Thread(
+                target=self._work, args=(updates,), name=f"UpdateWorker-{number}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """
+        Processes already submitted updates and stops workers.
+        """
+
+        for updates in self._queues:
+            updates.put(_STOP)
+
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, update, block=True, timeout=None):
+        """
+        Queues update for processing.
+        :raises queue.Full: If block is False (or timeout passed) and worker's queue is full.
+        """
+
+        updates = self._queues[hash(update_key(update)) % len(self._queues)]
+
+        try:
+            updates.put(update, block, timeout)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise
+
+        depth = updates.qsize()
+        with self._lock:
+            self._submitted += 1
+            if depth > self._max_depth:
+                self._max_depth = depth
+
+    def _work(self, updates):
+        while True:
+            update = updates.get()
+            if update is _STOP:
+                return
+
+            try:
+                self._process(update)
+            except Exception as err:
+                logging.error(f"Failed to process update {update.update_id}: {err}")
+                with self._lock:
+                    self._failed += 1
+
+            with self._lock:
+                self._processed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queues": [updates.qsize() for updates in self._queues],
+                "submitted": self._submitted,
+                "processed": self._processed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "max_depth": self._max_depth,
+            }
+
+
+class DispatchingTeleBot(telebot.TeleBot):
+
+    def __init__(self, token, **kwargs):
+        """
+        TeleBot which passes received updates to dispatcher instead of
+        handling them on polling thread.
+        Handlers are called directly by dispatcher's workers.
+        """
+
+        kwargs["threaded"] = False
+        super().__init__(token, **kwargs)
+        self.dispatcher = None
+
+    def process_new_updates(self, updates):
+        if self.dispatcher is None:
+            return super().process_new_updates(updates)
+
+        for update in updates:
+            if update.update_id > self.last_update_id:
+                self.last_update_id = update.update_id
+            self.dispatcher.submit(update)
+
+    def process_update(self, update):
+        super().process_new_updates([update])
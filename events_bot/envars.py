@@ -28,3 +28,131 @@ db_path = _get_env_var("DB")
 Admin users telegram ids separated by :
 """
 admin_users = [int(x) for x in _get_env_var("ADMIN_USERS", "").split(':') if x != ""]
+
+"""
+Seconds after which cached events list is reloaded even without writes
+(e.g. to see events imported by another process)
+"""
+events_cache_ttl = int(_get_env_var("EVENTS_CACHE_TTL", "60"))
+
+"""
+Max count of users kept in memory
+"""
+users_cache_size = int(_get_env_var("USERS_CACHE_SIZE", "10000"))
+
+"""
+Seconds after which cached user is reloaded from database
+"""
+users_cache_ttl = int(_get_env_var("USERS_CACHE_TTL", "600"))
+
+"""
+Seconds between batched writes of users' actions
+"""
+users_flush_interval = float(_get_env_var("USERS_FLUSH_INTERVAL", "1"))
+
+"""
+Count of threads handling updates
+"""
+workers = int(_get_env_var("WORKERS", "4"))
+
+"""
+Max count of updates waiting for every worker thread
+"""
+queue_size = int(_get_env_var("QUEUE_SIZE", "100"))
+
+"""
+How updates are received: "polling" or "webhook"
+"""
+mode = _get_env_var("MODE", "polling")
+
+"""
+Webhook server address and URL path Telegram sends updates to
+"""
+webhook_host = _get_env_var("WEBHOOK_HOST", "127.0.0.1")
+webhook_port = int(_get_env_var("WEBHOOK_PORT", "8443"))
+webhook_path = _get_env_var("WEBHOOK_PATH", "/")
+
+"""
+Secret token checked in every webhook request, required in webhook mode,
+empty - random token is registered with webhook_url
+"""
+webhook_secret = _get_env_var("WEBHOOK_SECRET", "")
+
+"""
+Public webhook URL registered in Telegram on start, empty - not registered
+"""
+webhook_url = _get_env_var("WEBHOOK_URL", "")
+
+"""
+Key for signing inline buttons' callback data, empty - not signed
+"""
+callback_secret = _get_env_var("CALLBACK_SECRET", "")
+
+"""
+Minutes before event's start when ticket holders are reminded, 0 - reminders are disabled
+"""
+reminder_lead_time = int(_get_env_var("REMINDER_LEAD_TIME", "60"))
+
+"""
+Max count of messages sent per second by all outbox's workers and to one chat
+"""
+outbox_rate = float(_get_env_var("OUTBOX_RATE", "30"))
+outbox_chat_rate = float(_get_env_var("OUTBOX_CHAT_RATE", "1"))
+
+"""
+Count of threads sending messages to Telegram
+"""
+outbox_workers = int(_get_env_var("OUTBOX_WORKERS", "8"))
+
+"""
+Seconds Telegram caches bot's answers to inline queries
+"""
+inline_cache_time = int(_get_env_var("INLINE_CACHE_TIME", "60"))
+
+"""
+Address of HTTP server which exports metrics in Prometheus format, port 0 - server is not started
+"""
+metrics_host = _get_env_var("METRICS_HOST", "127.0.0.1")
+metrics_port = int(_get_env_var("METRICS_PORT", "0"))
+
+"""
+Interval (in seconds) of logging metrics' summary, 0 - summary is not logged
+"""
+metrics_log_interval = int(_get_env_var("METRICS_LOG_INTERVAL", "0"))
+
+"""
+Key for signing tickets' QR-codes, empty - not signed
+"""
+ticket_secret = _get_env_var("TICKET_SECRET", "")
+
+"""
+Count of processes rendering QR-codes, 0 - rendered by bot's process
+"""
+qr_workers = int(_get_env_var("QR_WORKERS", str(os.cpu_count() or 1)))
+
+"""
+Path to archive DataBase of past events, empty - events are not archived
+"""
+archive_db = _get_env_var("ARCHIVE_DB", "")
+
+"""
+Age (in days) of events moved to archive DataBase by bot once a day, 0 - bot does not archive events
+"""
+archive_horizon_days = int(_get_env_var("ARCHIVE_HORIZON_DAYS", "0"))
+
+"""
+Directory of scheduled DataBase's snapshots, empty - snapshots are not written
+"""
+backup_dir = _get_env_var("BACKUP_DIR", "")
+
+"""
+Interval (in minutes) between snapshots and count of the newest snapshots which are kept,
+0 - all snapshots are kept
+"""
+backup_interval = int(_get_env_var("BACKUP_INTERVAL", "1440"))
+backup_keep = int(_get_env_var("BACKUP_KEEP", "7"))
+
+"""
+Compression of snapshots: "gzip", "zstd" (needs 'zstandard' package) or "none"
+"""
+backup_compression = _get_env_var("BACKUP_COMPRESSION", "gzip")
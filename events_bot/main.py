@@ -1,12 +1,25 @@
 from datetime import datetime
 import logging
 import os
+import secrets
+import shutil
+import tempfile
 import telebot
-import qrcode
+import callbacks
 import messages
+import qr
+from callbacks import CallbackActions
+from broadcast import Broadcaster
+from dispatcher import DispatchingTeleBot, UpdateDispatcher
+from metrics import registry
+from outbox import Outbox, Lanes
 from data.users import User, Users, PermissionsLevels, ActionTypes
-from data.events import Events, Event
-from data.tickets import Ticket, Tickets
+from data.events import Events, Event, EventsPage, SEARCH_LIMIT
+from data.tickets import Tickets, BookingStatus
+from data.connection import pool
+from data import archive
+from data.qrcodes import QRCodes
+from data.session import in_session
 
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s::%(levelname)s::%(message)s", datefmt="%Y-%m-%dT%H:%M:%S")
@@ -21,46 +34,13 @@ except EnvironmentError as e:
     exit(1)
 logging.debug("Got environment variables.")
 
-# Connect to db
-
-db_path = envars.db_path
-logging.debug(f"Checking DataBase path '{db_path}'...")
-
-if not os.path.exists(db_path):
-    logging.info(f"Creating new DataBase in '{db_path}'...")
-    import data
-
-    data.init_db(db_path)
-    logging.info(f"Created new DataBase.")
-
-if not os.path.isfile(db_path):
-    logging.error(f"Incorrect DataBase path '{db_path}'.")
-    exit(1)
-
-logging.debug("DataBase path exists.")
-
-# Update permissions for admin users
-
-logging.debug("Setting permissions level for admin users...")
-
-for admin_user_id in envars.admin_users:
-
-    admin_user = Users.get(admin_user_id)
-    if admin_user is None:
-        logging.debug("Creating new admin user")
-        admin_user = User()
-
-    admin_user.telegram_id = admin_user_id
-    admin_user.permissions_level = PermissionsLevels.ADMIN
-
-    admin_user.write()
-
-logging.debug("Set permissions level for admin users.")
-
 # Create Telegram Bot
 
 logging.debug("Creating bot...")
-bot = telebot.TeleBot(envars.bot_token, parse_mode="MARKDOWN")
+bot = DispatchingTeleBot(envars.bot_token, parse_mode="MARKDOWN")
+bot.dispatcher = UpdateDispatcher(bot.process_update, envars.workers, envars.queue_size)
+outbox = Outbox(bot, envars.outbox_rate, envars.outbox_chat_rate, envars.outbox_workers)
+broadcaster = Broadcaster(outbox)
 logging.debug("Bot created.")
 
 # Set handlers
@@ -85,13 +65,15 @@ def handlers_wrapper(permissions_level=PermissionsLevels.USER):
 
     @try_wrapper
     def decorator(func):
+        @registry.instrumented(func.__name__)
+        @in_session
         def wrap(message):
             logging.debug(f"Got new message on {func.__name__} handler")
 
             # Check chat as this bot will not work in groups
 
             if message.chat.type != 'private':
-                bot.reply_to(message, messages.only_private_chats())
+                outbox.reply_to(message, messages.only_private_chats())
                 bot.leave_chat(message.chat.id)
                 logging.debug(f"Left non-private chat with id '{message.chat.id}'")
                 return
@@ -118,7 +100,7 @@ def handlers_wrapper(permissions_level=PermissionsLevels.USER):
 
             if user.permissions_level < permissions_level:
                 logging.debug(f"No permissions for action '{func.__name__}' by user '{telegram_user_id}'.")
-                bot.reply_to(message, messages.no_permissions())
+                outbox.reply_to(message, messages.no_permissions())
                 return
 
             func(message, user)
@@ -133,16 +115,51 @@ def handlers_wrapper(permissions_level=PermissionsLevels.USER):
 def bot_start(message, user):
     user.action = ActionTypes.IDLE
     user.write()
-    bot.reply_to(message, messages.welcome_and_help(user.permissions_level >= PermissionsLevels.ADMIN))
+    outbox.reply_to(message, messages.welcome_and_help(user.permissions_level >= PermissionsLevels.ADMIN))
 
 
-def _get_events_keyboard(events):
+def _reset_action(user):
+    # Cancels waiting for text input, button taps don't depend on action
+    if user.action != ActionTypes.IDLE:
+        user.action = ActionTypes.IDLE
+        user.write()
+
+
+def _callback_button(text, action, object_id, **kwargs):
+    return telebot.types.InlineKeyboardButton(
+        text=text,
+        callback_data=callbacks.encode(callbacks.Callback(action, object_id, **kwargs))
+    )
+
+
+def _get_events_keyboard(page, available_only, include_archive=False):
     keyboard = telebot.types.InlineKeyboardMarkup(row_width=1)
-    for event in events:
-        keyboard.add(telebot.types.InlineKeyboardButton(
-            text=f"{datetime.fromtimestamp(event['datetime']).strftime(messages.dt_format)}: {event['name']}",
-            callback_data=event['id']
+    for event in page.events:
+        keyboard.add(_callback_button(
+            f"{datetime.fromtimestamp(event.datetime).strftime(messages.dt_format)}: {event.name}",
+            CallbackActions.SELECT_EVENT, event.id
+        ))
+
+    if len(page.events) == 0:
+        return keyboard
+
+    navigation = []
+    if page.has_previous:
+        cursor_datetime, cursor_id = page.first
+        navigation.append(_callback_button(
+            "◀", CallbackActions.EVENTS_PAGE, cursor_id,
+            available_only=available_only, backward=True, cursor_datetime=cursor_datetime,
+            include_archive=include_archive
+        ))
+    if page.has_next:
+        cursor_datetime, cursor_id = page.last
+        navigation.append(_callback_button(
+            "▶", CallbackActions.EVENTS_PAGE, cursor_id,
+            available_only=available_only, backward=False, cursor_datetime=cursor_datetime,
+            include_archive=include_archive
         ))
+    if len(navigation) > 0:
+        keyboard.row(*navigation)
 
     return keyboard
 
@@ -150,11 +167,10 @@ def _get_events_keyboard(events):
 @bot.message_handler(commands=['events'])
 @handlers_wrapper(permissions_level=PermissionsLevels.USER)
 def get_events(message, user):
-    user.action = ActionTypes.SELECT_EVENT
-    user.write()
+    _reset_action(user)
 
-    events = Events.get_events_print_info(True)
-    bot.reply_to(message, messages.events_list(events), reply_markup=_get_events_keyboard(events))
+    page = Events.get_events_page(True)
+    outbox.reply_to(message, messages.events_list(page.events), reply_markup=_get_events_keyboard(page, True))
 
 
 @bot.message_handler(commands=['tickets'])
@@ -162,22 +178,21 @@ def get_events(message, user):
 def get_tickets(message, user):
     tickets = Tickets.get_user_tickets_for_print(user.id)
     if len(tickets) == 0:
-        bot.reply_to(message, messages.no_tickets())
+        outbox.reply_to(message, messages.no_tickets())
         return
 
     keyboard = telebot.types.InlineKeyboardMarkup(row_width=1)
 
     for ticket in tickets:
-        keyboard.add(telebot.types.InlineKeyboardButton(
-            text=f"{datetime.fromtimestamp(ticket['datetime']).strftime(messages.dt_format)} "
-                 f"{ticket['name']}: {ticket['members']} мест",
-            callback_data=ticket['id']
+        keyboard.add(_callback_button(
+            f"{datetime.fromtimestamp(ticket.datetime).strftime(messages.dt_format)} "
+            f"{ticket.name}: {ticket.members} мест",
+            CallbackActions.SELECT_TICKET, ticket.id
         ))
 
-    user.action = ActionTypes.SELECT_TICKET
-    user.write()
+    _reset_action(user)
 
-    bot.reply_to(message, messages.tickets_list_title(), reply_markup=keyboard)
+    outbox.reply_to(message, messages.tickets_list_title(), reply_markup=keyboard)
 
 
 @bot.message_handler(commands=['newevent'])
@@ -185,49 +200,142 @@ def get_tickets(message, user):
 def new_event(message, user):
     user.action = ActionTypes.ENTER_NEW_EVENT_PARAMS
     user.write()
-    bot.reply_to(message, messages.new_event_start())
+    outbox.reply_to(message, messages.new_event_start())
 
 
 @bot.message_handler(commands=['allevents'])
 @handlers_wrapper(permissions_level=PermissionsLevels.ADMIN)
 def get_all_events(message, user):
-    user.action = ActionTypes.SELECT_EVENT
-    user.write()
+    _reset_action(user)
 
-    events = Events.get_events_print_info(False)
-    bot.reply_to(message, messages.events_list(events), reply_markup=_get_events_keyboard(events))
+    include_archive = telebot.util.extract_arguments(message.text).strip().lower() == "archive"
+    if include_archive and not archive.is_enabled():
+        outbox.reply_to(message, messages.archive_disabled())
+        return
 
+    page = Events.get_events_page(False, include_archive=include_archive)
+    outbox.reply_to(
+        message,
+        messages.events_list(page.events),
+        reply_markup=_get_events_keyboard(page, False, include_archive)
+    )
 
-def send_qrcode(chat_id, user, ticket):
-    from urllib.parse import quote
-    import io
-
-    def image_to_byte_array(image):
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format=image.format)
-        img_byte_arr = img_byte_arr.getvalue()
-        return img_byte_arr
-
-    event = ticket.event
-
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(
-        f"ticket://{ticket.id}"
-        f"?datetime={event.datetime.isoformat()}"
-        f"&name={quote(event.name.encode('cp1251'))}"
-        f"&members={ticket.members}"
+
+@bot.message_handler(commands=['search'])
+@handlers_wrapper()
+def search_events(message, user):
+    _reset_action(user)
+
+    text = telebot.util.extract_arguments(message.text)
+    if text is None or text.strip() == "":
+        outbox.reply_to(message, messages.search_usage())
+        return
+
+    events = Events.search(text)
+    if len(events) == 0:
+        outbox.reply_to(message, messages.nothing_found())
+        return
+
+    outbox.reply_to(
+        message,
+        messages.events_list(events),
+        reply_markup=_get_events_keyboard(EventsPage(events, False, False), False)
     )
-    qr.make(fit=True)
-    img = qr.make_image(fill='black', back_color='white')
 
-    bot.send_photo(chat_id, image_to_byte_array(img), caption=messages.ticket_caption(ticket))
 
-    user.action = ActionTypes.IDLE
-    user.write()
+@bot.inline_handler(func=lambda inline_query: True)
+@try_wrapper
+@registry.instrumented("inline_search")
+@in_session
+def inline_search(inline_query):
+    user = Users.get(inline_query.from_user.id)
+    if user is not None and user.permissions_level == PermissionsLevels.BANNED:
+        bot.answer_inline_query(inline_query.id, [], cache_time=envars.inline_cache_time, is_personal=True)
+        return
+
+    if inline_query.query.strip() == "":
+        events = Events.get_events_page(True, limit=SEARCH_LIMIT).events
+    else:
+        events = Events.search(inline_query.query)
+
+    results = []
+    for event in events:
+        markup = telebot.types.InlineKeyboardMarkup(row_width=1)
+        markup.add(_callback_button("Записаться", CallbackActions.SIGNUP, event.id))
+
+        results.append(telebot.types.InlineQueryResultArticle(
+            event.id,
+            event.name,
+            telebot.types.InputTextMessageContent(messages.events_list_item(event), parse_mode="Markdown"),
+            reply_markup=markup,
+            description=messages.event_short_description(event)
+        ))
+
+    # Telegram caches answer, so repeated queries do not reach bot
+    bot.answer_inline_query(inline_query.id, results, cache_time=envars.inline_cache_time)
+
+
+@bot.message_handler(commands=['broadcast'])
+@handlers_wrapper(permissions_level=PermissionsLevels.ADMIN)
+def broadcast(message, user):
+    _reset_action(user)
+
+    text = telebot.util.extract_arguments(message.text)
+    if text is None or text.strip() == "":
+        outbox.reply_to(message, messages.broadcast_usage())
+        return
+
+    broadcaster.add(text, user.telegram_id)
+    logging.info(f"User '{user.telegram_id}' started broadcast.")
+    outbox.reply_to(message, messages.broadcast_started())
+
+
+@registry.instrumented("send_qrcode")
+def send_qrcode(chat_id, user, ticket):
+    payload_hash, photo = qr.get_photo(qr.ticket_payload(ticket))
+    future = outbox.send_photo(chat_id, photo, caption=messages.ticket_caption(ticket))
+
+    if not isinstance(photo, str):
+        # Next time image will be sent by Telegram's file id without uploading
+        future.add_done_callback(lambda future: _save_file_id(payload_hash, future))
+
+    _reset_action(user)
+
+
+def _save_file_id(payload_hash, future):
+    if future.exception() is not None:
+        return
+
+    try:
+        QRCodes.save_file_id(payload_hash, future.result().photo[-1].file_id)
+    except Exception as err:
+        logging.error(f"Failed to save QR-code's file id: {err}")
+
+
+def _send_qr_pack(chat_id, event, path, future):
+    try:
+        count = future.result()
+        if count == 0:
+            outbox.send_message(chat_id, messages.qr_pack_empty())
+            return
+
+        # Sent as (file name, bytes), so outbox can retry request.
+        # visible_file_name is lost by pyTelegramBotAPI 3.8.2 send_document
+        with open(path, "rb") as file:
+            document = (os.path.basename(path), file.read())
+        outbox.send_document(chat_id, document, caption=messages.qr_pack_caption(event, count))
+        logging.info(f"Sent {count} QR-codes of event '{event.id}' to '{chat_id}'.")
+    except Exception as err:
+        logging.error(f"Failed to send QR-codes of event '{event.id}': {err}")
+        outbox.send_message(chat_id, messages.qr_pack_failed())
+    finally:
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
 
 
 @bot.callback_query_handler(func=lambda cb: True)
 @try_wrapper
+@registry.instrumented("query_handler")
+@in_session
 def query_handler(callback_query):
     logging.debug("Starting query_handler")
 
@@ -236,65 +344,113 @@ def query_handler(callback_query):
         bot.answer_callback_query(callback_query.id, messages.unknown_user())
         return
 
-    if user.action == ActionTypes.SELECT_EVENT or \
-            user.action == ActionTypes.SELECT_ACTION_ON_EVENT:
+    try:
+        callback = callbacks.decode(callback_query.data)
+    except ValueError as err:
+        logging.debug(f"Incorrect callback data: {err}")
+        bot.answer_callback_query(callback_query.id, messages.not_recognized())
+        return
 
-        if user.action == ActionTypes.SELECT_ACTION_ON_EVENT:
-            event_id = user.action_data
-        else:
-            event_id = callback_query.data
+    if callback_query.message is not None:
+        chat_id = callback_query.message.chat.id
+    else:
+        # Button of inline mode message, answer is sent to private chat with user
+        chat_id = callback_query.from_user.id
 
-        event = Events.get(event_id)
+    if callback.action == CallbackActions.EVENTS_PAGE:
+        # Events list navigation, message is edited in place
+        if not callback.available_only and user.permissions_level < PermissionsLevels.ADMIN:
+            bot.answer_callback_query(callback_query.id, messages.no_permissions())
+            return
+
+        # Archive could be disabled after list was sent
+        include_archive = callback.include_archive and archive.is_enabled()
+        page = Events.get_events_page(
+            callback.available_only, callback.cursor, callback.backward, include_archive=include_archive
+        )
+
+        bot.answer_callback_query(callback_query.id)
+        outbox.edit_message_text(
+            messages.events_list(page.events),
+            chat_id,
+            callback_query.message.message_id,
+            reply_markup=_get_events_keyboard(page, callback.available_only, include_archive)
+        )
+
+    elif callback.action == CallbackActions.SELECT_EVENT or \
+            callback.action == CallbackActions.SIGNUP or \
+            callback.action == CallbackActions.EDIT:
+
+        event = Events.get(callback.id)
         if event is None:
-            bot.answer_callback_query(callback_query.id, messages.unknown_event())
+            archived_event = None
+            if callback.action == CallbackActions.SELECT_EVENT:
+                archived_event = Events.get_archived(callback.id)
+
+            if archived_event is None:
+                bot.answer_callback_query(callback_query.id, messages.unknown_event())
+                return
+
+            # Archived events can't be changed, so information is sent without buttons
+            bot.answer_callback_query(callback_query.id)
+            outbox.send_message(chat_id, messages.archived_event_information(archived_event))
             return
 
         bot.answer_callback_query(callback_query.id)
 
-        if user.action == ActionTypes.SELECT_EVENT:
+        if callback.action == CallbackActions.SELECT_EVENT:
             markup = telebot.types.InlineKeyboardMarkup(row_width=1)
-            markup.add(telebot.types.InlineKeyboardButton(text="Записаться", callback_data="signup"))
+            markup.add(_callback_button("Записаться", CallbackActions.SIGNUP, event.id))
             if user.permissions_level >= PermissionsLevels.ADMIN:
-                markup.add(telebot.types.InlineKeyboardButton(text="Редактировать", callback_data="edit"))
+                markup.add(_callback_button("Редактировать", CallbackActions.EDIT, event.id))
+                markup.add(_callback_button("QR-коды билетов", CallbackActions.QR_PACK, event.id))
 
-            user.action = ActionTypes.SELECT_ACTION_ON_EVENT
+            outbox.send_message(chat_id, messages.full_event_information(event), reply_markup=markup)
+
+        elif callback.action == CallbackActions.SIGNUP:
+            user.action = ActionTypes.ENTER_TICKET_MEMBERS
             user.action_data = event.id
             user.write()
+            outbox.send_message(chat_id, messages.enter_ticket_members())
 
-            bot.send_message(
-                callback_query.message.chat.id,
-                messages.full_event_information(event),
-                reply_markup=markup
-            )
         else:
-            if callback_query.data == "signup":
-                user.action = ActionTypes.ENTER_TICKET_MEMBERS
-                user.action_data = event.id
-                user.write()
-                bot.send_message(
-                    callback_query.message.chat.id,
-                    messages.enter_ticket_members()
-                )
-            elif callback_query.data == "edit":
-                if user.permissions_level < PermissionsLevels.ADMIN:
-                    user.action = ActionTypes.IDLE
-                    user.write()
-                    bot.send_message(callback_query.message.chat.id, messages.no_permissions())
-                    return
-
-                user.action = ActionTypes.ENTER_EVENT_PARAMS
-                user.action_data = event.id
-                user.write()
+            if user.permissions_level < PermissionsLevels.ADMIN:
+                _reset_action(user)
+                outbox.send_message(chat_id, messages.no_permissions())
+                return
+
+            user.action = ActionTypes.ENTER_EVENT_PARAMS
+            user.action_data = event.id
+            user.write()
+
+            outbox.send_message(chat_id, messages.edit_event_start())
+
+    elif callback.action == CallbackActions.QR_PACK:
+        if user.permissions_level < PermissionsLevels.ADMIN:
+            bot.answer_callback_query(callback_query.id, messages.no_permissions())
+            return
+
+        event = Events.get(callback.id)
+        if event is None:
+            bot.answer_callback_query(callback_query.id, messages.unknown_event())
+            return
+
+        bot.answer_callback_query(callback_query.id)
+        outbox.send_message(chat_id, messages.qr_pack_started())
 
-                bot.send_message(callback_query.message.chat.id, messages.edit_event_start())
+        # Pack is written in background, so handler's thread is not blocked
+        directory = tempfile.mkdtemp(prefix="qr_pack_")
+        path = os.path.join(directory, f"tickets_{event.datetime.strftime('%Y%m%d')}_{event.id[:8]}.zip")
+        qr.submit_pack(event.id, path).add_done_callback(lambda future: _send_qr_pack(chat_id, event, path, future))
 
-    elif user.action == ActionTypes.SELECT_TICKET:
-        ticket = Tickets.get(callback_query.data)
+    elif callback.action == CallbackActions.SELECT_TICKET:
+        ticket = Tickets.get(callback.id)
         if ticket is None:
             bot.answer_callback_query(callback_query.id, messages.unknown_ticket())
             return
 
-        send_qrcode(callback_query.message.chat.id, user, ticket)
+        bot.answer_callback_query(callback_query.id)
+        send_qrcode(chat_id, user, ticket)
 
     else:
         bot.answer_callback_query(callback_query.id, messages.not_recognized())
@@ -335,7 +491,7 @@ def text_handler(message, user):
         if user.permissions_level < PermissionsLevels.ADMIN:
             user.action = ActionTypes.IDLE
             user.write()
-            bot.reply_to(message, messages.no_permissions())
+            outbox.reply_to(message, messages.no_permissions())
             return
 
         if user.action == ActionTypes.ENTER_EVENT_PARAMS:
@@ -348,13 +504,13 @@ def text_handler(message, user):
         try:
             event = event_from_message(event)
         except ValueError:
-            bot.reply_to(message, messages.not_recognized())
+            outbox.reply_to(message, messages.not_recognized())
             return
 
         if user.action == ActionTypes.ENTER_EVENT_PARAMS:
-            bot.reply_to(message, messages.enter_edited_event_description(_old_description))
+            outbox.reply_to(message, messages.enter_edited_event_description(_old_description))
         else:
-            bot.reply_to(message, messages.enter_new_event_description())
+            outbox.reply_to(message, messages.enter_new_event_description())
 
         user.action = ActionTypes.ENTER_EVENT_DESCRIPTION
         user.action_data = event.id
@@ -365,7 +521,7 @@ def text_handler(message, user):
         if user.permissions_level < PermissionsLevels.ADMIN:
             user.action = ActionTypes.IDLE
             user.write()
-            bot.reply_to(message, messages.no_permissions())
+            outbox.reply_to(message, messages.no_permissions())
             return
 
         event = Events.get(user.action_data)
@@ -375,7 +531,7 @@ def text_handler(message, user):
         user.action = ActionTypes.IDLE
         user.write()
 
-        bot.reply_to(message, messages.description_saved())
+        outbox.reply_to(message, messages.description_saved())
 
     elif user.action == ActionTypes.ENTER_TICKET_MEMBERS:
 
@@ -383,42 +539,226 @@ def text_handler(message, user):
             _members = int(message.text)
         except Exception as err:
             logging.debug(f"Incorrect members input: {err}")
-            bot.reply_to(message, messages.members_must_be_int())
+            outbox.reply_to(message, messages.members_must_be_int())
             return
 
-        ticket = Ticket()
-        ticket.user = user
-        ticket.event = user.action_data
+        try:
+            result = Tickets.book(user.id, user.action_data, _members)
+        except ValueError as err:
+            logging.debug(f"Incorrect members input: {err}")
+            outbox.reply_to(message, messages.members_must_be_int())
+            return
 
-        _event = ticket.event
-        _available_places = _event.available_places
-        if _event.max_members != 0 and \
-                _available_places < _members:
-            bot.reply_to(message, messages.too_many_members(_available_places))
+        if result.status == BookingStatus.EVENT_NOT_FOUND:
+            user.action = ActionTypes.IDLE
+            user.write()
+            outbox.reply_to(message, messages.unknown_event())
             return
 
-        ticket.members = _members
-        ticket.write()
+        if result.status == BookingStatus.NOT_ENOUGH_PLACES:
+            outbox.reply_to(message, messages.too_many_members(result.available_places))
+            return
 
-        send_qrcode(message.chat.id, user, ticket)
+        qr.prerender(qr.ticket_payload(result.ticket))
+        send_qrcode(message.chat.id, user, result.ticket)
 
     else:
-        bot.reply_to(message, messages.not_recognized())
+        outbox.reply_to(message, messages.not_recognized())
 
 
 @bot.message_handler(func=lambda message: True, content_types=['audio', 'photo', 'voice', 'video', 'document',
                                                                'location', 'contact', 'sticker'])
 @try_wrapper
+@registry.instrumented("default_command")
 def default_command(message):
-    bot.reply_to(message, messages.unsupported_type())
+    outbox.reply_to(message, messages.unsupported_type())
 
 
 logging.debug("Set messages handlers.")
 
-# Start Polling
 
-logging.debug("Bot starts polling...")
+def main():
+    # Without secret token anyone who knows server's address can send updates on behalf of users
+
+    webhook_secret = envars.webhook_secret
+    if envars.mode == "webhook" and webhook_secret == "":
+        if envars.webhook_url == "":
+            logging.error("EVENTS_BOT_WEBHOOK_SECRET must be set in webhook mode if EVENTS_BOT_WEBHOOK_URL is not.")
+            exit(1)
+
+        # Webhook is registered on start, so token can be new every time
+        logging.info("EVENTS_BOT_WEBHOOK_SECRET is not set, using random secret token.")
+        webhook_secret = secrets.token_urlsafe(32)
+
+    # Processes are forked before other threads are started
+
+    if envars.qr_workers > 0:
+        qr.start(envars.qr_workers)
+
+    # Measure handlers, DataBase and Telegram requests if metrics are exported
+
+    metrics_enabled = envars.metrics_port > 0 or envars.metrics_log_interval > 0
+    if metrics_enabled:
+        registry.trace(pool)
+        registry.trace_telegram()
+
+    # Connect to db
+
+    db_path = envars.db_path
+    logging.debug(f"Checking DataBase path '{db_path}'...")
+
+    if os.path.exists(db_path) and not os.path.isfile(db_path):
+        logging.error(f"Incorrect DataBase path '{db_path}'.")
+        exit(1)
+
+    if not os.path.exists(db_path):
+        logging.info(f"Creating new DataBase in '{db_path}'...")
+
+    import data
+
+    db_version = data.init_db(db_path)
+    logging.info(f"DataBase schema version: {db_version}.")
+
+    if envars.archive_db != "":
+        logging.debug(f"Attaching archive DataBase '{envars.archive_db}'...")
+        archive.enable(envars.archive_db)
+
+    # Update permissions for admin users
+
+    logging.debug("Setting permissions level for admin users...")
+
+    for admin_user_id in envars.admin_users:
+
+        admin_user = Users.get(admin_user_id)
+        if admin_user is None:
+            logging.debug("Creating new admin user")
+            admin_user = User()
+
+        admin_user.telegram_id = admin_user_id
+        admin_user.permissions_level = PermissionsLevels.ADMIN
+
+        admin_user.write()
+
+    logging.debug("Set permissions level for admin users.")
+
+    Users.start_writer()
+
+    outbox.start()
+    broadcaster.start()
+    bot.dispatcher.start()
+
+    reminders = None
+    if envars.reminder_lead_time > 0:
+        from reminders import ReminderScheduler
+
+        reminders = ReminderScheduler(
+            lambda telegram_id, text: outbox.submit(telegram_id, "send_message", telegram_id, text, lane=Lanes.BULK),
+            envars.reminder_lead_time * 60
+        )
+        reminders.start()
+
+    archiver = None
+    if archive.is_enabled() and envars.archive_horizon_days > 0:
+        archiver = archive.Archiver(envars.archive_horizon_days)
+        archiver.start()
+
+    backups = None
+    if envars.backup_dir != "":
+        from data.backup import BackupScheduler
+
+        backup_paths = [db_path]
+        if archive.is_enabled():
+            backup_paths.append(envars.archive_db)
+
+        backups = BackupScheduler(
+            backup_paths, envars.backup_dir, envars.backup_interval * 60, envars.backup_keep,
+            envars.backup_compression
+        )
+        backups.start()
+
+    metrics_server = None
+    summary_logger = None
+    if metrics_enabled:
+        from metrics import MetricsServer, SummaryLogger
+
+        registry.collect("updates", bot.dispatcher.stats)
+        registry.collect("outbox", outbox.stats)
+        registry.collect("users_cache", Users.cache_stats)
+        registry.collect("events_cache", Events.cache_stats)
+        registry.collect("db_connections", pool.stats)
+        if reminders is not None:
+            registry.collect("reminders", reminders.stats)
+        if backups is not None:
+            registry.collect("backup", backups.stats)
+
+        if envars.metrics_port > 0:
+            logging.debug(f"Exporting metrics on {envars.metrics_host}:{envars.metrics_port}...")
+            metrics_server = MetricsServer(registry, envars.metrics_host, envars.metrics_port)
+            metrics_server.start()
+
+        if envars.metrics_log_interval > 0:
+            summary_logger = SummaryLogger(registry, envars.metrics_log_interval)
+            summary_logger.start()
+
+    if envars.mode == "webhook":
+        # Receive updates by webhook
+
+        from webhook import WebhookServer, set_webhook
+
+        if envars.webhook_url != "":
+            logging.debug(f"Setting webhook '{envars.webhook_url}'...")
+            set_webhook(envars.bot_token, envars.webhook_url, webhook_secret)
+
+        server = WebhookServer(
+            bot.dispatcher, envars.webhook_host, envars.webhook_port, envars.webhook_path, webhook_secret
+        )
+
+        logging.debug(f"Bot starts listening on {envars.webhook_host}:{envars.webhook_port}...")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        logging.debug("Bot stopped listening.")
+
+    else:
+        # Start Polling
+
+        logging.debug("Bot starts polling...")
+        bot.polling()
+        logging.debug("Bot stopped polling.")
+
+    bot.dispatcher.stop()
+    logging.info(f"Updates: {bot.dispatcher.stats()}")
+
+    if reminders is not None:
+        reminders.stop()
+        logging.info(f"Reminders: {reminders.stats()}")
+
+    if archiver is not None:
+        archiver.stop()
+
+    if backups is not None:
+        backups.stop()
+        logging.info(f"Backups: {backups.stats()}")
+
+    broadcaster.stop()
+    outbox.stop()
+    logging.info(f"Outbox: {outbox.stats()}")
+
+    if metrics_server is not None:
+        metrics_server.stop()
+    if summary_logger is not None:
+        summary_logger.stop()
+
+    qr.stop()
+
+    Users.stop_writer()
+    logging.info(f"Users cache: {Users.cache_stats()}")
+    logging.info(f"DataBase connections: {pool.stats()}")
+    logging.info(f"Events cache: {Events.cache_stats()}")
+    pool.close_all()
 
-bot.polling()
 
-logging.debug("Bot stopped polling.")
+if __name__ == "__main__":
+    main()
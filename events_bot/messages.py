@@ -30,40 +30,61 @@ def welcome_and_help(is_admin):
         admin_commands = f"\n" \
                          f"*Команды администратора:*\n" \
                          f"/newevent - создать новое мероприятие\n" \
-                         f"/allevents - список всех мероприятий"
+                         f"/allevents - список всех мероприятий\n" \
+                         f"/allevents archive - список вместе с архивными мероприятиями\n" \
+                         f"/broadcast текст - отправить сообщение всем пользователям"
 
     return f"Я могу записать тебя на мероприятия, " \
            f"проходящие на [Федеральной территории Сириус](https://sirius-ft.ru/)\n" \
            f"\n" \
            f"*Команды:*\n" \
            f"/events - список доступных мероприятий\n" \
+           f"/search текст - поиск мероприятий\n" \
            f"/tickets - список ваших билетов на мероприятия{admin_commands}"
 
 
+def events_list_item(event):
+    if event.max_members == 0:
+        available_places = "без ограничения на кол-во участников"
+    else:
+        available_places = f"мест: {event.available_places}/{event.max_members}"
+
+    from datetime import datetime
+
+    return f"`{datetime.fromtimestamp(event.datetime).strftime(dt_format)}`: " \
+           f"*{event.name}*: " \
+           f"{event.location}: " \
+           f"{available_places}"
+
+
+def event_short_description(event):
+    from datetime import datetime
+
+    return f"{datetime.fromtimestamp(event.datetime).strftime(dt_format)} {event.location}"
+
+
 def events_list(events):
     if len(events) == 0:
         return f"Нет доступных мероприятий."
 
-    from datetime import datetime
-
     result = f"*Мероприятия:*\n"
     for event in events:
-
-        if event['max_members'] == 0:
-            available_places = "без ограничения на кол-во участников"
-        else:
-            available_places = f"мест: {event['available_places']}/{event['max_members']}"
-
-        result += f"`{datetime.fromtimestamp(event['datetime']).strftime(dt_format)}`: " \
-                  f"*{event['name']}*: " \
-                  f"{event['location']}: " \
-                  f"{available_places}\n"
+        result += f"{events_list_item(event)}\n"
 
     result += f"Для получения подробной информации нажмите на кнопку ниже."
 
     return result
 
 
+def search_usage():
+    return f"Введите слова для поиска после команды:\n" \
+           f"`/search конференция`"
+
+
+def nothing_found():
+    return f"Ничего не найдено."
+
+
 def event_fields():
     return f"Название мероприятия\n" \
            f"Дату и время в формате `dd.MM.yyyy HH:mm`\n" \
@@ -136,6 +157,16 @@ def full_event_information(event):
            f"{event.description}"
 
 
+def archived_event_information(event):
+    return f"{full_event_information(event)}\n" \
+           f"\n" \
+           f"Мероприятие перенесено в архив."
+
+
+def archive_disabled():
+    return f"Архив мероприятий не подключен."
+
+
 def enter_ticket_members():
     return f"Введите кол-во мест."
 
@@ -158,6 +189,42 @@ def ticket_caption(ticket):
     return f"{event.datetime.strftime(dt_format)} {event.name}: {ticket.members} мест"
 
 
+def qr_pack_started():
+    return f"Готовлю архив с QR-кодами билетов, это может занять некоторое время."
+
+
+def qr_pack_caption(event, count):
+    return f"QR-коды билетов на мероприятие *{event.name}*: {count}"
+
+
+def qr_pack_empty():
+    return f"На это мероприятие нет билетов."
+
+
+def qr_pack_failed():
+    return f"Не удалось подготовить архив с QR-кодами."
+
+
+def event_reminder(event, members):
+    return f"*Напоминание:* {event.datetime.strftime(dt_format)} начнется мероприятие *{event.name}*\n" \
+           f"Место проведения: {event.location}\n" \
+           f"Мест в ваших билетах: {members}"
+
+
+def broadcast_usage():
+    return f"Введите текст рассылки после команды:\n" \
+           f"`/broadcast Текст сообщения`"
+
+
+def broadcast_started():
+    return f"Рассылка начата, по ее завершении вы получите отчет."
+
+
+def broadcast_finished(broadcast):
+    return f"Рассылка завершена.\n" \
+           f"Отправлено: {broadcast.sent}, не доставлено: {broadcast.failed}."
+
+
 def members_must_be_int():
     return f"Количество мест должно задаваться целым числом."
 
@@ -0,0 +1,402 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import telebot
+
+"""
+metrics.py measures where bot's time goes.
+Handlers' latency, their DataBase statements and time, and Telegram API
+requests are recorded in histograms and counters, which are exported
+in Prometheus text format by HTTP and logged as periodic summary.
+"""
+
+# Upper bounds (in seconds) of histograms' buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Handler's label of statements executed outside of handlers (writer, reminders and others)
+BACKGROUND = "background"
+
+PREFIX = "events_bot"
+
+
+def _quantile(counts, q):
+    """
+    Estimates quantile as upper bound of histogram's bucket which contains it.
+    """
+
+    rank = q * sum(counts)
+    total = 0
+    for bound, count in zip(BUCKETS, counts):
+        total += count
+        if total >= rank:
+            return bound
+    return float("inf")
+
+
+class Histogram:
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        # The last bucket counts values greater than all bounds
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _HandlerStats:
+
+    __slots__ = ("latency", "errors", "queries", "db_time")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.queries = 0
+        self.db_time = 0.0
+
+
+class _RequestStats:
+
+    __slots__ = ("latency", "errors")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+
+
+class _Frame:
+    """
+    Handler running in current thread, nested handlers' statements are added to outer ones.
+    """
+
+    __slots__ = ("name", "queries", "db_time")
+
+    def __init__(self, name):
+        self.name = name
+        self.queries = 0
+        self.db_time = 0.0
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _histogram_lines(name, label, histograms):
+    lines = [f"# TYPE {name} histogram"]
+    for key, histogram in sorted(histograms.items()):
+        total = 0
+        for bound, count in zip(BUCKETS, histogram.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{label}="{_label(key)}",le="{bound}"}} {total}')
+        lines.append(f'{name}_bucket{{{label}="{_label(key)}",le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{{label}="{_label(key)}"}} {histogram.sum}')
+        lines.append(f'{name}_count{{{label}="{_label(key)}"}} {histogram.count}')
+    return lines
+
+
+def _counter_lines(name, label, values):
+    lines = [f"# TYPE {name} counter"]
+    for key, value in sorted(values.items()):
+        lines.append(f'{name}{{{label}="{_label(key)}"}} {value}')
+    return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._handlers = {}
+        self._requests = {}
+        # Functions returning dicts of numbers, exported as gauges
+        self._collectors = {}
+        # Totals of previous summary: {handler: (buckets' counts, sum, errors, queries, db time)}
+        self._summarized = {}
+
+    def _handler_stats(self, name):
+        stats = self._handlers.get(name)
+        if stats is None:
+            stats = self._handlers[name] = _HandlerStats()
+        return stats
+
+    def _frames(self):
+        frames = getattr(self._local, "frames", None)
+        if frames is None:
+            frames = self._local.frames = []
+        return frames
+
+    @contextmanager
+    def handler(self, name):
+        """
+        Measures block as handler with the given name.
+        """
+
+        frames = self._frames()
+        frame = _Frame(name)
+        frames.append(frame)
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            frames.pop()
+            if len(frames) > 0:
+                frames[-1].queries += frame.queries
+                frames[-1].db_time += frame.db_time
+
+            with self._lock:
+                stats = self._handler_stats(name)
+                stats.latency.observe(elapsed)
+                stats.queries += frame.queries
+                stats.db_time += frame.db_time
+                if failed:
+                    stats.errors += 1
+
+    def instrumented(self, name):
+        """
+        Decorator which measures function as handler with the given name.
+        """
+
+        def decorator(func):
+            def wrap(*args, **kwargs):
+                with self.handler(name):
+                    return func(*args, **kwargs)
+            return wrap
+        return decorator
+
+    def _statement(self, statement):
+        # Statements of triggers are reported as comments
+        if statement.startswith("--"):
+            return
+
+        frames = self._frames()
+        if len(frames) > 0:
+            frames[-1].queries += 1
+            return
+
+        with self._lock:
+            self._handler_stats(BACKGROUND).queries += 1
+
+    def _db_time(self, seconds):
+        frames = self._frames()
+        if len(frames) > 0:
+            frames[-1].db_time += seconds
+            return
+
+        with self._lock:
+            self._handler_stats(BACKGROUND).db_time += seconds
+
+    def trace(self, pool):
+        """
+        Counts statements and time of pool's connections opened after this call.
+        """
+
+        pool.on_connect(lambda connection: connection.set_trace_callback(self._statement))
+        pool.on_release(self._db_time)
+
+    def trace_telegram(self):
+        """
+        Measures requests to Telegram API made by all bots.
+        """
+
+        make_request = telebot.apihelper._make_request
+
+        def timed_request(token, method_name, *args, **kwargs):
+            started = time.perf_counter()
+            failed = False
+            try:
+                return make_request(token, method_name, *args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    stats = self._requests.get(method_name)
+                    if stats is None:
+                        stats = self._requests[method_name] = _RequestStats()
+                    stats.latency.observe(elapsed)
+                    if failed:
+                        stats.errors += 1
+
+        telebot.apihelper._make_request = timed_request
+
+    def collect(self, name, stats):
+        """
+        Exports values of stats() as gauges named '<name>_<key>'.
+        Lists of numbers are exported with 'index' label.
+        """
+        self._collectors[name] = stats
+
+    def render(self):
+        """
+        :return: Metrics in Prometheus text format.
+        """
+
+        with self._lock:
+            lines = _histogram_lines(
+                f"{PREFIX}_handler_duration_seconds", "handler",
+                {name: stats.latency for name, stats in self._handlers.items() if stats.latency.count > 0}
+            )
+            lines += _counter_lines(
+                f"{PREFIX}_handler_errors_total", "handler",
+                {name: stats.errors for name, stats in self._handlers.items()}
+            )
+            lines += _counter_lines(
+                f"{PREFIX}_handler_db_queries_total", "handler",
+                {name: stats.queries for name, stats in self._handlers.items()}
+            )
+            lines += _counter_lines(
+                f"{PREFIX}_handler_db_seconds_total", "handler",
+                {name: stats.db_time for name, stats in self._handlers.items()}
+            )
+            lines += _histogram_lines(
+                f"{PREFIX}_telegram_request_duration_seconds", "method",
+                {name: stats.latency for name, stats in self._requests.items()}
+            )
+            lines += _counter_lines(
+                f"{PREFIX}_telegram_errors_total", "method",
+                {name: stats.errors for name, stats in self._requests.items()}
+            )
+
+        for collector, stats in self._collectors.items():
+            try:
+                values = stats()
+            except Exception as err:
+                logging.warning(f"Failed to collect '{collector}' metrics: {err}")
+                continue
+
+            for key, value in values.items():
+                name = f"{PREFIX}_{collector}_{key}"
+                if isinstance(value, (list, tuple)):
+                    lines.append(f"# TYPE {name} gauge")
+                    lines += [f'{name}{{index="{index}"}} {item}' for index, item in enumerate(value)]
+                elif isinstance(value, (int, float)):
+                    lines.append(f"# TYPE {name} gauge")
+                    lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+        :return: Text with handlers' and Telegram requests' statistics since the previous summary.
+        """
+
+        lines = []
+        with self._lock:
+            for name, stats in sorted(self._handlers.items()):
+                current = (list(stats.latency.counts), stats.latency.sum, stats.errors, stats.queries, stats.db_time)
+                previous = self._summarized.get(name, ([0] * len(current[0]), 0.0, 0, 0, 0.0))
+                self._summarized[name] = current
+
+                counts = [now - before for now, before in zip(current[0], previous[0])]
+                count = sum(counts)
+                total, errors, queries, db_time = (now - before for now, before in zip(current[1:], previous[1:]))
+
+                if count > 0:
+                    lines.append(
+                        f"{name}: {count} calls, avg {total / count * 1000:.1f} ms, "
+                        f"p95 <= {_quantile(counts, 0.95) * 1000:.0f} ms, "
+                        f"{queries / count:.1f} queries/call, db {db_time * 1000:.0f} ms, {errors} errors"
+                    )
+                elif queries > 0 or errors > 0:
+                    lines.append(f"{name}: {queries} queries, db {db_time * 1000:.0f} ms, {errors} errors")
+
+            for name, stats in sorted(self._requests.items()):
+                key = ("telegram", name)
+                current = (stats.latency.count, stats.latency.sum, stats.errors)
+                previous = self._summarized.get(key, (0, 0.0, 0))
+                self._summarized[key] = current
+                count, total, errors = (now - before for now, before in zip(current, previous))
+
+                if count > 0:
+                    lines.append(
+                        f"telegram {name}: {count} requests, avg {total / count * 1000:.1f} ms, {errors} errors"
+                    )
+
+        return "\n".join(lines)
+
+
+registry = Registry()
+
+
+class MetricsServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, registry, host, port):
+        """
+        HTTP server which returns registry's metrics on any GET request.
+        """
+
+        self.registry = registry
+        super().__init__((host, port), _MetricsRequestHandler)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="MetricsServer", daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = self.server.registry.render().encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"Metrics {self.address_string()}: {format % args}")
+
+
+class SummaryLogger:
+
+    def __init__(self, registry, interval):
+        """
+        Logs registry's summary every interval seconds.
+        """
+
+        self._registry = registry
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="MetricsSummary", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._log()
+
+    def _log(self):
+        summary = self._registry.summary()
+        if summary != "":
+            logging.info(f"Metrics for the last period:\n{summary}")
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            self._log()
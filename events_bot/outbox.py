@@ -0,0 +1,280 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+import telebot
+
+from data.cache import LRUCache
+from ratelimit import TokenBucket
+
+"""
+outbox.py sends bot's messages to Telegram through rate-limited queue.
+Requests are sent by worker threads within global and per-chat limits,
+replies to users go before bulk messages, and requests rejected with
+429 Too Many Requests are retried after the time Telegram asks to wait.
+"""
+
+MAX_RETRIES = 5
+# Telegram tolerates short bursts of messages in one chat
+CHAT_BURST = 3
+# Max count of chats whose limits are tracked
+CHAT_BUCKETS = 10000
+
+
+class Lanes:
+    """
+    Enumeration of outbox priorities, requests from lower lanes are sent first.
+    INTERACTIVE - replies to users' actions.
+    BULK - broadcasts and reminders.
+    """
+
+    INTERACTIVE = 0
+    BULK = 1
+
+
+class _Request:
+
+    __slots__ = ("chat_id", "method", "args", "kwargs", "lane", "future", "attempts", "chat_reserved")
+
+    def __init__(self, chat_id, method, args, kwargs, lane):
+        self.chat_id = chat_id
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.lane = lane
+        self.future = Future()
+        self.attempts = 0
+        self.chat_reserved = False
+
+
+def _retry_delay(err, attempt):
+    """
+    :return: Seconds before retry or None if request should not be retried.
+    """
+
+    if isinstance(err, telebot.apihelper.ApiTelegramException):
+        if err.error_code == 429:
+            return err.result_json.get("parameters", {}).get("retry_after", 1)
+        if err.error_code >= 500:
+            return 2 ** attempt
+        return None
+
+    if isinstance(err, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return 2 ** attempt
+
+    return None
+
+
+class Outbox:
+
+    def __init__(self, bot, global_rate, chat_rate, workers):
+        """
+        :param bot: TeleBot whose methods send requests.
+        :param global_rate: Max count of requests per second.
+        :param chat_rate: Max count of requests per second to one chat.
+        :param workers: Count of sending threads.
+        """
+
+        self._bot = bot
+        self._global = TokenBucket(global_rate)
+        self._chat_rate = chat_rate
+        self._chats = LRUCache(CHAT_BUCKETS)
+        self._workers = workers
+
+        self._condition = threading.Condition()
+        # Entries (lane, sequence number, request)
+        self._ready = []
+        # Entries (monotonic time when request is ready, sequence number, request)
+        self._delayed = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._stopping = False
+        self._threads = []
+
+        self._sent = [0, 0]
+        self._failed = 0
+        self._retried = 0
+
+    def start(self):
+        self._stopping = False
+        for number in range(self._workers):
+            thread = threading.Thread(target=self._work, name=f"OutboxWorker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """
+        Sends already queued requests and stops workers.
+        """
+
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, chat_id, method, *args, lane=Lanes.INTERACTIVE, **kwargs):
+        """
+        Queues request to Telegram.
+        If outbox is not started request is sent immediately without limits.
+        :param chat_id: Chat request is sent to.
+        :param method: Name of bot's method, e.g. "send_message".
+        :return: Future with method's result.
+        """
+
+        request = _Request(chat_id, method, args, kwargs, lane)
+
+        if len(self._threads) == 0:
+            try:
+                request.future.set_result(getattr(self._bot, method)(*args, **kwargs))
+            except Exception as err:
+                logging.warning(f"Failed to send {method} to {chat_id}: {err}")
+                request.future.set_exception(err)
+            return request.future
+
+        with self._condition:
+            heapq.heappush(self._ready, (lane, next(self._sequence), request))
+            self._condition.notify()
+
+        return request.future
+
+    def call(self, chat_id, method, *args, **kwargs):
+        """
+        Queues request and waits for its result.
+        :raises Exception: Error of the last attempt to send request.
+        """
+        return self.submit(chat_id, method, *args, **kwargs).result()
+
+    # Shortcuts below do not wait for sending, so handler's thread is not blocked
+    # by chat's limit, they return Future and failures are logged by workers
+
+    def reply_to(self, message, text, **kwargs):
+        return self.submit(message.chat.id, "reply_to", message, text, **kwargs)
+
+    def send_message(self, chat_id, text, **kwargs):
+        return self.submit(chat_id, "send_message", chat_id, text, **kwargs)
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        return self.submit(chat_id, "send_photo", chat_id, photo, **kwargs)
+
+    def send_document(self, chat_id, document, **kwargs):
+        return self.submit(chat_id, "send_document", chat_id, document, **kwargs)
+
+    def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        return self.submit(chat_id, "edit_message_text", text, chat_id, message_id, **kwargs)
+
+    def _delay(self, request, delay):
+        with self._condition:
+            heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._sequence), request))
+            self._condition.notify()
+
+    def _take(self):
+        """
+        Waits for the next request which can be sent.
+        :return: Request or None if outbox is stopped and has no requests.
+        """
+
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                while len(self._delayed) > 0 and self._delayed[0][0] <= now:
+                    request = heapq.heappop(self._delayed)[2]
+                    heapq.heappush(self._ready, (request.lane, next(self._sequence), request))
+
+                if len(self._ready) > 0 and self._paused_until <= now:
+                    return heapq.heappop(self._ready)[2]
+
+                if self._stopping and len(self._ready) == 0 and len(self._delayed) == 0:
+                    return None
+
+                timeout = None
+                if len(self._delayed) > 0:
+                    timeout = self._delayed[0][0] - now
+                if len(self._ready) > 0:
+                    pause = self._paused_until - now
+                    timeout = pause if timeout is None else min(timeout, pause)
+
+                self._condition.wait(timeout)
+
+    def _work(self):
+        has_token = False
+        while True:
+            # Request is chosen after waiting for global limit,
+            # so replies queued while waiting go before bulk requests
+            if not has_token:
+                self._global.acquire()
+                has_token = True
+
+            request = self._take()
+            if request is None:
+                return
+
+            try:
+                if not self._reserve_chat(request):
+                    continue
+                has_token = False
+                self._send(request)
+            except Exception as err:
+                logging.error(f"Outbox failed to process request: {err}")
+                request.future.set_exception(err)
+
+    def _reserve_chat(self, request):
+        """
+        Takes chat's token or postpones request until it is available.
+        :return: True if request can be sent now.
+        """
+
+        if request.chat_reserved:
+            return True
+
+        bucket = self._chats.setdefault(request.chat_id, TokenBucket(self._chat_rate, CHAT_BURST))
+        request.chat_reserved = True
+        delay = bucket.reserve()
+        if delay > 0:
+            self._delay(request, delay)
+            return False
+        return True
+
+    def _send(self, request):
+        request.chat_reserved = False
+
+        try:
+            result = getattr(self._bot, request.method)(*request.args, **request.kwargs)
+        except Exception as err:
+            delay = _retry_delay(err, request.attempts)
+            if delay is None or request.attempts >= MAX_RETRIES:
+                logging.warning(f"Failed to send {request.method} to {request.chat_id}: {err}")
+                with self._condition:
+                    self._failed += 1
+                request.future.set_exception(err)
+                return
+
+            request.attempts += 1
+            with self._condition:
+                self._retried += 1
+                if isinstance(err, telebot.apihelper.ApiTelegramException) and err.error_code == 429:
+                    # Flood limit is exceeded, all requests wait
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._delay(request, delay)
+            return
+
+        with self._condition:
+            self._sent[request.lane] += 1
+        request.future.set_result(result)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "ready": len(self._ready),
+                "delayed": len(self._delayed),
+                "sent_interactive": self._sent[Lanes.INTERACTIVE],
+                "sent_bulk": self._sent[Lanes.BULK],
+                "failed": self._failed,
+                "retried": self._retried,
+            }
@@ -0,0 +1,212 @@
+import csv
+import hashlib
+import io
+import itertools
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import qrcode
+
+import ticket_codes
+from data.qrcodes import QRCodes
+
+"""
+qr.py renders tickets' QR-codes.
+Rendered images are stored in DataBase by hash of their payload,
+so every payload is rendered only once.
+Rendering is CPU-bound, so when worker processes are started images are
+rendered by them and bot's threads only wait for results.
+"""
+
+# Count of payloads rendered by one worker process' task in bulk rendering
+CHUNK_SIZE = 32
+
+_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="QRRenderer")
+# Packs of event's QR-codes are written one by one
+_packer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="QRPacker")
+
+# Worker processes, None - images are rendered by bot's process
+_processes = None
+_workers = 0
+
+# Futures of images being rendered by payload hash
+_rendering = {}
+_lock = threading.RLock()
+
+
+def start(workers):
+    """
+    Starts worker processes.
+    Should be called before bot's threads are started, as on Linux workers are forked.
+    """
+
+    global _processes, _workers
+
+    _processes = ProcessPoolExecutor(max_workers=workers)
+    _workers = workers
+    # Workers are started by the first task
+    _processes.submit(render_png, "").result()
+
+
+def stop():
+    global _processes
+
+    if _processes is not None:
+        _processes.shutdown()
+        _processes = None
+
+
+def ticket_payload(ticket):
+    return ticket_codes.encode(ticket.id, ticket.members)
+
+
+def payload_hash(payload):
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def render_png(payload):
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    img = qr.make_image(fill='black', back_color='white')
+
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format="PNG")
+    return img_byte_arr.getvalue()
+
+
+def _render_chunk(payloads):
+    return [render_png(payload) for payload in payloads]
+
+
+def _render(payload):
+    if _processes is None:
+        return render_png(payload)
+    return _processes.submit(render_png, payload).result()
+
+
+def render_all(payloads, chunk_size=CHUNK_SIZE):
+    """
+    Generator of PNG images of payloads in the same order.
+    Chunks of payloads are rendered by all worker processes in parallel,
+    only two chunks per worker are queued at once, so payloads can be
+    a generator of any length.
+    """
+
+    if _processes is None:
+        yield from map(render_png, payloads)
+        return
+
+    payloads = iter(payloads)
+    queued = deque()
+    while True:
+        chunk = list(itertools.islice(payloads, chunk_size))
+        if len(chunk) > 0:
+            queued.append(_processes.submit(_render_chunk, chunk))
+        if len(queued) == 0:
+            return
+        if len(chunk) == 0 or len(queued) >= 2 * _workers:
+            yield from queued.popleft().result()
+
+
+def write_pack(file, tickets):
+    """
+    Writes ZIP archive with QR-codes of tickets and 'tickets.csv' index.
+    Images are written as soon as they are rendered, so memory usage
+    does not depend on tickets count.
+    :param file: Path or file object.
+    :param tickets: Iterable of objects with id, members and telegram_id, e.g. Tickets.export rows.
+    :return: Count of images.
+    """
+
+    tickets, rendered = itertools.tee(tickets)
+    images = render_all(ticket_codes.encode(ticket.id, ticket.members) for ticket in rendered)
+
+    index = io.StringIO()
+    writer = csv.writer(index)
+    writer.writerow(("file", "ticket", "members", "telegram_id"))
+
+    count = 0
+    # Images are already compressed
+    with zipfile.ZipFile(file, "w", compression=zipfile.ZIP_STORED) as archive:
+        for count, (ticket, png) in enumerate(zip(tickets, images), 1):
+            name = f"{count:05d}_{ticket.id}.png"
+            archive.writestr(name, png)
+            writer.writerow((name, ticket.id, ticket.members, ticket.telegram_id))
+
+        archive.writestr("tickets.csv", index.getvalue())
+
+    return count
+
+
+def write_event_pack(event_id, path):
+    """
+    Writes pack of QR-codes of all event's tickets to file.
+    :return: Count of images.
+    """
+
+    from data.tickets import Tickets
+
+    return write_pack(path, Tickets.export(event_id))
+
+
+def submit_pack(event_id, path):
+    """
+    Writes pack of event's QR-codes in background thread.
+    :return: Future with count of images.
+    """
+    return _packer.submit(write_event_pack, event_id, path)
+
+
+def _render_and_save(payload, key):
+    cached = QRCodes.get(key)
+    if cached is not None:
+        return cached[0]
+
+    png = _render(payload)
+    QRCodes.save_png(key, png)
+    return png
+
+
+def _forget(key):
+    with _lock:
+        _rendering.pop(key, None)
+
+
+def prerender(payload):
+    """
+    Renders and saves image in background thread if it is not saved yet.
+    :return: Future with PNG bytes.
+    """
+
+    key = payload_hash(payload)
+    with _lock:
+        future = _rendering.get(key)
+        if future is None:
+            future = _executor.submit(_render_and_save, payload, key)
+            _rendering[key] = future
+            future.add_done_callback(lambda _: _forget(key))
+
+    return future
+
+
+def get_photo(payload):
+    """
+    Gets image for sending with send_photo.
+    :return: Tuple (payload hash, photo) where photo is Telegram's file id
+        if image was sent before or PNG bytes otherwise.
+    """
+
+    key = payload_hash(payload)
+
+    cached = QRCodes.get(key)
+    if cached is not None:
+        png, file_id = cached
+        if file_id != "":
+            return key, file_id
+        return key, png
+
+    return key, prerender(payload).result()
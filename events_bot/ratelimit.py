@@ -0,0 +1,49 @@
+import threading
+import time
+
+"""
+ratelimit.py limits rate of bot's outgoing Telegram requests.
+"""
+
+
+class TokenBucket:
+
+    def __init__(self, rate, capacity=None):
+        """
+        Thread-safe token bucket.
+        :param rate: Tokens added per second.
+        :param capacity: Max count of accumulated tokens (burst size), by default - rate.
+        """
+
+        self._rate = rate
+        self._capacity = rate if capacity is None else capacity
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def reserve(self, tokens=1):
+        """
+        Takes tokens, in advance if bucket does not have enough of them.
+        :return: Seconds caller must wait before using taken tokens.
+        """
+
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self._rate
+
+    def acquire(self, tokens=1):
+        """
+        Takes tokens, blocks until they are available.
+        """
+
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,159 @@
+import heapq
+import logging
+import threading
+import time
+
+import messages
+from data.events import Events
+from data.tickets import Tickets
+
+"""
+reminders.py notifies ticket holders before events start.
+Reminders' times of upcoming events are kept in a min-heap, scheduler
+sleeps until the earliest one and events' changes push new entries.
+Event is marked as reminded in DataBase before its reminders are sent,
+so they are sent at most once even if bot is restarted.
+Messages are rate-limited by outbox, which sends them in its bulk lane.
+"""
+
+
+class ReminderScheduler:
+
+    def __init__(self, send, lead_time):
+        """
+        :param send: Function send(telegram_id, text) which queues one message
+            and returns Future with its result, e.g. Outbox.submit.
+        :param lead_time: Seconds between reminder and event's start.
+        """
+
+        self._send = send
+        self._lead_time = lead_time
+
+        # Entries (reminder's timestamp, event's id), outdated ones are skipped by Events.mark_reminded
+        self._heap = []
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+        self._reminded_events = 0
+        self._sent = 0
+        self._failed = 0
+
+    def start(self):
+        """
+        Loads not reminded upcoming events and starts scheduler thread.
+        """
+
+        Events.subscribe(self.schedule)
+
+        with self._condition:
+            for event in Events.get_not_reminded(time.time()):
+                self._heap.append((event.datetime - self._lead_time, event.id))
+            heapq.heapify(self._heap)
+
+        self._thread = threading.Thread(target=self._run, name="ReminderScheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def schedule(self, event):
+        """
+        Events listener which schedules reminder of created or changed event.
+        """
+
+        timestamp = event.datetime.timestamp()
+        if timestamp <= time.time():
+            return
+
+        with self._condition:
+            heapq.heappush(self._heap, (timestamp - self._lead_time, event.id))
+            self._condition.notify()
+
+    def _next(self):
+        """
+        Waits until the earliest reminder is due.
+        :return: Event's id or None if scheduler is stopped.
+        """
+
+        with self._condition:
+            while not self._stopped:
+                if len(self._heap) == 0:
+                    self._condition.wait()
+                    continue
+
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+
+                return heapq.heappop(self._heap)[1]
+
+        return None
+
+    def _run(self):
+        while True:
+            event_id = self._next()
+            if event_id is None:
+                return
+
+            try:
+                self._remind(event_id)
+            except Exception as err:
+                logging.error(f"Failed to remind about event {event_id}: {err}")
+
+    def _remind(self, event_id):
+        if not Events.mark_reminded(event_id, self._lead_time):
+            # Event is already reminded, moved or started
+            return
+
+        event = Events.get(event_id)
+        holders = Tickets.get_event_holders(event_id)
+        logging.info(f"Reminding {len(holders)} users about event {event_id}...")
+
+        with self._condition:
+            self._reminded_events += 1
+
+        for number, holder in enumerate(holders):
+            if self._stopped:
+                logging.warning(f"Reminders about event {event_id} are not sent to {len(holders) - number} users.")
+                return
+
+            try:
+                future = self._send(holder.telegram_id, messages.event_reminder(event, holder.members))
+            except Exception as err:
+                self._sent_callback(holder.telegram_id, err)
+                continue
+
+            future.add_done_callback(
+                lambda future, telegram_id=holder.telegram_id: self._sent_callback(telegram_id, future.exception())
+            )
+
+    def _sent_callback(self, telegram_id, err):
+        """
+        Counts reminder when outbox has sent it or given up.
+        """
+
+        if err is not None:
+            logging.warning(f"Failed to send reminder to {telegram_id}: {err}")
+
+        with self._condition:
+            if err is None:
+                self._sent += 1
+            else:
+                self._failed += 1
+
+    def stats(self):
+        with self._condition:
+            return {
+                "scheduled": len(self._heap),
+                "reminded_events": self._reminded_events,
+                "sent": self._sent,
+                "failed": self._failed,
+            }
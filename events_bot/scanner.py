@@ -0,0 +1,225 @@
+import logging
+import threading
+import uuid
+from datetime import datetime
+
+import envars
+import ticket_codes
+from data.tickets import Tickets, CheckInStatus
+
+"""
+scanner.py checks tickets at event's entrance.
+Ids of event's tickets are loaded once, so scanning a QR-code only
+verifies its signature and looks the id up in memory. Check-ins are
+written to DataBase in batches by background thread and are kept in
+memory while DataBase is not available.
+"""
+
+# Max count of check-ins written in one transaction
+BATCH_SIZE = 100
+# Seconds between writes of check-ins
+SYNC_INTERVAL = 5
+
+
+class ScanStatus:
+    """
+    Enumeration of Scanner.scan results.
+    VALID - ticket is used now, people can enter.
+    ALREADY_USED - ticket was used before.
+    UNKNOWN_TICKET - ticket is not for this event or was deleted.
+    INVALID_CODE - QR-code is not a ticket, its signature is wrong,
+        or it is not signed while EVENTS_BOT_TICKET_SECRET is set.
+    """
+
+    VALID = "VALID"
+    ALREADY_USED = "ALREADY_USED"
+    UNKNOWN_TICKET = "UNKNOWN_TICKET"
+    INVALID_CODE = "INVALID_CODE"
+
+
+class ScanResult:
+
+    __slots__ = ("status", "ticket_id", "members")
+
+    def __init__(self, status, ticket_id=None, members=0):
+        """
+        :param status: ScanStatus value.
+        :param ticket_id: Ticket's id if code is decoded.
+        :param members: Count of people ticket is booked for.
+        """
+
+        self.status = status
+        self.ticket_id = ticket_id
+        self.members = members
+
+
+class Scanner:
+
+    def __init__(self, event_id, batch_size=BATCH_SIZE, sync_interval=SYNC_INTERVAL):
+        self._event_id = event_id
+        self._batch_size = batch_size
+        self._sync_interval = sync_interval
+
+        # Tickets' ids as 16 bytes (they take much less memory than strings): members
+        self._tickets = {}
+        self._used = set()
+        # Check-ins not written to DataBase: list of tuples (ticket's id, datetime)
+        self._pending = []
+
+        self._lock = threading.Lock()
+        # Notified when batch is full or scanner is stopped
+        self._condition = threading.Condition(self._lock)
+        self._sync_lock = threading.Lock()
+        self._stopped = False
+        self._thread = None
+
+        self._scanned = {status: 0 for status in (
+            ScanStatus.VALID, ScanStatus.ALREADY_USED, ScanStatus.UNKNOWN_TICKET, ScanStatus.INVALID_CODE
+        )}
+        self._synced = 0
+        self._conflicts = 0
+
+    def load(self):
+        """
+        Loads ids of event's tickets and tickets which are already used.
+        :return: Count of loaded tickets.
+        """
+
+        tickets = {}
+        used = set()
+        for ticket in Tickets.get_event_check_in_list(self._event_id):
+            key = uuid.UUID(ticket.id).bytes
+            tickets[key] = ticket.members
+            if ticket.checked_in is not None:
+                used.add(key)
+
+        with self._lock:
+            self._tickets = tickets
+            # Check-ins which are not written yet stay used
+            self._used = used | {uuid.UUID(ticket_id).bytes for ticket_id, _ in self._pending}
+
+        return len(tickets)
+
+    def start(self):
+        """
+        Starts thread which writes check-ins every sync_interval seconds.
+        """
+
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="ScannerSync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops thread and writes remaining check-ins.
+        :return: Count of check-ins which are not written.
+        """
+
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        self.sync()
+        with self._lock:
+            return len(self._pending)
+
+    def scan(self, payload):
+        """
+        Checks ticket's QR-code and marks ticket as used, does not read DataBase.
+        :param payload: Text of scanned QR-code.
+        :return: ScanResult.
+        """
+
+        try:
+            code = ticket_codes.decode(payload)
+            # Legacy codes are not signed, anyone can forge them
+            if envars.ticket_secret != "" and not code.signed:
+                raise ValueError("Code is not signed.")
+        except ValueError as err:
+            logging.debug(f"Scanned incorrect code: {err}")
+            with self._lock:
+                self._scanned[ScanStatus.INVALID_CODE] += 1
+            return ScanResult(ScanStatus.INVALID_CODE)
+
+        with self._lock:
+            # Members are taken from DataBase, payload's value is not trusted
+            members = self._tickets.get(code.key, 0)
+            if code.key not in self._tickets:
+                status = ScanStatus.UNKNOWN_TICKET
+            elif code.key in self._used:
+                status = ScanStatus.ALREADY_USED
+            else:
+                status = ScanStatus.VALID
+                self._used.add(code.key)
+                self._pending.append((code.ticket_id, datetime.now()))
+                if len(self._pending) >= self._batch_size:
+                    # Full batch is written without waiting for interval
+                    self._condition.notify()
+
+            self._scanned[status] += 1
+
+        return ScanResult(status, code.ticket_id, members)
+
+    def sync(self):
+        """
+        Writes pending check-ins to DataBase in batches.
+        Check-ins are kept if DataBase is not available and written by the next sync.
+        :return: Count of written check-ins.
+        """
+
+        written = 0
+        with self._sync_lock:
+            while True:
+                with self._lock:
+                    batch = self._pending[:self._batch_size]
+                if len(batch) == 0:
+                    return written
+
+                try:
+                    statuses = Tickets.check_in_many(batch)
+                except Exception as err:
+                    logging.warning(f"Failed to write {len(batch)} check-ins, they are kept in memory: {err}")
+                    return written
+
+                conflicts = [
+                    ticket_id for ticket_id, status in statuses.items() if status != CheckInStatus.CHECKED_IN
+                ]
+                for ticket_id in conflicts:
+                    # Used at another entrance or deleted after scanner loaded tickets
+                    logging.warning(f"Ticket '{ticket_id}' is scanned, but DataBase says: {statuses[ticket_id]}.")
+
+                with self._lock:
+                    del self._pending[:len(batch)]
+                    self._synced += len(batch)
+                    self._conflicts += len(conflicts)
+                written += len(batch)
+
+    def _run(self):
+        failed = False
+        while True:
+            with self._condition:
+                # After failed write the next one is tried after interval
+                if not self._stopped and (failed or len(self._pending) < self._batch_size):
+                    self._condition.wait(self._sync_interval)
+                if self._stopped:
+                    return
+                pending = len(self._pending)
+
+            failed = pending > 0 and self.sync() == 0
+
+    def stats(self):
+        with self._lock:
+            result = {
+                "tickets": len(self._tickets),
+                "used": len(self._used),
+                "pending": len(self._pending),
+                "synced": self._synced,
+                "conflicts": self._conflicts,
+            }
+            for status, count in self._scanned.items():
+                result[status.lower()] = count
+            return result
@@ -0,0 +1,96 @@
+import base64
+import hashlib
+import hmac
+import struct
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+import envars
+
+"""
+ticket_codes.py encodes tickets' QR-codes payloads.
+Payload contains format version, ticket's id and members count packed
+into bytes and encoded with base32, which fits QR-code's compact
+alphanumeric mode. If EVENTS_BOT_TICKET_SECRET is set, data is followed
+by truncated HMAC tag, so scanner verifies tickets without DataBase.
+"""
+
+VERSION = 1
+TAG_SIZE = 10
+
+_BODY = struct.Struct(">B16sI")
+
+# Payload of QR-codes sent before signed payloads
+_LEGACY_SCHEME = "ticket"
+
+
+class TicketCode:
+
+    __slots__ = ("key", "members", "signed")
+
+    def __init__(self, key, members, signed):
+        """
+        Decoded payload.
+        :param key: Ticket's id as 16 bytes.
+        :param members: Count of people ticket is booked for.
+        :param signed: Whether payload's tag was verified.
+        """
+
+        self.key = key
+        self.members = members
+        self.signed = signed
+
+    @property
+    def ticket_id(self):
+        return str(uuid.UUID(bytes=self.key))
+
+
+def _tag(body):
+    if envars.ticket_secret == "":
+        return b""
+    return hmac.new(envars.ticket_secret.encode(), body, hashlib.sha256).digest()[:TAG_SIZE]
+
+
+def encode(ticket_id, members):
+    """
+    :return: Payload string.
+    """
+
+    body = _BODY.pack(VERSION, uuid.UUID(ticket_id).bytes, members)
+    return base64.b32encode(body + _tag(body)).decode().rstrip("=")
+
+
+def _decode_legacy(payload):
+    url = urlsplit(payload)
+    members = parse_qs(url.query).get("members", ["0"])[0]
+    return TicketCode(uuid.UUID(url.netloc).bytes, int(members), False)
+
+
+def decode(payload):
+    """
+    :return: TicketCode.
+    :raises ValueError: If payload is malformed, has unknown version or wrong tag.
+    """
+
+    payload = payload.strip()
+    if payload.startswith(f"{_LEGACY_SCHEME}://"):
+        try:
+            return _decode_legacy(payload)
+        except Exception as err:
+            raise ValueError(f"Incorrect ticket URI: {err}")
+
+    try:
+        raw = base64.b32decode(payload.upper() + "=" * (-len(payload) % 8))
+    except Exception as err:
+        raise ValueError(f"Ticket code is not base32: {err}")
+
+    tag_size = len(_tag(b""))
+    body, tag = raw[:len(raw) - tag_size], raw[len(raw) - tag_size:]
+    if len(body) != _BODY.size or not hmac.compare_digest(tag, _tag(body)):
+        raise ValueError("Ticket code is not signed.")
+
+    version, key, members = _BODY.unpack(body)
+    if version != VERSION:
+        raise ValueError(f"Unsupported ticket code version {version}.")
+
+    return TicketCode(key, members, tag_size > 0)
@@ -0,0 +1,386 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+import uuid
+from datetime import datetime
+
+"""
+tools.py provides maintenance commands for bot's DataBase.
+Usage: python events_bot/tools.py <command> [options]
+   or: python -m events_bot.tools <command> [options]
+"""
+
+# Bot's modules are imported relative to events_bot directory as in main.py
+_EVENTS_BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+if _EVENTS_BOT_DIR not in sys.path:
+    sys.path.insert(0, _EVENTS_BOT_DIR)
+
+# Fields of imported events, only name and datetime are required
+IMPORT_FIELDS = ("id", "name", "datetime", "location", "max_members", "description")
+EXPORT_FIELDS = ("id", "members", "event", "name", "datetime", "location", "user", "telegram_id")
+
+
+def check_seats(args):
+    from data.events import Events
+
+    broken = Events.check_booked_members()
+    for event in broken:
+        print(
+            f"{event['id']} {event['name']}: "
+            f"booked {event['booked_members']}, tickets {event['actual_booked_members']}"
+        )
+
+    if len(broken) == 0:
+        print("Booked members counters are consistent.")
+        return 0
+
+    if not args.rebuild:
+        print(f"{len(broken)} inconsistent events, run with --rebuild to fix them.")
+        return 1
+
+    print(f"Rebuilt {Events.rebuild_booked_members()} events.")
+    return 0
+
+
+def _file_format(path, format):
+    if format is not None:
+        return format
+    return os.path.splitext(path)[1].lstrip(".").lower()
+
+
+def _read_records(file, format):
+    """
+    Generator of dicts read from CSV with header, JSON array or JSON Lines.
+    """
+
+    if format == "csv":
+        yield from csv.DictReader(file)
+
+    elif format == "json":
+        yield from json.load(file)
+
+    elif format == "jsonl":
+        for line in file:
+            if line.strip() != "":
+                yield json.loads(line)
+
+    else:
+        raise ValueError(f"Unsupported format '{format}'.")
+
+
+def _parse_datetime(value):
+    """
+    Accepts ISO 8601 or bot's 'dd.MM.yyyy HH:mm' format.
+    """
+
+    import messages
+
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, messages.dt_format)
+
+
+def _event_from_record(number, record):
+    from data.events import Event
+
+    unknown = set(record) - set(IMPORT_FIELDS)
+    if len(unknown) > 0:
+        raise ValueError(f"Record {number}: unknown fields {sorted(unknown)}.")
+
+    try:
+        event = Event()
+        if record.get("id", "") != "":
+            # Ids are compared as text, so they are stored in canonical form
+            event.id = str(uuid.UUID(record["id"]))
+        event.name = record["name"]
+        event.datetime = _parse_datetime(record["datetime"])
+        event.location = record.get("location") or ""
+        event.max_members = int(record.get("max_members") or 0)
+        event.description = record.get("description") or ""
+    except (KeyError, TypeError, ValueError) as err:
+        raise ValueError(f"Record {number}: {err!r}")
+
+    if event.name == "" or event.max_members < 0:
+        raise ValueError(f"Record {number}: empty name or negative max_members.")
+
+    return event
+
+
+def import_events(args):
+    from data.events import Events
+
+    format = _file_format(args.file, args.format)
+    with open(args.file, newline="", encoding="utf-8") as file:
+        events = (
+            _event_from_record(number, record)
+            for number, record in enumerate(_read_records(file, format), 1)
+        )
+        try:
+            count = Events.insert_many(events)
+        except (ValueError, sqlite3.Error) as err:
+            print(f"Nothing is imported. {err}")
+            return 1
+
+    print(f"Imported {count} events.")
+    return 0
+
+
+def _export_records(tickets):
+    for ticket in tickets:
+        yield ticket._replace(datetime=datetime.fromtimestamp(ticket.datetime).isoformat())
+
+
+def export_tickets(args):
+    from data.tickets import Tickets
+
+    records = _export_records(Tickets.export(args.event))
+
+    output = sys.stdout
+    if args.output is not None:
+        output = open(args.output, "w", newline="", encoding="utf-8")
+
+    try:
+        count = 0
+        if _file_format(args.output or "", args.format) == "csv":
+            writer = csv.writer(output)
+            writer.writerow(EXPORT_FIELDS)
+            for record in records:
+                writer.writerow(record)
+                count += 1
+        else:
+            for record in records:
+                output.write(json.dumps(record._asdict(), ensure_ascii=False) + "\n")
+                count += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(f"Exported {count} tickets.", file=sys.stderr)
+    return 0
+
+
+def scan(args):
+    from data.events import Events
+    from scanner import Scanner
+
+    event = Events.get(args.event)
+    if event is None:
+        print(f"Event '{args.event}' is not found.", file=sys.stderr)
+        return 1
+
+    scanner = Scanner(event.id, batch_size=args.batch_size)
+    print(f"{event.name}: loaded {scanner.load()} tickets, scan QR-codes (one per line).", file=sys.stderr)
+
+    scanner.start()
+    try:
+        for line in sys.stdin:
+            if line.strip() == "":
+                continue
+            result = scanner.scan(line)
+            print(f"{result.status} {result.ticket_id or '-'} members={result.members}", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        not_written = scanner.stop()
+
+    print(f"Scanner: {scanner.stats()}", file=sys.stderr)
+    if not_written > 0:
+        print(f"{not_written} check-ins are not written to DataBase.", file=sys.stderr)
+        return 1
+    return 0
+
+
+def qr_pack(args):
+    import qr
+    from data.events import Events
+
+    event = Events.get(args.event)
+    if event is None:
+        print(f"Event '{args.event}' is not found.", file=sys.stderr)
+        return 1
+
+    if args.workers > 0:
+        qr.start(args.workers)
+
+    started = time.perf_counter()
+    try:
+        count = qr.write_event_pack(event.id, args.output)
+    finally:
+        qr.stop()
+    elapsed = time.perf_counter() - started
+
+    print(f"Written {count} QR-codes to '{args.output}' in {elapsed:.1f} s ({count / max(elapsed, 1e-9):.0f}/s).")
+    return 0
+
+
+def archive_events(args):
+    import envars
+    from datetime import timedelta
+    from data import archive
+
+    path = args.archive_db or envars.archive_db
+    if path == "":
+        print("Archive DataBase is not set, use --archive-db or EVENTS_BOT_ARCHIVE_DB.", file=sys.stderr)
+        return 1
+
+    archive.enable(path)
+
+    horizon = datetime.now() - timedelta(days=args.horizon_days)
+    started = time.perf_counter()
+    moved_events, moved_tickets = archive.archive(horizon, args.batch_size)
+    elapsed = time.perf_counter() - started
+    print(
+        f"Archived {moved_events} events and {moved_tickets} tickets before {horizon:%Y-%m-%d %H:%M} "
+        f"in {elapsed:.1f} s."
+    )
+
+    print(f"Freed {archive.vacuum()} pages.")
+    print(f"Tables: {archive.stats()}")
+    return 0
+
+
+def backup(args):
+    import envars
+    from data import backup
+
+    directory = args.directory or envars.backup_dir
+    if directory == "":
+        print("Backup directory is not set, use --directory or EVENTS_BOT_BACKUP_DIR.", file=sys.stderr)
+        return 1
+
+    source_paths = [envars.db_path]
+    if envars.archive_db != "" and os.path.exists(envars.archive_db):
+        source_paths.append(envars.archive_db)
+
+    for source_path in source_paths:
+        result = backup.snapshot(
+            source_path, directory, args.compression or envars.backup_compression, args.pages, args.pause
+        )
+        print(f"Written {result}.")
+
+        for path in backup.rotate(directory, source_path, args.keep):
+            print(f"Removed '{path}'.")
+    return 0
+
+
+def verify_backup(args):
+    from data import backup
+
+    result = backup.verify(args.snapshot)
+    for message in result.messages[:20]:
+        print(message)
+    print(f"Schema version: {result.schema_version}.")
+    return 0 if result.ok else 1
+
+
+def restore_backup(args):
+    import envars
+    from data import backup
+
+    destination_path = envars.db_path
+    if args.archive:
+        destination_path = envars.archive_db
+        if destination_path == "":
+            print("Archive DataBase is not set, use EVENTS_BOT_ARCHIVE_DB.", file=sys.stderr)
+            return 1
+
+    result = backup.restore(args.snapshot, destination_path)
+    if not result.ok:
+        print(f"Snapshot is broken, DataBase is not changed: {result.messages[:5]}", file=sys.stderr)
+        return 1
+
+    print(f"Restored '{destination_path}' from '{args.snapshot}' (schema version {result.schema_version}).")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="tools.py", description="Events bot maintenance commands.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("check-seats", help="check events' booked members counters")
+    command.add_argument("--rebuild", action="store_true", help="recalculate inconsistent counters")
+    command.set_defaults(func=check_seats)
+
+    command = commands.add_parser(
+        "import-events", help="create events from CSV, JSON or JSON Lines file in one transaction"
+    )
+    command.add_argument("file", help=f"file with fields: {', '.join(IMPORT_FIELDS)}")
+    command.add_argument("--format", choices=("csv", "json", "jsonl"), help="by default - file's extension")
+    command.set_defaults(func=import_events)
+
+    command = commands.add_parser("export-tickets", help="export tickets with their events and users")
+    command.add_argument("--event", help="export only this event's tickets")
+    command.add_argument("--output", "-o", help="output file, by default - stdout")
+    command.add_argument("--format", choices=("csv", "jsonl"), help="by default - output file's extension or jsonl")
+    command.set_defaults(func=export_tickets)
+
+    command = commands.add_parser("scan", help="check in tickets of event, QR-codes' payloads are read from stdin")
+    command.add_argument("event", help="event's id")
+    command.add_argument("--batch-size", type=int, default=100, help="check-ins written in one transaction")
+    command.set_defaults(func=scan)
+
+    command = commands.add_parser("qr-pack", help="write ZIP with QR-codes of all event's tickets")
+    command.add_argument("event", help="event's id")
+    command.add_argument("--output", "-o", required=True, help="ZIP file")
+    command.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="rendering processes, 0 - render in this process"
+    )
+    command.set_defaults(func=qr_pack)
+
+    command = commands.add_parser("archive", help="move past events and their tickets to archive DataBase")
+    command.add_argument("--archive-db", help="archive DataBase, by default - EVENTS_BOT_ARCHIVE_DB")
+    command.add_argument(
+        "--horizon-days", type=int, default=365, help="archive events started more than this count of days ago"
+    )
+    command.add_argument("--batch-size", type=int, default=100, help="events moved in one transaction")
+    command.set_defaults(func=archive_events)
+
+    command = commands.add_parser(
+        "backup", help="write snapshots of DataBase and archive DataBase while bot is running"
+    )
+    command.add_argument("--directory", "-d", help="snapshots' directory, by default - EVENTS_BOT_BACKUP_DIR")
+    command.add_argument(
+        "--compression", choices=("none", "gzip", "zstd"), help="by default - EVENTS_BOT_BACKUP_COMPRESSION"
+    )
+    command.add_argument("--keep", type=int, default=0, help="remove all snapshots except N newest, 0 - keep all")
+    command.add_argument("--pages", type=int, default=256, help="pages copied by one step")
+    command.add_argument("--pause", type=float, default=0.001, help="seconds between steps")
+    command.set_defaults(func=backup)
+
+    command = commands.add_parser("verify-backup", help="check snapshot's integrity")
+    command.add_argument("snapshot", help="snapshot's file, .gz and .zst are unpacked")
+    command.set_defaults(func=verify_backup)
+
+    command = commands.add_parser("restore", help="replace DataBase with verified snapshot, bot must be stopped")
+    command.add_argument("snapshot", help="snapshot's file, .gz and .zst are unpacked")
+    command.add_argument("--archive", action="store_true", help="restore archive DataBase EVENTS_BOT_ARCHIVE_DB")
+    command.set_defaults(func=restore_backup)
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s::%(levelname)s::%(message)s", datefmt="%Y-%m-%dT%H:%M:%S")
+
+    try:
+        import envars
+    except EnvironmentError as e:
+        logging.error(e)
+        return 1
+
+    import data
+    from data.connection import pool
+
+    data.init_db(envars.db_path)
+    try:
+        return args.func(args)
+    finally:
+        pool.close_all()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import hmac
+import json
+import logging
+import queue
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import telebot
+
+"""
+webhook.py receives Telegram updates by HTTP instead of long polling.
+Updates are passed to dispatcher without waiting for their processing.
+"""
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class WebhookServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, dispatcher, host, port, path="/", secret_token=""):
+        """
+        :param dispatcher: UpdateDispatcher which processes received updates.
+        :param path: URL path Telegram sends updates to.
+        :param secret_token: Expected value of secret token header, empty - not checked.
+        """
+
+        self.dispatcher = dispatcher
+        self.webhook_path = path
+        self.secret_token = secret_token
+        super().__init__((host, port), _WebhookRequestHandler)
+
+
+class _WebhookRequestHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        server = self.server
+
+        if self.path != server.webhook_path:
+            self.send_error(404)
+            return
+
+        if server.secret_token != "" and not hmac.compare_digest(
+                self.headers.get(SECRET_TOKEN_HEADER, ""), server.secret_token
+        ):
+            self.send_error(403)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        if length > MAX_BODY_SIZE:
+            self.send_error(413)
+            return
+
+        try:
+            update = telebot.types.Update.de_json(json.loads(self.rfile.read(length)))
+        except Exception as err:
+            logging.debug(f"Incorrect webhook update: {err}")
+            self.send_error(400)
+            return
+
+        try:
+            server.dispatcher.submit(update, block=False)
+        except queue.Full:
+            # Telegram will retry delivering this update later
+            self.send_error(503)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logging.debug(f"Webhook {self.address_string()}: {format % args}")
+
+
+def set_webhook(token, url, secret_token=""):
+    """
+    Registers webhook url in Telegram.
+    Sent directly as pyTelegramBotAPI 3.8.2 set_webhook does not support secret_token.
+    """
+
+    params = {"url": url}
+    if secret_token != "":
+        params["secret_token"] = secret_token
+
+    return telebot.apihelper._make_request(token, "setWebhook", params=params, method="post")
@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+
+"""
+common.py sets up environment shared by tests: temporary DataBase with archive,
+bot's modules are imported relative to events_bot directory as in main.py.
+Must be imported before the first import from events_bot.
+"""
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EVENTS_BOT_DIR = os.path.join(ROOT_DIR, "events_bot")
+
+_directory = tempfile.TemporaryDirectory(prefix="events_bot_test_")
+os.environ["EVENTS_BOT_DB"] = os.path.join(_directory.name, "test.db")
+os.environ["EVENTS_BOT_ARCHIVE_DB"] = os.path.join(_directory.name, "archive.db")
+os.environ.setdefault("EVENTS_BOT_TOKEN", "0:test")
+if EVENTS_BOT_DIR not in sys.path:
+    sys.path.insert(0, EVENTS_BOT_DIR)
+
+import data  # noqa: E402
+import envars  # noqa: E402
+from data import archive  # noqa: E402
+
+data.init_db(envars.db_path)
+# Archive is attached by connections opened after this call
+archive.enable(envars.archive_db)
+
+
+def clear_tables():
+    """
+    Removes all rows written by previous tests and clears caches.
+    """
+
+    from data import users
+    from data.connection import pool
+    from data.events import Events
+
+    users.Users.flush()
+
+    with pool.transaction() as connection:
+        for table in ("tickets", "events"):
+            connection.execute(f"DELETE FROM main.{table}")
+            connection.execute(f"DELETE FROM {archive.SCHEMA}.{table}")
+        connection.execute("DELETE FROM users")
+
+    users._users_cache.clear()
+    Events.invalidate_cache()
@@ -0,0 +1,69 @@
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+from common import clear_tables
+
+from data.connection import pool
+from data.events import Event, Events
+from data.tickets import BookingStatus, Tickets
+from data.users import User
+
+THREADS = 16
+MAX_MEMBERS = 5
+
+
+class ConcurrentBookingTest(unittest.TestCase):
+
+    def setUp(self):
+        clear_tables()
+
+        self.users = []
+        for number in range(THREADS):
+            user = User()
+            user.telegram_id = 2000 + number
+            user.write()
+            self.users.append(user.id)
+
+        event = Event()
+        event.name = "Limited"
+        event.datetime = datetime.now() + timedelta(days=1)
+        event.max_members = MAX_MEMBERS
+        event.write()
+        self.event_id = event.id
+
+    def test_concurrent_bookings_do_not_oversell(self):
+        barrier = threading.Barrier(THREADS)
+        results = [None] * THREADS
+        errors = []
+
+        def book(number):
+            try:
+                barrier.wait()
+                results[number] = Tickets.book(self.users[number], self.event_id, 1).status
+            except Exception as err:
+                errors.append(err)
+            finally:
+                pool.close()
+
+        threads = [threading.Thread(target=book, args=(number,)) for number in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(results.count(BookingStatus.BOOKED), MAX_MEMBERS)
+        self.assertEqual(results.count(BookingStatus.NOT_ENOUGH_PLACES), THREADS - MAX_MEMBERS)
+
+        with pool.connection() as connection:
+            booked = connection.execute(
+                "SELECT sum(members) FROM tickets WHERE event = :event", {"event": self.event_id}
+            ).fetchone()[0]
+        self.assertEqual(booked, MAX_MEMBERS)
+        self.assertEqual(Events.get(self.event_id).available_places, 0)
+        self.assertEqual(Events.check_booked_members(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
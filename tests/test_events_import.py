@@ -0,0 +1,45 @@
+import unittest
+from datetime import datetime, timedelta
+
+from common import clear_tables
+
+from data import events as events_module
+from data.connection import pool
+from data.events import Event, Events
+
+
+class InsertManyTest(unittest.TestCase):
+
+    def setUp(self):
+        clear_tables()
+
+        self.notified = []
+        Events.subscribe(self.notified.append)
+        self.addCleanup(events_module._listeners.remove, self.notified.append)
+
+    def _events(self, count):
+        for number in range(count):
+            event = Event()
+            event.name = f"Imported {number}"
+            event.datetime = datetime.now() + timedelta(days=1, hours=number)
+            yield event
+
+    def test_listeners_are_notified_after_commit(self):
+        self.assertEqual(Events.insert_many(self._events(3)), 3)
+        self.assertEqual([event.name for event in self.notified], ["Imported 0", "Imported 1", "Imported 2"])
+
+    def test_failed_import_does_not_notify(self):
+        def broken():
+            yield from self._events(2)
+            raise ValueError("Broken record.")
+
+        with self.assertRaises(ValueError):
+            Events.insert_many(broken())
+
+        self.assertEqual(self.notified, [])
+        with pool.connection() as connection:
+            self.assertEqual(connection.execute("SELECT count(*) FROM events").fetchone()[0], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
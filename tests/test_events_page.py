@@ -0,0 +1,49 @@
+import unittest
+from datetime import datetime, timedelta
+
+from common import clear_tables
+
+from data.events import Event, Events
+
+
+class EventsPageTest(unittest.TestCase):
+
+    def setUp(self):
+        clear_tables()
+
+        start = datetime.now() + timedelta(days=1)
+        self.ids = []
+        for number in range(7):
+            event = Event()
+            event.name = f"Event {number}"
+            event.datetime = start + timedelta(hours=number)
+            event.write()
+            self.ids.append(event.id)
+
+    def _check_navigation(self, include_archive):
+        first = Events.get_events_page(False, limit=3, include_archive=include_archive)
+        self.assertEqual([event.id for event in first.events], self.ids[:3])
+        self.assertFalse(first.has_previous)
+        self.assertTrue(first.has_next)
+
+        second = Events.get_events_page(False, first.last, limit=3, include_archive=include_archive)
+        self.assertEqual([event.id for event in second.events], self.ids[3:6])
+        self.assertTrue(second.has_previous)
+        self.assertTrue(second.has_next)
+
+        previous = Events.get_events_page(
+            False, second.first, backward=True, limit=3, include_archive=include_archive
+        )
+        self.assertEqual([event.id for event in previous.events], self.ids[:3])
+        self.assertFalse(previous.has_previous)
+        self.assertTrue(previous.has_next)
+
+    def test_first_next_previous(self):
+        self._check_navigation(False)
+
+    def test_first_next_previous_with_archive(self):
+        self._check_navigation(True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import common  # noqa: F401
+
+from data.migrations import MIGRATIONS, migrate
+
+
+class AutoVacuumMigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory(prefix="events_bot_test_")
+        self.path = os.path.join(self._directory.name, "old.db")
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, isolation_level=None)
+        self.addCleanup(connection.close)
+        return connection
+
+    def test_new_database_has_incremental_auto_vacuum(self):
+        connection = self._connect()
+        self.assertEqual(migrate(connection), len(MIGRATIONS))
+        self.assertEqual(connection.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+
+    def test_existing_database_is_rebuilt_once(self):
+        connection = self._connect()
+        migrate(connection)
+
+        # DataBase created before archive support
+        connection.execute("PRAGMA auto_vacuum = NONE")
+        connection.execute("VACUUM")
+        connection.execute("CREATE TABLE filler (data BLOB)")
+        connection.executemany("INSERT INTO filler VALUES (zeroblob(4096))", [()] * 100)
+        connection.execute("DELETE FROM filler")
+        self.assertEqual(connection.execute("PRAGMA auto_vacuum").fetchone()[0], 0)
+
+        self.assertEqual(migrate(connection), len(MIGRATIONS))
+        self.assertEqual(connection.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+
+        connection.executemany("INSERT INTO filler VALUES (zeroblob(4096))", [()] * 100)
+        connection.execute("DELETE FROM filler")
+        self.assertGreater(connection.execute("PRAGMA freelist_count").fetchone()[0], 0)
+        connection.executescript("PRAGMA incremental_vacuum;")
+        self.assertEqual(connection.execute("PRAGMA freelist_count").fetchone()[0], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import sqlite3
+import unittest
+
+from common import clear_tables
+
+from data.basic import DataObject
+from data.connection import pool
+from data.session import Session, defer_write
+from data.users import ActionTypes, PermissionsLevels, User, Users
+
+
+class _FailingObject(DataObject):
+    """
+    New object whose postponed write fails in session's transaction.
+    """
+
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__("events", None)
+
+    def write(self):
+        if not defer_write(self):
+            raise sqlite3.IntegrityError("write failed")
+
+
+def _stored_action(telegram_id):
+    with pool.connection() as connection:
+        return connection.execute(
+            "SELECT action FROM users WHERE telegramId = :telegram_id", {"telegram_id": telegram_id}
+        ).fetchone()[0]
+
+
+class SessionDiscardTest(unittest.TestCase):
+
+    def setUp(self):
+        clear_tables()
+
+    def test_failed_session_does_not_leak_cached_user_changes(self):
+        user = User()
+        user.telegram_id = 1001
+        user.write()
+        self.assertIs(Users.get(1001), Users.get(1001))
+
+        with self.assertRaises(RuntimeError):
+            with Session():
+                cached = Users.get(1001)
+                cached.permissions_level = PermissionsLevels.ADMIN
+                cached.write()
+                raise RuntimeError("handler failed")
+
+        user = Users.get(1001)
+        self.assertEqual(user.permissions_level, PermissionsLevels.USER)
+
+        # Queued action write must not carry discarded permissions level
+        user.action = ActionTypes.ENTER_EVENT_DESCRIPTION
+        user.write()
+        Users.flush()
+
+        with pool.connection() as connection:
+            row = connection.execute(
+                "SELECT permissionsLevel, action FROM users WHERE telegramId = 1001"
+            ).fetchone()
+        self.assertEqual(row[0], PermissionsLevels.USER)
+        self.assertEqual(row[1], ActionTypes.ENTER_EVENT_DESCRIPTION)
+
+    def test_successful_session_writes_changes(self):
+        user = User()
+        user.telegram_id = 1002
+        user.write()
+
+        with Session():
+            Users.get(1002).permissions_level = PermissionsLevels.ADMIN
+            Users.get(1002).write()
+
+        with pool.connection() as connection:
+            level = connection.execute("SELECT permissionsLevel FROM users WHERE telegramId = 1002").fetchone()[0]
+        self.assertEqual(level, PermissionsLevels.ADMIN)
+        self.assertEqual(Users.get(1002).permissions_level, PermissionsLevels.ADMIN)
+
+    def test_failed_session_does_not_queue_action(self):
+        user = User()
+        user.telegram_id = 1003
+        user.write()
+
+        with self.assertRaises(RuntimeError):
+            with Session():
+                cached = Users.get(1003)
+                cached.action = ActionTypes.ENTER_TICKET_MEMBERS
+                cached.write()
+                raise RuntimeError("handler failed")
+
+        self.assertEqual(Users.flush(), 0)
+        self.assertEqual(_stored_action(1003), ActionTypes.IDLE)
+
+    def test_failed_session_transaction_does_not_queue_action(self):
+        user = User()
+        user.telegram_id = 1004
+        user.write()
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            with Session():
+                cached = Users.get(1004)
+                cached.action = ActionTypes.ENTER_TICKET_MEMBERS
+                cached.write()
+                _FailingObject().write()
+
+        self.assertEqual(Users.get(1004).action, ActionTypes.IDLE)
+        self.assertEqual(Users.flush(), 0)
+        self.assertEqual(_stored_action(1004), ActionTypes.IDLE)
+
+
+class UsersQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        clear_tables()
+
+    def test_flush_writes_values_of_queued_write(self):
+        user = User()
+        user.telegram_id = 1005
+        user.write()
+
+        user.action = ActionTypes.ENTER_EVENT_DESCRIPTION
+        user.write()
+        # Changed after queueing, but not written
+        user.action = ActionTypes.ENTER_TICKET_MEMBERS
+
+        self.assertEqual(Users.flush(), 1)
+        self.assertEqual(_stored_action(1005), ActionTypes.ENTER_EVENT_DESCRIPTION)
+
+    def test_session_queues_action_after_commit(self):
+        user = User()
+        user.telegram_id = 1006
+        user.write()
+
+        with Session():
+            cached = Users.get(1006)
+            cached.action = ActionTypes.ENTER_TICKET_MEMBERS
+            cached.write()
+
+        self.assertEqual(Users.flush(), 1)
+        self.assertEqual(_stored_action(1006), ActionTypes.ENTER_TICKET_MEMBERS)
+
+
+if __name__ == "__main__":
+    unittest.main()